@@ -0,0 +1,129 @@
+import os
+import json
+import asyncio
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from core.concurrency import RateLimiter, run_in_pool
+from core.settings import load_env
+from TTS_gen.tts_generator import BUCKET_NAME, VOICE_NAME, get_or_create_tts, get_tts_key, tts_cache
+
+PHRASE_PACK_DIRECTORY = "TTS_gen/phrase_packs"
+DEFAULT_MANIFEST_PATH = "TTS_gen/tts_manifest.json"
+# 일괄 생성 기본값: 동시 작업 수, 초당 음성 합성 요청 수 (Cloud TTS 할당량에 맞춰 조정)
+DEFAULT_BATCH_WORKERS = 8
+DEFAULT_SYNTHESIS_RATE = 5.0
+# API 일괄 생성 요청 하나에 넣을 수 있는 최대 문구 수
+TTS_BATCH_MAX_TEXTS = 100
+
+
+# 상황별 문구 묶음 파일: {"scenario": "hospital", "phrases": ["진료 예약하고 싶어요.", ...]}
+def load_phrase_pack(path: str) -> dict:
+    with open(path, "r", encoding="utf-8") as f:
+        pack = json.load(f)
+    pack.setdefault("scenario", os.path.splitext(os.path.basename(path))[0])
+    return pack
+
+# 프로세스 전체가 공유하는 음성 합성 속도 제한 (초당 TTS_SYNTHESIS_RATE회) - 동시에 들어온 일괄 요청들이 할당량을 나눠 씀
+@lru_cache(maxsize=1)
+def get_synthesis_rate_limiter() -> RateLimiter:
+    return RateLimiter(float(os.getenv("TTS_SYNTHESIS_RATE", DEFAULT_SYNTHESIS_RATE)))
+
+# 여러 문구를 동시에 합성/업로드하고 {텍스트: URL} 반환 (실패한 문구는 None)
+# 이미 캐시나 버킷에 있는 문구는 합성하지 않으며, 합성 요청은 rate_limiter(기본: 공유 속도 제한)로 속도를 제한
+def generate_phrase_pack(texts: list, bucket_name: str = BUCKET_NAME, max_workers: int = DEFAULT_BATCH_WORKERS,
+                         rate_limiter: RateLimiter | None = None) -> dict:
+    texts = list(dict.fromkeys(texts))  # 순서를 유지하며 중복 제거
+    rate_limiter = rate_limiter or get_synthesis_rate_limiter()
+    print(f"TTS 일괄 생성: 문구 {len(texts)}개 (동시 {max_workers}개, 초당 합성 {rate_limiter.rate}회)")
+    with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="tts-batch") as pool:
+        urls = pool.map(lambda text: get_or_create_tts(text, bucket_name, rate_limiter), texts)
+        return dict(zip(texts, urls))
+
+# API 서버용 일괄 생성 - 요청마다 스레드 풀을 만들지 않고 문구별 작업을 일괄 생성 전용 스레드 풀(tts_batch)에서 실행
+# 합성 속도 제한을 기다리는 동안에도 단건 TTS 요청(/tts/generate, /tts/stream, /tts/audio)이 쓰는 tts 풀은 비어 있음
+async def agenerate_phrase_pack(texts: list, bucket_name: str = BUCKET_NAME) -> dict:
+    texts = list(dict.fromkeys(texts))
+    rate_limiter = get_synthesis_rate_limiter()
+    urls = await asyncio.gather(*(run_in_pool("tts_batch", get_or_create_tts, text, bucket_name, rate_limiter) for text in texts))
+    return dict(zip(texts, urls))
+
+
+# 매니페스트: 텍스트 -> {key, url}. key는 목소리/오디오 설정까지 포함한 캐시 키라서
+# 목소리 설정이 바뀌면 예전 항목은 불러올 때 자동으로 무시됨
+def load_manifest(path: str = DEFAULT_MANIFEST_PATH) -> dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("entries", {})
+
+def save_manifest(entries: dict, path: str = DEFAULT_MANIFEST_PATH):
+    data = {"voice": VOICE_NAME, "entries": dict(sorted(entries.items()))}
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+# 생성 결과를 기존 매니페스트에 합쳐 저장
+def update_manifest(urls: dict, scenario: str | None = None, path: str = DEFAULT_MANIFEST_PATH) -> dict:
+    entries = load_manifest(path)
+    for text, url in urls.items():
+        if url:
+            entries[text] = {"key": get_tts_key(text), "url": url, "scenario": scenario or entries.get(text, {}).get("scenario")}
+    save_manifest(entries, path)
+    return entries
+
+# 서버 시작 시 매니페스트의 URL을 메모리 캐시에 등록 - 미리 만든 문구는 네트워크 호출 없이 바로 응답
+def preload_manifest(path: str | None = None) -> int:
+    path = path or os.getenv("TTS_MANIFEST_PATH", DEFAULT_MANIFEST_PATH)
+    try:
+        entries = load_manifest(path)
+    except (OSError, json.JSONDecodeError) as e:
+        print(f"TTS 매니페스트를 읽지 못했습니다: {e}")
+        return 0
+    loaded = 0
+    for text, entry in entries.items():
+        key = get_tts_key(text)
+        if entry.get("key") != key or not entry.get("url"):
+            continue
+        tts_cache.remember_url(key, entry["url"])
+        loaded += 1
+    if entries:
+        print(f"TTS 매니페스트 로드 완료! ({loaded}/{len(entries)}개 문구)")
+    return loaded
+
+
+# 실행: python -m TTS_gen.tts_batch TTS_gen/phrase_packs/hospital.json TTS_gen/phrase_packs/school.json
+def main():
+    parser = argparse.ArgumentParser(description="상황별 TTS 문구 묶음을 미리 생성하고 매니페스트를 만듭니다.")
+    parser.add_argument("packs", nargs="*", help=f"문구 묶음 JSON 파일 (기본: {PHRASE_PACK_DIRECTORY}의 모든 파일)")
+    parser.add_argument("--manifest", default=DEFAULT_MANIFEST_PATH, help="저장할 매니페스트 경로")
+    parser.add_argument("--workers", type=int, default=DEFAULT_BATCH_WORKERS, help="동시 작업 수")
+    parser.add_argument("--rate", type=float, default=DEFAULT_SYNTHESIS_RATE, help="초당 음성 합성 요청 수")
+    parser.add_argument("--bucket", default=BUCKET_NAME)
+    args = parser.parse_args()
+    load_env()
+
+    pack_paths = args.packs or sorted(
+        os.path.join(PHRASE_PACK_DIRECTORY, name) for name in os.listdir(PHRASE_PACK_DIRECTORY) if name.endswith(".json")
+    )
+    rate_limiter = RateLimiter(args.rate)
+    failed = []
+    for pack_path in pack_paths:
+        pack = load_phrase_pack(pack_path)
+        print("=" * 30)
+        print(f"[{pack['scenario']}] {pack_path}")
+        urls = generate_phrase_pack(pack["phrases"], args.bucket, args.workers, rate_limiter)
+        update_manifest(urls, pack["scenario"], args.manifest)
+        failed.extend(text for text, url in urls.items() if not url)
+
+    print("=" * 30)
+    print(f"매니페스트 저장 완료: {args.manifest}")
+    if failed:
+        print(f"생성에 실패한 문구 {len(failed)}개 (다시 실행하면 실패한 문구만 생성합니다):")
+        for text in failed:
+            print(f"  - {text}")
+
+if __name__ == "__main__":
+    main()
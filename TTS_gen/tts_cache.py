@@ -0,0 +1,148 @@
+import os
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+
+DEFAULT_CACHE_DIR = "TTS_gen/tts_audio_cache"
+DEFAULT_MAX_BYTES = 200 * 1024 * 1024
+DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+
+# 텍스트 + 목소리 + 오디오 설정으로 만든 안정적인 콘텐츠 주소 키
+# (파이썬 hash()는 프로세스마다 값이 달라 재시작/다른 워커에서 같은 텍스트를 다시 합성하게 됨)
+def make_tts_key(text: str, voice: dict, audio_config: dict) -> str:
+    payload = json.dumps(
+        {"text": text, "voice": voice, "audio": audio_config},
+        ensure_ascii=False,
+        sort_keys=True,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# 콘텐츠 주소 기반 TTS 오디오 캐시
+# - 메모리 인덱스: 업로드가 끝난 키 -> 공개 URL (네트워크 확인 없이 바로 응답)
+# - 디스크 저장소: 업로드까지 끝난 오디오만 저장하므로, 파일이 있으면 버킷에도 있다고 봄. 용량 초과 시 오래 안 쓴 파일부터 삭제
+# - 같은 키에 대한 동시 요청은 한 번의 합성으로 묶음
+class TTSAudioCache:
+    def __init__(self, cache_dir: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_MAX_BYTES, extension: str = ".mp3"):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self._urls = {}
+        self._inflight = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    def filename(self, key: str) -> str:
+        return key + self.extension
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, self.filename(key))
+
+    def known_url(self, key: str) -> str | None:
+        with self._lock:
+            return self._urls.get(key)
+
+    def remember_url(self, key: str, url: str):
+        with self._lock:
+            self._urls[key] = url
+
+    def has_audio(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    # 디스크에서 오디오를 읽고, 최근 사용 시각을 갱신 (LRU)
+    def read_audio(self, key: str) -> bytes | None:
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                audio = f.read()
+            os.utime(path)
+            return audio
+        except OSError:
+            return None
+
+    def write_audio(self, key: str, audio: bytes):
+        path = self._path(key)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(audio)
+        os.replace(tmp_path, path)
+        self._evict()
+
+    # 저장소 용량이 max_bytes를 넘으면 가장 오래 사용하지 않은 파일부터 삭제
+    def _evict(self):
+        entries = []
+        total = 0
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith(self.extension):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+        entries.sort()
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+                total -= size
+            except OSError:
+                pass
+
+    # 같은 키로 동시에 들어온 요청은 첫 요청의 결과를 함께 기다림
+    def coalesce(self, key: str, producer):
+        with self._lock:
+            future = self._inflight.get(key)
+            owner = future is None
+            if owner:
+                future = Future()
+                self._inflight[key] = future
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = producer()
+            future.set_result(result)
+            return result
+        except Exception as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+
+
+# 최근 합성한 오디오를 메모리에 보관하는 LRU 저장소 (용량 기준)
+# 아직 버킷 업로드가 끝나지 않은 오디오도 담을 수 있어, 스트리밍/로컬 URL 응답과 문장 단위 재사용에 씀
+class RecentAudioStore:
+    def __init__(self, max_bytes: int = DEFAULT_MEMORY_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._total = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            audio = self._entries.get(key)
+            if audio is not None:
+                self._entries.move_to_end(key)
+            return audio
+
+    def put(self, key: str, audio: bytes):
+        if len(audio) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total -= len(previous)
+            self._entries[key] = audio
+            self._total += len(audio)
+            while self._total > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._total -= len(evicted)
@@ -1,74 +1,251 @@
 import io
-from google.cloud import storage
-from google.cloud import texttospeech
+import os
+import re
+from functools import lru_cache
+
+from core.metrics import record_cache, stage_timer
+from core.registry import registry
+from core.settings import load_env
+from TTS_gen.tts_cache import RecentAudioStore, TTSAudioCache, make_tts_key
 
 BUCKET_NAME = 'dajeong-tts-audio'
 # KEY_PATH = './dj-tts-gcp-key.json'
 KEY_PATH = 'TTS_gen/dj-tts-gcp-key.json'
 
-storage_client = storage.Client.from_service_account_json(KEY_PATH)
-tts_client = texttospeech.TextToSpeechClient.from_service_account_json(KEY_PATH)
+LANGUAGE_CODE = "ko-KR"
+VOICE_NAME = "ko-KR-Standard-A"
+# "ko-KR-Wavenet-A" (표준 여성 WaveNet 목소리)
+AUDIO_ENCODING = "MP3"
 
-# Google Cloud TTS로 오디오를 생성하여 바로 GCP Cloud Storage에 업로드
-def create_and_upload_tts(text: str, filename: str, bucket_name: str = BUCKET_NAME) -> str | None:
-    try:
-        bucket = storage_client.bucket(bucket_name)
-        blob = bucket.blob(filename)
-        
-        if blob.exists():
-            print(f"중복 파일: GCP 버킷 '{bucket_name}'에 '{filename}'이(가) 이미 존재합니다.")
-            return blob.public_url
-
-        synthesis_input = texttospeech.SynthesisInput(text=text)
-
-        voice = texttospeech.VoiceSelectionParams(
-            language_code="ko-KR", 
-            name="ko-KR-Standard-A"
-            # "ko-KR-Wavenet-A" (표준 여성 WaveNet 목소리)
-        )
+# 긴 텍스트는 문장 단위로 나눠 합성 (첫 문장은 단독으로 합성해 첫 오디오를 빨리 보냄)
+# 조각 최대 길이는 TTS_CHUNK_MAX_CHARS 환경 변수로 조정
+DEFAULT_TTS_CHUNK_MAX_CHARS = 200
+SENTENCE_END_PATTERN = re.compile(r"(?<=[.!?。…])\s+|\n+")
 
-        # 오디오 파일 형식 - MP3
-        audio_config = texttospeech.AudioConfig(
-            audio_encoding=texttospeech.AudioEncoding.MP3
-        )
+# GCP 클라이언트는 import 시점이 아니라 처음 사용할 때(또는 서버 워밍업 때) 생성
+def _create_storage_client():
+    from google.cloud import storage
+    return storage.Client.from_service_account_json(KEY_PATH)
+
+def _create_tts_client():
+    from google.cloud import texttospeech
+    return texttospeech.TextToSpeechClient.from_service_account_json(KEY_PATH)
+
+registry.register("gcs_storage", _create_storage_client)
+registry.register("tts_client", _create_tts_client)
+
+tts_cache = TTSAudioCache()
+
+# 최근 합성한 오디오를 담는 메모리 캐시 - 크기(TTS_MEMORY_CACHE_BYTES)는 import 시점이 아니라 처음 사용할 때 읽음
+@lru_cache(maxsize=1)
+def get_audio_store() -> RecentAudioStore:
+    return RecentAudioStore(int(os.getenv("TTS_MEMORY_CACHE_BYTES", 32 * 1024 * 1024)))
+
+def _bucket(bucket_name: str):
+    return registry.get("gcs_storage").bucket(bucket_name)
+
+# Google Cloud TTS로 텍스트를 MP3 오디오 바이트로 변환
+def synthesize_speech(text: str) -> bytes:
+    from google.cloud import texttospeech
 
-        print("음성 변환 요청 중...")
-        response = tts_client.synthesize_speech(
+    synthesis_input = texttospeech.SynthesisInput(text=text)
+
+    voice = texttospeech.VoiceSelectionParams(
+        language_code=LANGUAGE_CODE,
+        name=VOICE_NAME
+    )
+
+    # 오디오 파일 형식 - MP3
+    audio_config = texttospeech.AudioConfig(
+        audio_encoding=texttospeech.AudioEncoding[AUDIO_ENCODING]
+    )
+
+    print("음성 변환 요청 중...")
+    client = registry.get("tts_client")
+    with stage_timer("tts_synthesis"):
+        response = client.synthesize_speech(
             input=synthesis_input, voice=voice, audio_config=audio_config
         )
+    return response.audio_content
+
+# 오디오 데이터를 GCP 버킷에 업로드하고 공개 URL을 반환
+def upload_audio(audio: bytes, filename: str, bucket_name: str = BUCKET_NAME) -> str:
+    blob = _bucket(bucket_name).blob(filename)
+    print(f"'{filename}'을(를) GCP 버킷 '{bucket_name}'에 업로드하는 중...")
+    with stage_timer("tts_upload"):
+        blob.upload_from_string(audio, content_type='audio/mpeg')
+    print(f"업로드 성공! 공개 URL: {blob.public_url}")
+    return blob.public_url
+
+def get_tts_key(text: str) -> str:
+    return make_tts_key(
+        text,
+        voice={"language_code": LANGUAGE_CODE, "name": VOICE_NAME},
+        audio_config={"audio_encoding": AUDIO_ENCODING},
+    )
 
-        print(f"'{filename}'을(를) GCP 버킷 '{bucket_name}'에 업로드하는 중...")
-        # 응답받은 오디오 데이터를 바로 업로드
-        blob.upload_from_string(response.audio_content, content_type='audio/mpeg')
-        
-        public_url = blob.public_url
-        print(f"업로드 성공! 공개 URL: {public_url}")
-        
-        return public_url
-        
+# 콘텐츠 주소 캐시를 거쳐 TTS URL을 반환 - 진짜 캐시 미스일 때만 GCP에 접근
+# rate_limiter를 넘기면 실제 음성 합성 요청 직전에 acquire (일괄 생성 시 TTS API 호출 속도 제한)
+def get_or_create_tts(text: str, bucket_name: str = BUCKET_NAME, rate_limiter=None) -> str | None:
+    key = get_tts_key(text)
+    filename = tts_cache.filename(key)
+
+    url = tts_cache.known_url(key)
+    if url:
+        record_cache("tts", "memory_hit")
+        return url
+
+    # 디스크 캐시에 있으면 업로드까지 끝난 오디오이므로 URL만 계산 (네트워크 호출 없음)
+    if tts_cache.has_audio(key):
+        try:
+            url = _bucket(bucket_name).blob(filename).public_url
+        except Exception as e:
+            print(f"오디오 URL 생성 중 오류가 발생했습니다: {e}")
+            return None
+        tts_cache.remember_url(key, url)
+        record_cache("tts", "disk_hit")
+        return url
+
+    def produce():
+        url = tts_cache.known_url(key)
+        if url:
+            return url
+        audio = None
+        try:
+            blob = _bucket(bucket_name).blob(filename)
+            # 재시작 등으로 로컬 캐시가 비어 있을 때만 버킷을 확인
+            if blob.exists():
+                url = blob.public_url
+                record_cache("tts", "bucket_hit")
+            else:
+                record_cache("tts", "miss")
+                if rate_limiter is not None:
+                    rate_limiter.acquire()
+                audio = synthesize_speech(text)
+                url = upload_audio(audio, filename, bucket_name)
+        except Exception as e:
+            print(f"오디오 생성 또는 업로드 중 오류가 발생했습니다: {e}")
+            return None
+        if audio is not None:
+            try:
+                tts_cache.write_audio(key, audio)
+            except OSError as e:
+                print(f"TTS 로컬 캐시 저장 실패: {e}")
+        tts_cache.remember_url(key, url)
+        return url
+
+    return tts_cache.coalesce(key, produce)
+
+
+# 한 문장이 너무 길면 공백 기준으로 max_chars 이하로 자름
+def _split_long_sentence(sentence: str, max_chars: int) -> list:
+    parts, current = [], ""
+    for word in sentence.split(" "):
+        if current and len(current) + 1 + len(word) > max_chars:
+            parts.append(current)
+            current = word
+        else:
+            current = f"{current} {word}" if current else word
+    if current:
+        parts.append(current)
+    return parts
+
+# 텍스트를 합성 단위로 나눔 - 첫 문장은 단독, 이후 문장은 max_chars 안에서 합쳐 요청 수를 줄임
+def split_tts_chunks(text: str, max_chars: int | None = None) -> list:
+    if max_chars is None:
+        max_chars = int(os.getenv("TTS_CHUNK_MAX_CHARS", DEFAULT_TTS_CHUNK_MAX_CHARS))
+    sentences = []
+    for sentence in SENTENCE_END_PATTERN.split(text.strip()):
+        sentence = sentence.strip()
+        if sentence:
+            sentences.extend(_split_long_sentence(sentence, max_chars) if len(sentence) > max_chars else [sentence])
+    if len(sentences) <= 1:
+        return sentences
+
+    chunks = [sentences[0]]
+    current = ""
+    for sentence in sentences[1:]:
+        if current and len(current) + 1 + len(sentence) > max_chars:
+            chunks.append(current)
+            current = sentence
+        else:
+            current = f"{current} {sentence}" if current else sentence
+    if current:
+        chunks.append(current)
+    return chunks
+
+# 메모리 또는 디스크 캐시에 있는 오디오 (없으면 None)
+def get_cached_audio(key: str) -> bytes | None:
+    audio = get_audio_store().get(key)
+    if audio is None:
+        audio = tts_cache.read_audio(key)
+        if audio is not None:
+            get_audio_store().put(key, audio)
+    return audio
+
+# 텍스트 한 조각의 오디오를 반환 - 캐시에 없을 때만 합성하고, 같은 조각에 대한 동시 요청은 한 번만 합성
+def get_or_synthesize_audio(text: str) -> bytes:
+    key = get_tts_key(text)
+    audio = get_cached_audio(key)
+    if audio is not None:
+        record_cache("tts_audio", "hit")
+        return audio
+
+    def produce():
+        audio = get_audio_store().get(key)
+        if audio is None:
+            record_cache("tts_audio", "miss")
+            audio = synthesize_speech(text)
+            get_audio_store().put(key, audio)
+        return audio
+
+    # URL 생성과 같은 키를 쓰지 않도록 오디오 합성은 별도 이름으로 묶음
+    return tts_cache.coalesce("audio:" + key, produce)
+
+# 전체 텍스트의 오디오 - 문장 조각별로 합성(캐시 재사용)한 MP3를 이어 붙임
+def synthesize_text_audio(text: str) -> bytes:
+    key = get_tts_key(text)
+    audio = get_cached_audio(key)
+    if audio is None:
+        audio = b"".join(get_or_synthesize_audio(chunk) for chunk in split_tts_chunks(text))
+        get_audio_store().put(key, audio)
+    return audio
+
+# 이미 합성한 오디오를 버킷에 올리고 디스크 캐시와 URL 인덱스에 등록 (응답을 보낸 뒤 백그라운드에서 실행)
+def store_synthesized_audio(text: str, audio: bytes, bucket_name: str = BUCKET_NAME) -> str | None:
+    key = get_tts_key(text)
+    get_audio_store().put(key, audio)
+    url = tts_cache.known_url(key)
+    if url:
+        return url
+    filename = tts_cache.filename(key)
+    try:
+        if tts_cache.has_audio(key):
+            url = _bucket(bucket_name).blob(filename).public_url
+        else:
+            url = upload_audio(audio, filename, bucket_name)
     except Exception as e:
-        print(f"오디오 생성 또는 업로드 중 오류가 발생했습니다: {e}")
+        print(f"오디오 업로드 중 오류가 발생했습니다: {e}")
         return None
+    if not tts_cache.has_audio(key):
+        try:
+            tts_cache.write_audio(key, audio)
+        except OSError as e:
+            print(f"TTS 로컬 캐시 저장 실패: {e}")
+    tts_cache.remember_url(key, url)
+    return url
+
 
-        
 if __name__ == "__main__":
-    samples = [
-        ("진료 예약하고 싶어요.", "appointment_request.mp3"),
-        ("처음 왔어요.", "first_visit.mp3"),
-        # ("신분증 가져왔어요.", "id_card.mp3"),
-        # ("오늘 예약 취소했어요.", "cancel_appointment.mp3"),
-        # ("오늘 오전 예약 했어요.", "morning_appointment.mp3"),
-        # ("오늘 오후 예약 했어요.", "afternoon_appointment.mp3"),
-        # ("오늘 예약 변경했어요.", "change_appointment.mp3"),
-        # ("오늘 예약 취소했어요.", "cancel_appointment.mp3"),
-        # ("얼마나 걸려요?", "how_long.mp3"),
-    ]
-
-    for text, filename in samples:
+    from TTS_gen.tts_batch import generate_phrase_pack
+
+    load_env()
+
+    samples = ["진료 예약하고 싶어요.", "처음 왔어요."]
+    for text, url in generate_phrase_pack(samples).items():
         print("=" * 30)
         print(f"변환할 텍스트: '{text}'")
-        url = create_and_upload_tts(text=text, filename=filename, bucket_name=BUCKET_NAME)
         if url:
             print(f"-> 최종 결과물(URL): {url}")
         else:
-            print("-> 생성 또는 업로드에 실패했거나, 파일이 이미 존재합니다.")
\ No newline at end of file
+            print("-> 생성 또는 업로드에 실패했습니다.")
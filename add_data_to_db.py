@@ -1,28 +1,81 @@
 import os
 import shutil
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
-from langchain_community.vectorstores import Chroma
+import argparse
+import json
+import hashlib
 from langchain_text_splitters import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from dotenv import load_dotenv
 
-from load_data_to_db import load_and_process_json
+from core.embeddings import get_embeddings
+from core.llm import create_chat_model
+from core.settings import load_env
+from load_data_to_db import embed_batch_size, load_and_process_json, normalize_source
+from policy_recommend.hybrid_retriever import load_or_build_bm25_index
+from policy_recommend.partitioned_store import PartitionedPolicyStore, compact_policy_store, open_policy_store_for_ingest
+from policy_recommend.retriever import notify_index_updated
+
+# 정책 단위 키 (출처 파일 + 제목 + 날짜)
+def make_policy_key(metadata: dict) -> str:
+    key = "\x1f".join([metadata.get('source', ''), metadata.get('title', ''), metadata.get('date', '')])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:16]
+
+# 안정적인 조각 ID = 정책 키 + 조각 내용과 메타데이터 해시. 같은 내용이면 실행할 때마다 같은 ID가 나옴
+# 지역 등 메타데이터만 바뀌어도 ID가 달라져 예전 조각이 새 메타데이터의 조각으로 교체됨
+def make_chunk_id(chunk) -> str:
+    payload = chunk.page_content + "\x1f" + json.dumps(chunk.metadata, ensure_ascii=False, sort_keys=True)
+    content_hash = hashlib.sha256(payload.encode('utf-8')).hexdigest()[:16]
+    return f"{make_policy_key(chunk.metadata)}-{content_hash}"
+
+# 새 조각들과 DB에 있는 같은 출처의 조각들을 비교해 필요한 것만 반영 (여러 번 실행해도 결과가 같음)
+# - 이미 있는 조각: 건너뜀 (다시 임베딩하지 않음)
+# - 내용이 바뀐 정책의 조각: 새로 임베딩하고 예전 조각은 삭제
+# - 새 정책의 조각: 추가
+# - 크롤링 결과에서 사라진 정책의 조각: 삭제
+def sync_documents(db, split_docs: list, source: str, batch_size: int | None = None) -> dict:
+    batch_size = batch_size or embed_batch_size()
+    existing_ids = set(db.get(where={"source": source}, include=[])["ids"])
+    existing_policy_keys = {chunk_id.split("-", 1)[0] for chunk_id in existing_ids}
+
+    new_chunks = {}
+    for chunk in split_docs:
+        new_chunks.setdefault(make_chunk_id(chunk), chunk)  # 같은 정책 안의 중복 조각 제거
+
+    to_add_ids = [chunk_id for chunk_id in new_chunks if chunk_id not in existing_ids]
+    to_delete_ids = [chunk_id for chunk_id in existing_ids if chunk_id not in new_chunks]
+
+    stats = {"added": 0, "updated": 0, "deleted": len(to_delete_ids), "skipped": len(new_chunks) - len(to_add_ids)}
+    for chunk_id in to_add_ids:
+        if chunk_id.split("-", 1)[0] in existing_policy_keys:
+            stats["updated"] += 1
+        else:
+            stats["added"] += 1
+
+    for start in range(0, len(to_add_ids), batch_size):
+        batch_ids = to_add_ids[start:start + batch_size]
+        db.add_documents([new_chunks[chunk_id] for chunk_id in batch_ids], ids=batch_ids)
+        print(f"  임베딩 배치 저장: {min(start + batch_size, len(to_add_ids))}/{len(to_add_ids)}")
+
+    if to_delete_ids:
+        db.delete(ids=to_delete_ids)
+
+    return stats
 
 # 이미 존재하는 ChromaDB에 새로운 JSON 파일의 내용을 추가하는 메인 함수
 def main():
-    load_dotenv()
-    API_KEY = os.getenv("API_KEY")
-    MODEL_ID = os.getenv("MODEL_ID")
-    API_BASE = os.getenv("API_BASE")
-    if not API_KEY or not MODEL_ID or not API_BASE:
-        print("오류: .env 파일에 API_KEY, MODEL_ID, API_BASE를 설정해야 합니다.")
+    parser = argparse.ArgumentParser(description="크롤링한 정책 JSON을 기존 ChromaDB에 반영합니다.")
+    parser.add_argument("json_file", nargs="?", default="crawling/타기관_notices_2025.json", help="추가할 JSON 파일 경로")
+    parser.add_argument("--append", action="store_true", help="동기화 없이 모든 조각을 그대로 추가 (예전 방식, 중복이 생길 수 있음)")
+    args = parser.parse_args()
+    load_env()
+
+    # 지역 정보 추출에 사용할 LLM (공유 LLM 게이트웨이: 타임아웃, 재시도, 서킷 브레이커 적용)
+    try:
+        extraction_llm = create_chat_model("ingest", temperature=0)
+    except RuntimeError as e:
+        print(e)
         return
 
-    # 지역 정보 추출에 사용할 LLM
-    extraction_llm = ChatOpenAI(model_name=MODEL_ID, openai_api_key=API_KEY, openai_api_base=API_BASE, temperature=0)
-    
     # 추가할 새로운 JSON 파일 경로
-    NEW_JSON_FILE_PATH = "crawling/타기관_notices_2025.json"
+    NEW_JSON_FILE_PATH = args.json_file
     if not os.path.exists(NEW_JSON_FILE_PATH):
         print(f"오류: 추가할 파일 '{NEW_JSON_FILE_PATH}'을 찾을 수 없습니다.")
         return
@@ -32,26 +85,38 @@ def main():
         print(f"오류: 기존 데이터베이스 폴더 '{DB_DIRECTORY}'를 찾을 수 없습니다.")
         print("load_data_to_db.py를 먼저 실행하여 데이터베이스를 생성해주세요.")
         return
-    
-    embeddings = SentenceTransformerEmbeddings(model_name="jhgan/ko-sbert-nli")
+
+    embeddings = get_embeddings()
 
     print(f"1. 새로운 데이터 로드 및 전처리 시작: {NEW_JSON_FILE_PATH}")
     new_documents = load_and_process_json(NEW_JSON_FILE_PATH, extraction_llm)
-    
+
     text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
     new_split_docs = text_splitter.split_documents(new_documents)
     print(f"2. 텍스트 분할 완료! (총 {len(new_split_docs)}개의 새 조각)")
 
-    print("\n3. 기존 ChromaDB 로드 및 새로운 데이터 추가 시작...")
-    
-    db = Chroma(
-        persist_directory=DB_DIRECTORY, 
-        embedding_function=embeddings
-    )
-    
-    db.add_documents(new_split_docs)
-    
-    print(f"4. 데이터 추가 완료! ({DB_DIRECTORY}가 업데이트되었습니다.)")
+    print("\n3. 기존 ChromaDB 로드 및 새로운 데이터 반영 시작...")
+
+    # 게시판 x 분기별 컬렉션(파티션)에 반영 (POLICY_PARTITIONED=0 이면 단일 컬렉션)
+    db = open_policy_store_for_ingest(DB_DIRECTORY, embeddings)
+    if isinstance(db, PartitionedPolicyStore):
+        new_split_docs = db.without_expired(new_split_docs)
+
+    if args.append:
+        db.add_documents(new_split_docs)
+        print(f"4. 데이터 추가 완료! ({DB_DIRECTORY}가 업데이트되었습니다.)")
+        return
+
+    stats = sync_documents(db, new_split_docs, source=normalize_source(NEW_JSON_FILE_PATH))
+    print(f"4. 데이터 동기화 완료! ({DB_DIRECTORY}가 업데이트되었습니다.)")
+    print(f"   추가 {stats['added']}개, 변경 {stats['updated']}개, 삭제 {stats['deleted']}개, 변경 없음 {stats['skipped']}개")
+
+    # 보존 기간(POLICY_RETENTION_QUARTERS)이 지난 분기 파티션 삭제
+    compact_policy_store(db)
+
+    # 하이브리드 검색용 BM25 색인을 수집 시점에 미리 만들어 둠
+    load_or_build_bm25_index(db, DB_DIRECTORY)
+    notify_index_updated(DB_DIRECTORY)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,218 @@
+import json
+import time
+import asyncio
+import hashlib
+import random
+import threading
+from types import SimpleNamespace
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+from core.registry import registry
+
+STUB_DIARY_RESULT = {
+    "incorrect_words": ["싸워따", "똑빠로"],
+    "corrected_words": ["싸웠다", "똑바로"],
+    "full_corrected_text": "오늘 아이가 학교에서 친구랑 싸웠다. 내가 한국말이 서툴러서 선생님한테 똑바로 설명도 못 해 줬다. 정말 답답했다.",
+    "reply": "많이 속상하셨겠어요. 아이를 위해 애쓰는 마음이 충분히 전해져요. 오늘도 정말 수고 많으셨어요.",
+}
+STUB_POLICY_ANSWER = (
+    "1. [다문화가족 방문교육 서비스]\n\n"
+    "Summary(In Korean): 한국어 교육과 자녀 양육 지원을 집으로 찾아가 제공하는 서비스입니다.\n"
+    "Keywords(In Korean): 한국어 교육, 자녀 양육\n"
+)
+STUB_REGIONS = ["전국", "서울특별시", "경기도", "부산광역시", "전라남도"]
+
+
+# 한국어 기준 대략 2글자당 1토큰으로 나눔 (스트리밍 청크 단위이자 사용량 계산 기준)
+def _split_tokens(text: str) -> list:
+    return [text[i:i + 2] for i in range(0, len(text), 2)]
+
+def _prompt_text(messages: list) -> str:
+    parts = []
+    for message in messages:
+        content = message.get("content", "")
+        if isinstance(content, list):
+            content = " ".join(part.get("text", "") for part in content if isinstance(part, dict))
+        parts.append(content)
+    return "\n".join(parts)
+
+# 문장별 교정 프롬프트("1. 문장" 형식의 줄)에 STUB_DIARY_RESULT의 단어 교정만 적용해 응답
+def _stub_sentence_corrections(prompt: str) -> dict:
+    fixes = dict(zip(STUB_DIARY_RESULT["incorrect_words"], STUB_DIARY_RESULT["corrected_words"]))
+    items = []
+    for line in prompt.split("[Sentences]", 1)[1].splitlines():
+        number, _, sentence = line.strip().partition(". ")
+        if not number.isdigit():
+            continue
+        found = [wrong for wrong in fixes if wrong in sentence]
+        for wrong in found:
+            sentence = sentence.replace(wrong, fixes[wrong])
+        items.append({
+            "id": int(number),
+            "corrected": sentence,
+            "incorrect_words": found,
+            "corrected_words": [fixes[wrong] for wrong in found],
+        })
+    return {"sentences": items}
+
+# 프롬프트 내용으로 어떤 기능의 호출인지 판단해 그럴듯한 응답을 만듦
+def _stub_completion(prompt: str) -> str:
+    if "[Sentences]" in prompt:
+        return json.dumps(_stub_sentence_corrections(prompt), ensure_ascii=False)
+    if "[Diary]" in prompt:
+        return STUB_DIARY_RESULT["reply"]
+    if "Original Diary" in prompt:
+        return json.dumps(STUB_DIARY_RESULT, ensure_ascii=False)
+    if "policy recommendation" in prompt:
+        return STUB_POLICY_ANSWER
+    if "지역:" in prompt:
+        return random.choice(STUB_REGIONS)
+    return "확인했습니다."
+
+
+# 지연 시간과 토큰 생성 속도를 조절할 수 있는 OpenAI 호환 /v1/chat/completions 스텁
+# latency_ms: 첫 토큰까지의 시간, tokens_per_second: 이후 토큰 생성 속도 (0이면 지연 없음)
+def create_stub_llm_app(latency_ms: float = 300, tokens_per_second: float = 50) -> FastAPI:
+    app = FastAPI()
+    app.state.requests = 0
+
+    async def chat_completions(request: Request):
+        body = await request.json()
+        app.state.requests += 1
+        prompt = _prompt_text(body.get("messages", []))
+        tokens = _split_tokens(_stub_completion(prompt))
+        usage = {
+            "prompt_tokens": len(_split_tokens(prompt)),
+            "completion_tokens": len(tokens),
+            "total_tokens": len(_split_tokens(prompt)) + len(tokens),
+        }
+        token_delay = 1 / tokens_per_second if tokens_per_second > 0 else 0
+        base = {"id": f"chatcmpl-stub-{app.state.requests}", "created": int(time.time()), "model": body.get("model", "stub")}
+
+        if not body.get("stream"):
+            await asyncio.sleep(latency_ms / 1000 + token_delay * len(tokens))
+            return JSONResponse({
+                **base,
+                "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)}, "finish_reason": "stop"}],
+                "usage": usage,
+            })
+
+        async def event_stream():
+            await asyncio.sleep(latency_ms / 1000)
+            for token in tokens:
+                chunk = {**base, "object": "chat.completion.chunk",
+                         "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]}
+                yield f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n"
+                if token_delay:
+                    await asyncio.sleep(token_delay)
+            final = {**base, "object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            yield f"data: {json.dumps(final)}\n\n"
+            if (body.get("stream_options") or {}).get("include_usage"):
+                yield f"data: {json.dumps({**base, 'object': 'chat.completion.chunk', 'choices': [], 'usage': usage})}\n\n"
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+    app.add_api_route("/v1/chat/completions", chat_completions, methods=["POST"])
+    return app
+
+
+# uvicorn 서버를 백그라운드 스레드에서 실행 (스텁 LLM 서버와 벤치마크 대상 앱 모두 이 방식으로 띄움)
+class BackgroundServer:
+    def __init__(self, app, host: str = "127.0.0.1", port: int = 8765):
+        self.app = app
+        self.host = host
+        self.port = port
+        self._server = uvicorn.Server(uvicorn.Config(app, host=host, port=port, log_level="warning"))
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    def start(self, timeout: float = 30):
+        self._thread = threading.Thread(target=self._server.run, name=f"server-{self.port}", daemon=True)
+        self._thread.start()
+        deadline = time.monotonic() + timeout
+        while not self._server.started:
+            if time.monotonic() > deadline or not self._thread.is_alive():
+                raise RuntimeError(f"서버를 시작하지 못했습니다: {self.url}")
+            time.sleep(0.05)
+        return self
+
+    def stop(self):
+        self._server.should_exit = True
+        if self._thread is not None:
+            self._thread.join(timeout=10)
+
+
+# google.cloud.texttospeech.TextToSpeechClient 대신 쓰는 가짜 클라이언트 - 텍스트 길이에 비례한 가짜 MP3 바이트를 반환
+class FakeTextToSpeechClient:
+    def __init__(self, latency_ms: float = 100, bytes_per_char: int = 600):
+        self.latency_ms = latency_ms
+        self.bytes_per_char = bytes_per_char
+        self.calls = 0
+
+    def synthesize_speech(self, input, voice, audio_config):
+        self.calls += 1
+        time.sleep(self.latency_ms / 1000)
+        seed = hashlib.sha256(input.text.encode("utf-8")).digest()
+        size = max(len(input.text) * self.bytes_per_char, len(seed))
+        return SimpleNamespace(audio_content=b"ID3" + (seed * (size // len(seed) + 1))[:size])
+
+
+# google.cloud.storage 대신 쓰는 메모리 버킷 (업로드 지연만 흉내 냄)
+class InMemoryBlob:
+    def __init__(self, bucket, name: str):
+        self.bucket = bucket
+        self.name = name
+
+    @property
+    def public_url(self) -> str:
+        return f"https://storage.googleapis.com/{self.bucket.name}/{self.name}"
+
+    def exists(self) -> bool:
+        return self.name in self.bucket.objects
+
+    def upload_from_string(self, data: bytes, content_type: str | None = None):
+        time.sleep(self.bucket.client.upload_latency_ms / 1000)
+        with self.bucket.client.lock:
+            self.bucket.objects[self.name] = (bytes(data), content_type)
+
+
+class InMemoryBucket:
+    def __init__(self, client, name: str):
+        self.client = client
+        self.name = name
+        self.objects = {}
+
+    def blob(self, name: str) -> InMemoryBlob:
+        return InMemoryBlob(self, name)
+
+
+class InMemoryStorageClient:
+    def __init__(self, upload_latency_ms: float = 50):
+        self.upload_latency_ms = upload_latency_ms
+        self.lock = threading.Lock()
+        self._buckets = {}
+
+    def bucket(self, name: str) -> InMemoryBucket:
+        with self.lock:
+            return self._buckets.setdefault(name, InMemoryBucket(self, name))
+
+
+# 서비스 레지스트리의 GCP 클라이언트 팩토리를 가짜 구현으로 교체 (서비스가 생성되기 전에 호출해야 함)
+def install_fake_gcp(tts_latency_ms: float = 100, upload_latency_ms: float = 50) -> dict:
+    import TTS_gen.tts_generator  # noqa: F401 - 원래 팩토리가 먼저 등록되도록 import
+
+    fakes = {
+        "tts_client": FakeTextToSpeechClient(latency_ms=tts_latency_ms),
+        "gcs_storage": InMemoryStorageClient(upload_latency_ms=upload_latency_ms),
+    }
+    for name, fake in fakes.items():
+        registry.register(name, lambda fake=fake: fake)
+    return fakes
@@ -0,0 +1,97 @@
+import os
+import json
+import time
+import random
+import argparse
+import tempfile
+
+from benchmark.fake_backends import BackgroundServer, create_stub_llm_app
+from core.settings import load_env
+
+# 합성 정책 데이터에 쓰는 지역 표현 (None은 지역 언급 없음 -> 규칙이 확신하지 못해 LLM으로 넘어가는 문서)
+SYNTHETIC_REGION_MENTIONS = ["서울특별시", "경기도 수원시", "부산광역시", "전라남도", "제주특별자치도", None]
+SYNTHETIC_TOPICS = ["다문화가족 자녀 언어발달 지원", "결혼이민자 한국어 교육", "임신·출산 의료비 지원", "이중언어 가족환경 조성", "취업 역량 강화 프로그램"]
+
+
+# 크롤링 결과와 같은 형식의 가짜 정책 JSON 생성 (crawling/ 데이터가 없어도 측정할 수 있도록)
+def make_synthetic_policies(count: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    policies = []
+    for i in range(count):
+        topic = rng.choice(SYNTHETIC_TOPICS)
+        region = rng.choice(SYNTHETIC_REGION_MENTIONS)
+        region_text = f"{region} 거주 " if region else ""
+        paragraphs = "".join(
+            f"<p>{region_text}다문화가족을 대상으로 {topic} 사업을 운영합니다. 신청 기간과 방법은 공고문을 참고하세요. ({i}-{j})</p>"
+            for j in range(rng.randint(3, 12))
+        )
+        policies.append({
+            "title": f"[{region or '공지'}] 2025년 {topic} 안내 {i}",
+            "date": f"2025-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}",
+            "content_html": f"<div>{paragraphs}<p>문의: 02-000-0000</p></div>",
+            "attachments": [{"name": f"공고문_{i}.hwp", "url": f"https://example.com/files/{i}.hwp"}],
+        })
+    return policies
+
+def _timed_load(load_and_process_json, file_path: str, llm) -> tuple:
+    started_at = time.perf_counter()
+    documents = load_and_process_json(file_path, llm)
+    return documents, time.perf_counter() - started_at
+
+
+# load_and_process_json의 처리량(docs/sec)을 스텁 LLM으로 측정
+# 체크포인트와 지역 캐시는 임시 폴더를 사용하고, 같은 파일을 두 번 처리해 콜드/재실행 처리량을 각각 보고
+# 실행: python -m benchmark.ingest_benchmark --docs 1000  (또는 --input crawling/notices_2025.json)
+def main():
+    parser = argparse.ArgumentParser(description="외부 API 없이 정책 데이터 전처리(load_and_process_json) 처리량을 측정합니다.")
+    parser.add_argument("--input", help="측정할 정책 JSON 파일 (없으면 합성 데이터 사용)")
+    parser.add_argument("--docs", type=int, default=500, help="합성 정책 문서 수")
+    parser.add_argument("--llm-latency-ms", type=float, default=300)
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50)
+    parser.add_argument("--llm-port", type=int, default=8767)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    load_env()
+
+    from langchain_openai import ChatOpenAI
+    import load_data_to_db
+
+    work_dir = tempfile.mkdtemp(prefix="ingest_bench_")
+    # 실제 체크포인트/지역 캐시를 건드리지 않도록 임시 폴더로 교체
+    load_data_to_db.CHECKPOINT_DIRECTORY = os.path.join(work_dir, "checkpoints")
+    load_data_to_db.REGION_CACHE_PATH = os.path.join(work_dir, "checkpoints", "region_cache.jsonl")
+    os.makedirs(load_data_to_db.CHECKPOINT_DIRECTORY, exist_ok=True)
+
+    file_path = args.input
+    if file_path is None:
+        file_path = os.path.join(work_dir, "synthetic_notices.json")
+        with open(file_path, "w", encoding="utf-8") as f:
+            json.dump(make_synthetic_policies(args.docs, args.seed), f, ensure_ascii=False)
+
+    llm_server = BackgroundServer(
+        create_stub_llm_app(args.llm_latency_ms, args.llm_tokens_per_second), port=args.llm_port
+    ).start()
+    try:
+        llm = ChatOpenAI(model_name="stub-model", openai_api_key="benchmark", openai_api_base=f"{llm_server.url}/v1", temperature=0)
+
+        results = {}
+        for run in ("cold", "resume"):
+            print(f"\n=== {run} 실행 ===")
+            documents, elapsed = _timed_load(load_data_to_db.load_and_process_json, file_path, llm)
+            results[run] = {
+                "documents": len(documents),
+                "seconds": round(elapsed, 2),
+                "docs_per_sec": round(len(documents) / elapsed, 2) if elapsed else 0.0,
+            }
+        results["llm_requests"] = llm_server.app.state.requests
+    finally:
+        llm_server.stop()
+
+    print("\n전처리 처리량")
+    for run in ("cold", "resume"):
+        r = results[run]
+        print(f"  {run:<7} 문서 {r['documents']}개, {r['seconds']}초, {r['docs_per_sec']} docs/sec")
+    print(f"  스텁 LLM 호출 수: {results['llm_requests']}")
+
+if __name__ == "__main__":
+    main()
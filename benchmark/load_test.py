@@ -0,0 +1,226 @@
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import resource
+import tempfile
+from collections import defaultdict
+
+import httpx
+
+from benchmark.fake_backends import BackgroundServer, create_stub_llm_app, install_fake_gcp
+
+DEFAULT_MIX_PATH = os.path.join(os.path.dirname(__file__), "sample_mix.jsonl")
+
+ENDPOINTS = {
+    "diary": "/api/v1/diary/analyze",
+    "diary_batch": "/api/v1/diary/analyze/batch",
+    "diary_stream": "/api/v1/diary/analyze/stream",
+    "policy": "/api/v1/policy/recommend",
+    "tts": "/api/v1/tts/generate",
+}
+# "unique": true 인 요청은 이 필드에 요청 번호를 붙여 캐시를 우회함
+UNIQUE_FIELDS = ("diary_text", "text")
+
+
+# 요청 구성 파일 (JSONL): 한 줄에 {"endpoint": ..., "weight": ..., "body": {...}, "unique": false}
+def load_mix(path: str) -> list:
+    mix = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            entry = json.loads(line)
+            if entry["endpoint"] not in ENDPOINTS:
+                raise ValueError(f"알 수 없는 엔드포인트입니다: {entry['endpoint']}")
+            mix.append(entry)
+    return mix
+
+def _request_body(entry: dict, index: int) -> dict:
+    body = dict(entry["body"])
+    if entry.get("unique"):
+        for field in UNIQUE_FIELDS:
+            if field in body:
+                body[field] = f"{body[field]} ({index})"
+    return body
+
+def percentile(values: list, p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(int(round(p / 100 * len(ordered) + 0.5)) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+# 현재/최대 RSS (MB) - 벤치마크 드라이버와 서버가 같은 프로세스이므로 둘을 합친 값
+def memory_usage_mb() -> dict:
+    peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    current_mb = None
+    try:
+        with open("/proc/self/statm", "r") as f:
+            current_mb = int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except (OSError, ValueError):
+        pass
+    peak_mb = peak_kb / 1024 / 1024 if sys.platform == "darwin" else peak_kb / 1024
+    return {"rss_mb": round(current_mb, 1) if current_mb else None, "peak_rss_mb": round(peak_mb, 1)}
+
+
+async def _send(client: httpx.AsyncClient, endpoint: str, body: dict) -> tuple:
+    started_at = time.perf_counter()
+    if endpoint == "diary_stream":
+        first_byte = None
+        async with client.stream("POST", ENDPOINTS[endpoint], json=body) as response:
+            async for _ in response.aiter_bytes():
+                if first_byte is None:
+                    first_byte = time.perf_counter() - started_at
+        ok = response.status_code == 200
+        return ok, time.perf_counter() - started_at, first_byte
+
+    response = await client.post(ENDPOINTS[endpoint], json=body)
+    elapsed = time.perf_counter() - started_at
+    # 일기 분석 실패는 null, 정책 추천 실패는 "error" 키, TTS 실패는 status "error"로 응답함
+    data = response.json() if response.status_code == 200 else None
+    ok = isinstance(data, dict) and "error" not in data and data.get("status") != "error"
+    return ok, elapsed, elapsed
+
+async def run_load(base_url: str, mix: list, concurrency: int, total_requests: int, timeout: float, seed: int) -> dict:
+    rng = random.Random(seed)
+    weights = [entry.get("weight", 1) for entry in mix]
+    schedule = [(i, rng.choices(mix, weights=weights)[0]) for i in range(total_requests)]
+    queue = asyncio.Queue()
+    for item in schedule:
+        queue.put_nowait(item)
+
+    records = defaultdict(list)
+
+    async def worker(client):
+        while True:
+            try:
+                index, entry = queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            try:
+                ok, elapsed, first_byte = await _send(client, entry["endpoint"], _request_body(entry, index))
+            except httpx.HTTPError as e:
+                ok, elapsed, first_byte = False, timeout, None
+                print(f"요청 실패 ({entry['endpoint']}): {e!r}")
+            records[entry["endpoint"]].append((ok, elapsed, first_byte))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started_at = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        wall_seconds = time.perf_counter() - started_at
+
+    return {"wall_seconds": wall_seconds, "records": dict(records)}
+
+def summarize(result: dict) -> dict:
+    wall = result["wall_seconds"]
+    summary = {}
+    all_latencies = []
+    for endpoint, records in sorted(result["records"].items()):
+        latencies = [elapsed for ok, elapsed, _ in records if ok]
+        first_bytes = [first for ok, _, first in records if ok and first is not None]
+        all_latencies.extend(latencies)
+        summary[endpoint] = {
+            "requests": len(records),
+            "errors": sum(1 for ok, _, _ in records if not ok),
+            "rps": round(len(records) / wall, 2) if wall else 0.0,
+            "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+            "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+            "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+            "ttfb_p50_ms": round(percentile(first_bytes, 50) * 1000, 1),
+        }
+    total = sum(len(records) for records in result["records"].values())
+    summary["total"] = {
+        "requests": total,
+        "errors": sum(s["errors"] for s in summary.values()),
+        "rps": round(total / wall, 2) if wall else 0.0,
+        "p50_ms": round(percentile(all_latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(all_latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(all_latencies, 99) * 1000, 1),
+        "wall_seconds": round(wall, 2),
+    }
+    return summary
+
+def print_summary(summary: dict, memory: dict):
+    print(f"\n{'endpoint':<14}{'requests':>9}{'errors':>8}{'rps':>9}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for endpoint, s in summary.items():
+        print(f"{endpoint:<14}{s['requests']:>9}{s['errors']:>8}{s['rps']:>9}{s['p50_ms']:>10}{s['p95_ms']:>10}{s['p99_ms']:>10}")
+    print(f"\n메모리: 현재 RSS {memory['rss_mb']} MB, 최대 RSS {memory['peak_rss_mb']} MB")
+
+async def wait_until_ready(base_url: str, timeout: float):
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=10) as client:
+        while time.monotonic() < deadline:
+            response = await client.get("/api/v1/health/ready")
+            if response.status_code == 200:
+                print(f"서비스 준비 상태: {json.dumps(response.json()['services'], ensure_ascii=False)}")
+                return
+            await asyncio.sleep(1)
+    raise RuntimeError(f"{timeout}초 안에 서비스가 준비되지 않았습니다.")
+
+
+# 실제 API 대신 스텁 LLM 서버, 가짜 TTS 클라이언트, 메모리 GCS 버킷으로 FastAPI 앱을 띄우고 부하를 걸어 측정
+# 임베딩 모델과 ChromaDB는 실제 것을 사용하므로 정책 추천은 로컬 검색 비용까지 포함해 측정됨
+# 실행: python -m benchmark.load_test --concurrency 32 --requests 500
+def main():
+    parser = argparse.ArgumentParser(description="외부 API 없이 다정 API 서버의 처리량과 지연 시간을 측정합니다.")
+    parser.add_argument("--mix", default=DEFAULT_MIX_PATH, help="요청 구성 JSONL 파일")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--requests", type=int, default=200, help="보낼 전체 요청 수")
+    parser.add_argument("--llm-latency-ms", type=float, default=300, help="스텁 LLM의 첫 토큰까지 지연 시간")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=50, help="스텁 LLM의 토큰 생성 속도 (0이면 지연 없음)")
+    parser.add_argument("--tts-latency-ms", type=float, default=100)
+    parser.add_argument("--upload-latency-ms", type=float, default=50)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--llm-port", type=int, default=8766)
+    parser.add_argument("--ready-timeout", type=float, default=300, help="임베딩 모델 로드 등 서비스 준비를 기다리는 최대 시간")
+    parser.add_argument("--timeout", type=float, default=120, help="요청별 타임아웃")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="결과를 JSON 파일로 저장")
+    args = parser.parse_args()
+
+    mix = load_mix(args.mix)
+
+    llm_server = BackgroundServer(
+        create_stub_llm_app(args.llm_latency_ms, args.llm_tokens_per_second), port=args.llm_port
+    ).start()
+    # .env보다 먼저 설정되므로 실제 API 대신 스텁 서버를 사용 (load_dotenv는 기존 환경 변수를 덮어쓰지 않음)
+    os.environ["API_KEY"] = "benchmark"
+    os.environ["MODEL_ID"] = "stub-model"
+    os.environ["API_BASE"] = f"{llm_server.url}/v1"
+    # 일기 문장 교정 캐시도 임시 파일을 사용 (실행할 때마다 같은 조건에서 시작)
+    os.environ["DIARY_CORRECTION_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(prefix="diary_bench_cache_"), "correction_cache.jsonl")
+
+    import TTS_gen.tts_generator as tts_generator
+    from TTS_gen.tts_cache import TTSAudioCache
+
+    # 로컬 TTS 디스크 캐시는 임시 폴더를 사용해 실제 캐시를 건드리지 않음
+    # main과 tts_batch는 tts_cache를 이름으로 import하므로, 두 모듈을 불러오기 전에 교체해야 같은 캐시를 사용함
+    cache_dir = tempfile.mkdtemp(prefix="tts_bench_cache_")
+    tts_generator.tts_cache = TTSAudioCache(cache_dir=cache_dir)
+
+    import main as app_module
+
+    install_fake_gcp(args.tts_latency_ms, args.upload_latency_ms)
+
+    app_server = BackgroundServer(app_module.app, port=args.port).start()
+    try:
+        asyncio.run(wait_until_ready(app_server.url, args.ready_timeout))
+        print(f"부하 테스트 시작: 요청 {args.requests}개, 동시 {args.concurrency}개")
+        result = asyncio.run(run_load(app_server.url, mix, args.concurrency, args.requests, args.timeout, args.seed))
+        summary = summarize(result)
+        memory = memory_usage_mb()
+        print_summary(summary, memory)
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump({"args": vars(args), "summary": summary, "memory": memory}, f, ensure_ascii=False, indent=2)
+    finally:
+        app_server.stop()
+        llm_server.stop()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+import os
+import time
+import asyncio
+import threading
+from contextlib import asynccontextmanager
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+
+# 엔드포인트별 기본 동시 처리 한도 - 환경 변수(<NAME>_MAX_CONCURRENCY)로 덮어쓸 수 있음
+DEFAULT_ENDPOINT_LIMITS = {
+    "diary": 32,
+    "policy": 16,
+    "tts": 16,
+}
+
+# 작업 종류별 전용 스레드 풀 크기 - 환경 변수(<NAME>_WORKERS)로 덮어쓸 수 있음
+# embedding: CPU를 쓰는 임베딩 추론/벡터 검색, tts: 블로킹 GCP 클라이언트 호출, diary: 일기 교정 캐시 파일 읽기/쓰기
+# tts_batch: 문구 일괄 생성 - 속도 제한(RateLimiter) 대기로 스레드를 오래 붙잡으므로 단건 TTS 요청과 풀을 나눔
+DEFAULT_POOL_SIZES = {
+    "embedding": 2,
+    "tts": 8,
+    "tts_batch": 4,
+    "diary": 4,
+}
+
+_semaphores = {}
+_pools = {}
+_lock = threading.Lock()
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return max(1, int(os.getenv(name, default)))
+    except ValueError:
+        return default
+
+def get_endpoint_limit(name: str) -> int:
+    return _env_int(f"{name.upper()}_MAX_CONCURRENCY", DEFAULT_ENDPOINT_LIMITS.get(name, 16))
+
+def _get_semaphore(name: str) -> asyncio.Semaphore:
+    with _lock:
+        if name not in _semaphores:
+            _semaphores[name] = asyncio.Semaphore(get_endpoint_limit(name))
+        return _semaphores[name]
+
+# 엔드포인트 하나가 느려져도 다른 엔드포인트를 굶기지 않도록 엔드포인트별로 동시 처리 수를 제한
+@asynccontextmanager
+async def endpoint_limit(name: str):
+    async with _get_semaphore(name):
+        yield
+
+def get_pool(name: str) -> ThreadPoolExecutor:
+    with _lock:
+        if name not in _pools:
+            size = _env_int(f"{name.upper()}_WORKERS", DEFAULT_POOL_SIZES.get(name, 4))
+            _pools[name] = ThreadPoolExecutor(max_workers=size, thread_name_prefix=f"{name}-pool")
+        return _pools[name]
+
+# 블로킹 함수를 지정한 전용 스레드 풀에서 실행하고 결과를 await
+async def run_in_pool(name: str, func, *args, **kwargs):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_pool(name), partial(func, *args, **kwargs))
+
+# 초당 호출 수를 제한하는 토큰 버킷 (여러 스레드에서 공유, 한도를 넘으면 acquire가 대기)
+class RateLimiter:
+    def __init__(self, rate_per_second: float, burst: int | None = None):
+        self.rate = rate_per_second
+        self.capacity = burst or max(1, int(rate_per_second))
+        self._tokens = float(self.capacity)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# 서버 종료 시 전용 스레드 풀 정리
+def shutdown_pools():
+    with _lock:
+        for pool in _pools.values():
+            pool.shutdown(wait=False, cancel_futures=True)
+        _pools.clear()
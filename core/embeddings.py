@@ -0,0 +1,212 @@
+import os
+import sys
+import json
+import argparse
+from functools import lru_cache
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from core.settings import load_env
+
+EMBEDDING_MODEL_NAME = "jhgan/ko-sbert-nli"
+# EMBEDDING_BACKEND: torch(기본, sentence-transformers) 또는 onnx(int8 동적 양자화 ONNX 모델, torch 없이 실행)
+DEFAULT_BACKEND = "torch"
+DEFAULT_ONNX_DIRECTORY = "./models/ko-sbert-nli-onnx"
+ONNX_MODEL_FILE = "model.int8.onnx"
+ONNX_CONFIG_FILE = "embedding_config.json"
+DEFAULT_BATCH_SIZE = 32
+# 패리티 검사 기준: torch 임베딩과의 최소 코사인 유사도, 검색 결과 top-k 겹침 비율
+PARITY_MIN_COSINE = 0.98
+PARITY_MIN_TOPK_OVERLAP = 0.9
+PARITY_TOP_K = 3
+
+PARITY_SAMPLE_QUERIES = [
+    "베트남 국적의 30~34세 여성입니다. 현재 서울에 거주하고 있습니다. 영아 자녀를 둔 어머니입니다.",
+    "필리핀 국적의 25~29세 여성입니다. 현재 경기에 거주하고 있습니다. 자녀는 없습니다.",
+    "중국 국적의 40~44세 여성입니다. 현재 부산에 거주하고 있습니다. 초등 자녀를 둔 어머니입니다.",
+    "다문화가족 지원 정책",
+    "결혼이민자 한국어 교육 프로그램 신청 방법",
+]
+
+
+# sentence-transformers 모델의 트랜스포머 부분을 ONNX로 내보내고 int8 동적 양자화
+# 풀링(평균)은 런타임에서 numpy로 계산하므로 설정 파일에 함께 기록
+def export_onnx_model(model_name: str = EMBEDDING_MODEL_NAME, output_dir: str = DEFAULT_ONNX_DIRECTORY) -> str:
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    os.makedirs(output_dir, exist_ok=True)
+    print(f"임베딩 모델을 ONNX로 내보내는 중... ({model_name})")
+    st_model = SentenceTransformer(model_name, device="cpu")
+    transformer = st_model[0]
+    pooling_mode = st_model[1].get_pooling_mode_str()
+    if pooling_mode != "mean":
+        raise RuntimeError(f"평균 풀링 모델만 지원합니다: {pooling_mode}")
+
+    auto_model = transformer.auto_model.eval()
+    tokenizer = transformer.tokenizer
+    tokenizer.save_pretrained(output_dir)
+
+    sample = tokenizer(["다문화가족 지원 정책"], return_tensors="pt")
+    input_names = ["input_ids", "attention_mask", "token_type_ids"]
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    fp32_path = os.path.join(output_dir, "model.onnx")
+    with torch.no_grad():
+        torch.onnx.export(
+            auto_model,
+            (sample["input_ids"], sample["attention_mask"], sample["token_type_ids"]),
+            fp32_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes,
+            opset_version=17,
+        )
+
+    int8_path = os.path.join(output_dir, ONNX_MODEL_FILE)
+    quantize_dynamic(fp32_path, int8_path, weight_type=QuantType.QInt8)
+    with open(os.path.join(output_dir, ONNX_CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump({"model_name": model_name, "max_seq_length": transformer.max_seq_length, "pooling": pooling_mode}, f)
+    print(f"ONNX 모델 저장 완료: {int8_path} ({os.path.getsize(int8_path) / 1024 / 1024:.1f} MB)")
+    return int8_path
+
+
+# int8 ONNX 모델로 ko-sbert 임베딩을 계산하는 LangChain Embeddings 구현 (torch를 불러오지 않음)
+# 길이순으로 정렬해 배치를 만들어 배치 안의 패딩을 최소화하고, 결과는 원래 순서로 되돌림
+class OnnxSentenceEmbeddings(Embeddings):
+    def __init__(self, model_dir: str = DEFAULT_ONNX_DIRECTORY, batch_size: int = DEFAULT_BATCH_SIZE):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        with open(os.path.join(model_dir, ONNX_CONFIG_FILE), "r", encoding="utf-8") as f:
+            self.config = json.load(f)
+        self.batch_size = batch_size
+
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding()
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = int(os.getenv("EMBEDDING_THREADS", "0"))
+        if threads:
+            options.intra_op_num_threads = threads
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, ONNX_MODEL_FILE), options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = {node.name for node in self.session.get_inputs()}
+
+    def _encode_batch(self, texts: list) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.array([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.array([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.array([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: value for name, value in inputs.items() if name in self._input_names})[0]
+        mask = inputs["attention_mask"][..., None].astype(hidden.dtype)
+        return (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+
+    def embed_documents(self, texts: list) -> list:
+        if not texts:
+            return []
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]))
+        vectors = [None] * len(texts)
+        for start in range(0, len(order), self.batch_size):
+            batch = order[start:start + self.batch_size]
+            for i, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[i] = vector.tolist()
+        return vectors
+
+    def embed_query(self, text: str) -> list:
+        return self.embed_documents([text])[0]
+
+
+def _create_torch_embeddings() -> Embeddings:
+    from langchain_community.embeddings import SentenceTransformerEmbeddings
+    return SentenceTransformerEmbeddings(model_name=EMBEDDING_MODEL_NAME)
+
+def _create_onnx_embeddings(model_dir: str) -> Embeddings:
+    if not os.path.exists(os.path.join(model_dir, ONNX_MODEL_FILE)):
+        export_onnx_model(EMBEDDING_MODEL_NAME, model_dir)
+    return OnnxSentenceEmbeddings(model_dir, int(os.getenv("EMBEDDING_BATCH_SIZE", DEFAULT_BATCH_SIZE)))
+
+# 수집 스크립트와 검색 엔진이 함께 쓰는 임베딩 모델 (프로세스당 백엔드별로 한 번만 로드)
+# ChromaDB에 저장된 벡터와 검색어 벡터는 같은 백엔드로 만드는 것이 좋음 - 바꿀 때는 --check로 패리티를 먼저 확인
+@lru_cache(maxsize=None)
+def get_embeddings(backend: str | None = None) -> Embeddings:
+    backend = (backend or os.getenv("EMBEDDING_BACKEND", DEFAULT_BACKEND)).lower()
+    print(f"로컬 임베딩 모델을 로드합니다... (backend={backend})")
+    if backend == "torch":
+        return _create_torch_embeddings()
+    if backend == "onnx":
+        return _create_onnx_embeddings(os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIRECTORY))
+    raise ValueError(f"알 수 없는 EMBEDDING_BACKEND입니다: {backend}")
+
+
+def _cosine_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    a = a / np.linalg.norm(a, axis=1, keepdims=True)
+    b = b / np.linalg.norm(b, axis=1, keepdims=True)
+    return a @ b.T
+
+def _sample_documents(db_directory: str, limit: int) -> list:
+    if not os.path.exists(db_directory):
+        return []
+    from policy_recommend.partitioned_store import open_policy_store
+    db = open_policy_store(db_directory)
+    return db.get(include=["documents"], limit=limit)["documents"]
+
+# torch 임베딩과 ONNX 임베딩 비교
+# 1) 같은 문장의 두 벡터 사이 코사인 유사도 2) 검색어별 top-k 문서가 얼마나 겹치는지 (검색 품질 회귀 확인)
+def check_parity(db_directory: str = "./policy_chroma_db", sample_size: int = 200) -> dict:
+    torch_embeddings = get_embeddings("torch")
+    onnx_embeddings = get_embeddings("onnx")
+    documents = _sample_documents(db_directory, sample_size) or PARITY_SAMPLE_QUERIES
+    texts = PARITY_SAMPLE_QUERIES + documents
+
+    torch_vectors = np.array(torch_embeddings.embed_documents(texts))
+    onnx_vectors = np.array(onnx_embeddings.embed_documents(texts))
+    cosines = np.diag(_cosine_matrix(torch_vectors, onnx_vectors))
+
+    n_queries = len(PARITY_SAMPLE_QUERIES)
+    k = min(PARITY_TOP_K, len(documents))
+    torch_scores = _cosine_matrix(torch_vectors[:n_queries], torch_vectors[n_queries:])
+    onnx_scores = _cosine_matrix(onnx_vectors[:n_queries], onnx_vectors[n_queries:])
+    overlaps = [
+        len(set(np.argsort(-t)[:k]) & set(np.argsort(-o)[:k])) / k
+        for t, o in zip(torch_scores, onnx_scores)
+    ]
+    report = {
+        "texts": len(texts),
+        "mean_cosine": round(float(cosines.mean()), 4),
+        "min_cosine": round(float(cosines.min()), 4),
+        "topk_overlap": round(float(np.mean(overlaps)), 4),
+    }
+    report["passed"] = report["min_cosine"] >= PARITY_MIN_COSINE and report["topk_overlap"] >= PARITY_MIN_TOPK_OVERLAP
+    return report
+
+
+# 실행: python -m core.embeddings --export  (ONNX 모델 생성)
+#       python -m core.embeddings --check   (torch 임베딩과 패리티 검사, 기준 미달 시 종료 코드 1)
+def main():
+    load_env()
+    parser = argparse.ArgumentParser(description="ko-sbert ONNX(int8) 임베딩 모델 생성 및 패리티 검사")
+    parser.add_argument("--export", action="store_true", help="ONNX 모델을 (다시) 내보냄")
+    parser.add_argument("--check", action="store_true", help="torch 임베딩과 결과 비교")
+    parser.add_argument("--output-dir", default=os.getenv("EMBEDDING_ONNX_DIR", DEFAULT_ONNX_DIRECTORY))
+    args = parser.parse_args()
+
+    if args.export:
+        export_onnx_model(EMBEDDING_MODEL_NAME, args.output_dir)
+    if args.check:
+        os.environ["EMBEDDING_ONNX_DIR"] = args.output_dir
+        report = check_parity()
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        if not report["passed"]:
+            print(f"패리티 기준 미달: 최소 코사인 {PARITY_MIN_COSINE}, top-{PARITY_TOP_K} 겹침 {PARITY_MIN_TOPK_OVERLAP}")
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+import os
+import time
+import random
+import asyncio
+import threading
+
+from langchain_core.runnables import Runnable
+
+from core.settings import get_llm_settings
+
+# 기능별 LLM 요청 타임아웃(초) - LLM_TIMEOUT_<FEATURE>_SECONDS로 덮어쓸 수 있음
+DEFAULT_TIMEOUTS = {
+    "diary": 30,
+    "policy": 60,
+    "ingest": 20,
+}
+DEFAULT_MAX_RETRIES = 2
+RETRY_BASE_DELAY = 0.5
+RETRY_MAX_DELAY = 8.0
+# 연속 실패가 이 횟수를 넘으면 BREAKER_RESET_SECONDS 동안 바로 실패 처리 (업스트림 장애 시 워커가 묶이지 않도록)
+BREAKER_FAILURE_THRESHOLD = 5
+BREAKER_RESET_SECONDS = 30
+# 업스트림(API_BASE) 동시 요청 한도와 연결 풀 크기
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MAX_CONNECTIONS = 32
+
+
+class LLMUnavailableError(RuntimeError):
+    pass
+
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except ValueError:
+        return default
+
+def _is_retryable(error: Exception) -> bool:
+    import httpx
+    import openai
+
+    if isinstance(error, (openai.APITimeoutError, openai.APIConnectionError, openai.RateLimitError, httpx.TimeoutException)):
+        return True
+    return isinstance(error, openai.APIStatusError) and error.status_code >= 500
+
+# 지수 백오프 + full jitter (여러 워커가 동시에 재시도해 업스트림을 다시 몰아치지 않도록)
+def _retry_delay(attempt: int) -> float:
+    return random.uniform(0, min(RETRY_MAX_DELAY, RETRY_BASE_DELAY * 2 ** attempt))
+
+
+# closed: 정상 / open: 바로 실패 처리 / half_open: 대기 시간이 지나 요청 하나로 회복 여부 확인
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = BREAKER_FAILURE_THRESHOLD, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self.opened_at < self.reset_seconds:
+                    raise LLMUnavailableError("LLM 서버 장애로 요청을 잠시 중단했습니다. 잠시 후 다시 시도해주세요.")
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_in_flight:
+                    raise LLMUnavailableError("LLM 서버 회복 여부를 확인하는 중입니다. 잠시 후 다시 시도해주세요.")
+                self._trial_in_flight = True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._trial_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._trial_in_flight = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    print(f"LLM 서킷 브레이커 열림 (연속 실패 {self.failures}회)")
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+    def status(self) -> dict:
+        with self._lock:
+            return {"state": self.state, "consecutive_failures": self.failures}
+
+
+# 모든 기능이 함께 쓰는 업스트림 상태: 연결 풀, 동시 요청 한도, 서킷 브레이커
+class LLMGateway:
+    def __init__(self):
+        import httpx
+
+        max_connections = int(_env_float("LLM_MAX_CONNECTIONS", DEFAULT_MAX_CONNECTIONS))
+        limits = httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        self.http_client = httpx.Client(limits=limits)
+        self.http_async_client = httpx.AsyncClient(limits=limits)
+        self.max_concurrency = int(_env_float("LLM_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self.max_retries = int(_env_float("LLM_MAX_RETRIES", DEFAULT_MAX_RETRIES))
+        self.breaker = CircuitBreaker()
+        self._thread_semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_semaphore = None
+
+    @property
+    def async_semaphore(self) -> asyncio.Semaphore:
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._async_semaphore
+
+    def status(self) -> dict:
+        return {**self.breaker.status(), "max_concurrency": self.max_concurrency}
+
+
+_gateway = None
+_gateway_lock = threading.Lock()
+
+def get_llm_gateway() -> LLMGateway:
+    global _gateway
+    with _gateway_lock:
+        if _gateway is None:
+            _gateway = LLMGateway()
+        return _gateway
+
+
+# ChatOpenAI를 감싸 타임아웃, 재시도, 서킷 브레이커, 동시 요청 한도, 헤지 요청을 적용하는 Runnable
+# 체인에서 ChatOpenAI 자리에 그대로 넣어 쓸 수 있음 (prompt | llm | parser)
+class ResilientChatModel(Runnable):
+    def __init__(self, llm, gateway: LLMGateway, feature: str, hedge_after: float | None = None):
+        self.llm = llm
+        self.gateway = gateway
+        self.feature = feature
+        self.hedge_after = hedge_after
+
+    def invoke(self, input, config=None, **kwargs):
+        for attempt in range(self.gateway.max_retries + 1):
+            self.gateway.breaker.before_call()
+            try:
+                with self.gateway._thread_semaphore:
+                    result = self.llm.invoke(input, config, **kwargs)
+            except Exception as e:
+                if not self._handle_failure(e, attempt):
+                    raise
+                time.sleep(_retry_delay(attempt))
+                continue
+            self.gateway.breaker.record_success()
+            return result
+
+    async def ainvoke(self, input, config=None, **kwargs):
+        for attempt in range(self.gateway.max_retries + 1):
+            self.gateway.breaker.before_call()
+            try:
+                result = await self._ainvoke_hedged(input, config, **kwargs)
+            except Exception as e:
+                if not self._handle_failure(e, attempt):
+                    raise
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+            self.gateway.breaker.record_success()
+            return result
+
+    async def _ainvoke_once(self, input, config, **kwargs):
+        async with self.gateway.async_semaphore:
+            return await self.llm.ainvoke(input, config, **kwargs)
+
+    # 헤지 요청: 첫 요청이 hedge_after초 안에 끝나지 않으면 같은 요청을 하나 더 보내고 먼저 끝난 결과를 사용
+    # 동시 요청 한도에 여유가 있을 때만 추가 요청을 보냄
+    # 결과를 돌려줄 때나 바깥에서 취소됐을 때(클라이언트 연결 끊김, 타임아웃) 끝나지 않은 요청은 모두 취소
+    async def _ainvoke_hedged(self, input, config, **kwargs):
+        primary = asyncio.ensure_future(self._ainvoke_once(input, config, **kwargs))
+        tasks = [primary]
+        try:
+            if not self.hedge_after:
+                return await primary
+            done, _ = await asyncio.wait({primary}, timeout=self.hedge_after)
+            if done or self.gateway.async_semaphore.locked():
+                return await primary
+
+            tasks.append(asyncio.ensure_future(self._ainvoke_once(input, config, **kwargs)))
+            pending = set(tasks)
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    # 스트리밍은 첫 청크를 받기 전에 실패한 경우에만 재시도 (이미 보낸 내용을 되돌릴 수 없으므로)
+    def stream(self, input, config=None, **kwargs):
+        for attempt in range(self.gateway.max_retries + 1):
+            self.gateway.breaker.before_call()
+            started = False
+            try:
+                with self.gateway._thread_semaphore:
+                    for chunk in self.llm.stream(input, config, **kwargs):
+                        started = True
+                        yield chunk
+            except Exception as e:
+                if started or not self._handle_failure(e, attempt):
+                    if started:
+                        self.gateway.breaker.record_failure()
+                    raise
+                time.sleep(_retry_delay(attempt))
+                continue
+            self.gateway.breaker.record_success()
+            return
+
+    async def astream(self, input, config=None, **kwargs):
+        for attempt in range(self.gateway.max_retries + 1):
+            self.gateway.breaker.before_call()
+            started = False
+            try:
+                async with self.gateway.async_semaphore:
+                    async for chunk in self.llm.astream(input, config, **kwargs):
+                        started = True
+                        yield chunk
+            except Exception as e:
+                if started or not self._handle_failure(e, attempt):
+                    if started:
+                        self.gateway.breaker.record_failure()
+                    raise
+                await asyncio.sleep(_retry_delay(attempt))
+                continue
+            self.gateway.breaker.record_success()
+            return
+
+    # 실패를 기록하고 다시 시도할지 반환 (재시도할 수 없는 오류이거나 횟수를 다 쓰면 False)
+    def _handle_failure(self, error: Exception, attempt: int) -> bool:
+        if isinstance(error, LLMUnavailableError):
+            return False
+        retryable = _is_retryable(error)
+        if retryable:
+            self.gateway.breaker.record_failure()
+        else:
+            # 잘못된 요청 등 업스트림 장애가 아닌 오류는 서킷 브레이커에 반영하지 않음
+            self.gateway.breaker.record_success()
+        if not retryable or attempt >= self.gateway.max_retries:
+            return False
+        print(f"LLM 요청 실패 ({self.feature}, {attempt + 1}번째 시도): {error!r} - 다시 시도합니다.")
+        return True
+
+
+# 기능별 LLM 생성 - 공유 연결 풀을 쓰는 ChatOpenAI를 ResilientChatModel로 감싸 반환
+# feature: diary / policy / ingest (타임아웃과 헤지 설정을 구분하는 이름)
+# hedge_after_ms: 0보다 크면 해당 시간 뒤 헤지 요청 (LLM_HEDGE_<FEATURE>_MS로 덮어쓸 수 있음)
+def create_chat_model(feature: str, temperature: float, max_tokens: int | None = None, callbacks: list | None = None,
+                      hedge_after_ms: float = 0) -> ResilientChatModel:
+    from langchain_openai import ChatOpenAI
+
+    settings = get_llm_settings()
+    gateway = get_llm_gateway()
+    timeout = _env_float(f"LLM_TIMEOUT_{feature.upper()}_SECONDS", DEFAULT_TIMEOUTS.get(feature, 30))
+    hedge_after_ms = _env_float(f"LLM_HEDGE_{feature.upper()}_MS", hedge_after_ms)
+
+    llm = ChatOpenAI(
+        model_name=settings["model_id"],
+        openai_api_key=settings["api_key"],
+        openai_api_base=settings["api_base"],
+        temperature=temperature,
+        max_tokens=max_tokens,
+        timeout=timeout,
+        max_retries=0,  # 재시도는 ResilientChatModel에서 서킷 브레이커와 함께 처리
+        http_client=gateway.http_client,
+        http_async_client=gateway.http_async_client,
+        callbacks=callbacks,
+    )
+    return ResilientChatModel(llm, gateway, feature, hedge_after=hedge_after_ms / 1000 if hedge_after_ms > 0 else None)
@@ -0,0 +1,145 @@
+import time
+import threading
+from contextlib import contextmanager, nullcontext
+
+try:
+    from opentelemetry import trace
+    _tracer = trace.get_tracer("dajeong")
+except ImportError:
+    _tracer = None
+
+# 단계별 소요 시간 히스토그램 버킷 (초)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in labels) + "}"
+
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, {"counts": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["counts"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                for bound, count in zip(self.buckets, series["counts"]):
+                    lines.append(f"{self.name}_bucket{_format_labels(key + (('le', bound),))} {count}")
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{_format_labels(key)} {series['count']}")
+        return lines
+
+
+class Counter:
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help_text = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def values(self) -> dict:
+        with self._lock:
+            return dict(self._values)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        for key, value in sorted(self.values().items()):
+            lines.append(f"{self.name}{_format_labels(key)} {value}")
+        return lines
+
+
+STAGE_DURATION = Histogram("dajeong_stage_duration_seconds", "Duration of each processing stage")
+HTTP_REQUEST_DURATION = Histogram("dajeong_http_request_duration_seconds", "HTTP request latency by path")
+LLM_TOKENS = Counter("dajeong_llm_tokens_total", "LLM tokens used by feature and token type")
+CACHE_REQUESTS = Counter("dajeong_cache_requests_total", "Cache lookups by cache and result")
+
+
+# 단계 소요 시간을 히스토그램에 기록하고, OpenTelemetry span도 함께 남김
+# (span 내보내기는 OpenTelemetry SDK의 TracerProvider/exporter 설정을 따름)
+@contextmanager
+def stage_timer(stage: str):
+    started_at = time.perf_counter()
+    status = "ok"
+    span = _tracer.start_as_current_span(stage) if _tracer is not None else nullcontext()
+    with span:
+        try:
+            yield
+        except BaseException:
+            status = "error"
+            raise
+        finally:
+            STAGE_DURATION.observe(time.perf_counter() - started_at, stage=stage, status=status)
+
+# result 예: "hit", "miss", "semantic_hit" ("miss"가 아닌 값은 모두 적중으로 집계)
+def record_cache(cache: str, result: str):
+    CACHE_REQUESTS.inc(cache=cache, result=result)
+
+def record_llm_tokens(feature: str, prompt_tokens: int, completion_tokens: int):
+    if prompt_tokens:
+        LLM_TOKENS.inc(prompt_tokens, feature=feature, type="prompt")
+    if completion_tokens:
+        LLM_TOKENS.inc(completion_tokens, feature=feature, type="completion")
+
+# LLM 응답의 토큰 사용량을 집계하는 LangChain 콜백 (ChatOpenAI(callbacks=[...])에 연결)
+def token_usage_callback(feature: str):
+    from langchain_core.callbacks import BaseCallbackHandler
+
+    class TokenUsageCallbackHandler(BaseCallbackHandler):
+        def on_llm_end(self, response, **kwargs):
+            usage = (response.llm_output or {}).get("token_usage") or {}
+            prompt_tokens = usage.get("prompt_tokens", 0)
+            completion_tokens = usage.get("completion_tokens", 0)
+            if not usage:
+                # 스트리밍 응답은 llm_output 대신 메시지의 usage_metadata에 사용량이 들어 있음
+                for generations in response.generations:
+                    for generation in generations:
+                        metadata = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                        prompt_tokens += metadata.get("input_tokens", 0)
+                        completion_tokens += metadata.get("output_tokens", 0)
+            record_llm_tokens(feature, prompt_tokens, completion_tokens)
+
+    return TokenUsageCallbackHandler()
+
+def _cache_hit_ratio_lines() -> list:
+    totals = {}
+    for key, value in CACHE_REQUESTS.values().items():
+        labels = dict(key)
+        hits, total = totals.get(labels["cache"], (0, 0))
+        if labels["result"] != "miss":
+            hits += value
+        totals[labels["cache"]] = (hits, total + value)
+    lines = ["# HELP dajeong_cache_hit_ratio Cache hit ratio since process start", "# TYPE dajeong_cache_hit_ratio gauge"]
+    for cache, (hits, total) in sorted(totals.items()):
+        lines.append(f'dajeong_cache_hit_ratio{{cache="{cache}"}} {hits / total if total else 0.0}')
+    return lines
+
+# Prometheus 텍스트 형식으로 모든 지표를 출력
+def render_metrics() -> str:
+    lines = []
+    for metric in (STAGE_DURATION, HTTP_REQUEST_DURATION, LLM_TOKENS, CACHE_REQUESTS):
+        lines.extend(metric.render())
+    lines.extend(_cache_hit_ratio_lines())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,84 @@
+import time
+import threading
+
+# 실패한 서비스를 다시 생성해 보기 전까지 기다리는 시간(초)
+RETRY_AFTER_SECONDS = 30
+
+class ServiceUnavailableError(RuntimeError):
+    pass
+
+
+# 클라이언트/모델 같은 무거운 서비스를 이름으로 등록해 두고, 처음 사용할 때(또는 백그라운드 워밍업 때) 생성하는 레지스트리
+# 서비스마다 따로 생성되므로 하나가 실패해도(예: GCP 키 없음) 다른 기능은 정상 동작함
+class ServiceRegistry:
+    def __init__(self):
+        self._factories = {}
+        self._services = {}
+        self._status = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory):
+        with self._lock:
+            self._factories[name] = factory
+            self._locks.setdefault(name, threading.Lock())
+            self._status.setdefault(name, {"state": "pending", "load_seconds": None, "error": None})
+
+    def get(self, name: str):
+        if name in self._services:
+            return self._services[name]
+        if name not in self._factories:
+            raise ServiceUnavailableError(f"등록되지 않은 서비스입니다: {name}")
+
+        with self._locks[name]:
+            if name in self._services:
+                return self._services[name]
+            status = self._status[name]
+            if status["state"] == "failed" and time.monotonic() - status["failed_at"] < RETRY_AFTER_SECONDS:
+                raise ServiceUnavailableError(f"'{name}' 서비스를 사용할 수 없습니다: {status['error']}")
+
+            status["state"] = "loading"
+            started_at = time.perf_counter()
+            try:
+                service = self._factories[name]()
+            except Exception as e:
+                self._status[name] = {
+                    "state": "failed",
+                    "load_seconds": round(time.perf_counter() - started_at, 3),
+                    "error": str(e),
+                    "failed_at": time.monotonic(),
+                }
+                print(f"서비스 '{name}' 생성 실패: {e}")
+                raise ServiceUnavailableError(f"'{name}' 서비스를 사용할 수 없습니다: {e}") from e
+
+            load_seconds = time.perf_counter() - started_at
+            self._services[name] = service
+            self._status[name] = {"state": "ready", "load_seconds": round(load_seconds, 3), "error": None}
+            print(f"서비스 '{name}' 준비 완료 ({load_seconds:.2f}초)")
+            return service
+
+    def is_ready(self, name: str) -> bool:
+        return name in self._services
+
+    # 서비스별 상태와 생성에 걸린 시간
+    def status(self) -> dict:
+        return {
+            name: {key: value for key, value in status.items() if key != "failed_at"}
+            for name, status in self._status.items()
+        }
+
+    # 서버 시작을 막지 않도록 서비스들을 백그라운드 스레드에서 미리 생성
+    def warm_up_in_background(self, names: list | None = None):
+        names = names or list(self._factories)
+
+        def run(name):
+            try:
+                self.get(name)
+            except ServiceUnavailableError:
+                pass
+
+        for name in names:
+            threading.Thread(target=run, args=(name,), name=f"warm-up-{name}", daemon=True).start()
+
+
+registry = ServiceRegistry()
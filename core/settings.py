@@ -0,0 +1,19 @@
+import os
+from functools import lru_cache
+
+from dotenv import load_dotenv
+
+# .env 파일은 프로세스당 한 번만 읽음 (모듈 import 시점이 아니라 처음 필요할 때)
+@lru_cache(maxsize=1)
+def load_env():
+    load_dotenv()
+
+# LLM 접속 정보(API_KEY, MODEL_ID, API_BASE)를 읽어 반환 - 없으면 RuntimeError
+def get_llm_settings() -> dict:
+    load_env()
+    API_KEY = os.getenv("API_KEY")
+    MODEL_ID = os.getenv("MODEL_ID")
+    API_BASE = os.getenv("API_BASE")
+    if not API_KEY or not MODEL_ID or not API_BASE:
+        raise RuntimeError("오류: .env 파일에 API_KEY, MODEL_ID, API_BASE를 설정해야 합니다.")
+    return {"api_key": API_KEY, "model_id": MODEL_ID, "api_base": API_BASE}
@@ -1,23 +1,20 @@
 import os
 from typing import List
-from dotenv import load_dotenv
 
-from langchain_openai import ChatOpenAI
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.output_parsers import JsonOutputParser
+from langchain_core.output_parsers import JsonOutputParser, StrOutputParser
+from langchain_core.runnables import RunnableSequence
 from pydantic import BaseModel, Field
 
-load_dotenv()
+from core.concurrency import run_in_pool
+from core.metrics import record_cache, stage_timer, token_usage_callback
+from core.llm import create_chat_model
+from core.registry import ServiceUnavailableError, registry
+from core.settings import load_env
+from diary_ai.diary_correction import get_correction_cache, has_words, make_sentence_key, split_sentences
 
-try:
-    API_KEY = os.getenv("API_KEY")
-    MODEL_ID = os.getenv("MODEL_ID")
-    API_BASE = os.getenv("API_BASE")
-    if not API_KEY or not MODEL_ID or not API_BASE:
-        raise KeyError
-except KeyError:
-    print("오류: .env 파일에 API_KEY, MODEL_ID, API_BASE를 설정해야 합니다.")
-    exit()
+# 한 번의 교정 LLM 호출에 넣는 최대 문장 수 (DIARY_CORRECTION_CHUNK_SIZE)
+DEFAULT_CORRECTION_CHUNK_SIZE = 12
 
 
 # AI가 반환할 답변의 구조
@@ -27,15 +24,25 @@ class DiaryAnalysisWithDiff(BaseModel):
     full_corrected_text: str = Field(description="사용자의 원본 일기 전체를 자연스럽게 수정한 문장")
     reply: str = Field(description="수정된 일기 내용을 바탕으로 작성된, 짧고 따뜻한 공감의 답글")
 
-# 사용자의 일기 내용을 받아 맞춤법 교정, 틀린 단어/고친 단어 분석, 공감 답글을 생성
-def analyze_diary_entry(diary_text: str) -> dict:
-    
-    llm = ChatOpenAI(
-        model_name=MODEL_ID,
-        openai_api_key=API_KEY,
-        openai_api_base=API_BASE,
-        model_kwargs={"temperature": 0.7, "max_tokens": 1024}
-    )
+# 문장 단위 교정 결과의 구조
+class SentenceCorrection(BaseModel):
+    id: int = Field(description="교정한 문장의 번호")
+    corrected: str = Field(description="자연스럽게 수정한 문장 (틀린 곳이 없으면 원래 문장)")
+    incorrect_words: List[str] = Field(description="원래 문장에서 맞춤법이나 문법이 틀렸던 단어들의 리스트")
+    corrected_words: List[str] = Field(description="틀린 단어들을 올바르게 수정한 단어들의 리스트")
+
+class SentenceCorrectionList(BaseModel):
+    sentences: List[SentenceCorrection]
+
+# DIARY_SPLIT_CORRECTION=0 이면 예전처럼 교정과 답글을 한 번의 LLM 호출로 생성
+def _split_correction_enabled() -> bool:
+    return os.getenv("DIARY_SPLIT_CORRECTION", "1") != "0"
+
+# 일기 분석용 LangChain 체인(프롬프트 | LLM | JSON 파서)을 생성
+# .env 설정이 없으면 RuntimeError - 일기 기능만 사용할 수 없고 서버의 다른 기능은 그대로 동작
+def build_diary_chain():
+    # 공유 LLM 게이트웨이 사용 - LLM_HEDGE_DIARY_MS를 설정하면 느린 응답에 헤지 요청을 보냄
+    llm = create_chat_model("diary", temperature=0.7, max_tokens=1024, callbacks=[token_usage_callback("diary")])
     
     parser = JsonOutputParser(pydantic_object=DiaryAnalysisWithDiff)
 
@@ -64,19 +71,411 @@ def analyze_diary_entry(diary_text: str) -> dict:
     )
 
     # LangChain 모든 요소 연결
-    chain = prompt | llm | parser
+    return prompt | llm | parser
+
+# 문장 단위 맞춤법/문법 교정 체인 - 같은 문장은 항상 같은 결과가 나오도록 temperature 0 (결과는 문장별로 캐시)
+def build_correction_chain():
+    llm = create_chat_model("diary", temperature=0, max_tokens=2048, callbacks=[token_usage_callback("diary_correction")])
+    parser = JsonOutputParser(pydantic_object=SentenceCorrectionList)
+
+    prompt_template = """
+    You are a competent Korean proofreader for the 'Dajeong' service.
+    Each numbered line below is one sentence from a diary written by a married immigrant woman.
+    Correct any awkward expressions, typos, and grammatical errors in each sentence into natural Korean, keeping its meaning. Do not merge or split sentences.
+
+    [Instructions]
+    Return one item per numbered line, with id set to the line number.
+    Put the corrected sentence in corrected. If nothing is wrong, return the sentence unchanged.
+    Put the words that were incorrect in the sentence, in order, into the incorrect_words list.
+    Put the corrected versions of those words into the corrected_words list.
+    The incorrect_words and corrected_words lists must have the exact same number of items and correspond in order.
+    If there are no incorrect words, return empty lists ([]) for incorrect_words and corrected_words.
+
+    {format_instructions}
+
+    [Sentences]
+    {sentences}
+    """
+
+    prompt = ChatPromptTemplate.from_template(
+        template=prompt_template,
+        partial_variables={"format_instructions": parser.get_format_instructions()},
+    )
+    return prompt | llm | parser
+
+# 교정된 일기를 바탕으로 공감 답글만 생성하는 체인 (답글은 다양하게 나오도록 temperature 0.7)
+def build_reply_chain():
+    llm = create_chat_model("diary", temperature=0.7, max_tokens=256, callbacks=[token_usage_callback("diary_reply")])
+
+    prompt_template = """
+    You are an AI counselor for the 'Dajeong' service.
+    The diary entry below was written by a married immigrant woman and has already been proofread.
+    Write a short, warm reply of 1-3 sentences in Korean that empathizes with her emotions and offers comfort and encouragement.
+    Respond with the reply text only.
+
+    [Diary]
+    {diary_entry}
+    """
+
+    prompt = ChatPromptTemplate.from_template(prompt_template)
+    return prompt | llm | StrOutputParser()
+
+registry.register("diary_chain", build_diary_chain)
+registry.register("diary_correction_chain", build_correction_chain)
+registry.register("diary_reply_chain", build_reply_chain)
+
+# 체인은 요청마다 새로 만들지 않고 프로세스당 한 번만 생성해 재사용 (LLM 클라이언트 연결도 재사용됨)
+def get_diary_chain():
+    return registry.get("diary_chain")
+
+def get_correction_chain():
+    return registry.get("diary_correction_chain")
+
+def get_reply_chain():
+    return registry.get("diary_reply_chain")
+
+# LLM 호출과 JSON 파싱 시간을 따로 측정하기 위해 체인을 (프롬프트 | LLM)과 파서로 나눔
+def _split_chain(chain):
+    *llm_steps, parser = chain.steps
+    return RunnableSequence(*llm_steps), parser
+
+def _invoke_timed(chain, inputs: dict) -> dict:
+    llm_chain, parser = _split_chain(chain)
+    with stage_timer("diary_llm"):
+        message = llm_chain.invoke(inputs)
+    with stage_timer("diary_parse"):
+        return parser.invoke(message)
+
+async def _ainvoke_timed(chain, inputs: dict) -> dict:
+    llm_chain, parser = _split_chain(chain)
+    with stage_timer("diary_llm"):
+        message = await llm_chain.ainvoke(inputs)
+    with stage_timer("diary_parse"):
+        return parser.invoke(message)
+
+# 배치 LLM 응답을 하나씩 파싱 - LLM 호출이나 파싱에 실패한 항목은 None
+def _parse_batch(parser, messages: list) -> list:
+    results = []
+    for message in messages:
+        if isinstance(message, Exception):
+            results.append(_batch_result(message))
+            continue
+        try:
+            with stage_timer("diary_parse"):
+                results.append(parser.invoke(message))
+        except Exception as e:
+            results.append(_batch_result(e))
+    return results
+
+# 문장 하나를 캐시와 교정 사전으로 처리 - 처리할 수 없으면 (None, LLM에 보낼 정보) 반환
+# 1) 같은 문장(공백 차이 무시)의 교정 결과가 캐시에 있으면 사용
+# 2) 교정 사전으로 자주 틀리는 단어를 고친 문장과 정확히 같은 문장이 캐시에 있으면 사용
+# 그 밖의 문장은 단어가 모두 맞아 보여도 문법 오류가 있을 수 있으므로 사전으로 고친 문장을 LLM에 보냄
+def _resolve_sentence(sentence: str, cache) -> tuple:
+    if not has_words(sentence):
+        return {"corrected": sentence, "incorrect_words": [], "corrected_words": []}, None
+    key = make_sentence_key(sentence)
+    result = cache.get(key)
+    if result is not None:
+        record_cache("diary_sentence", "hit")
+        return result, None
+
+    fixed, incorrect_words, corrected_words = cache.dictionary.apply(sentence)
+    cached = cache.get(make_sentence_key(fixed)) if fixed != sentence else None
+    if cached is not None:
+        result = _merge_correction(incorrect_words, corrected_words, cached)
+        record_cache("diary_sentence", "dictionary_hit")
+        cache.put(key, result)
+        return result, None
+
+    record_cache("diary_sentence", "miss")
+    return None, (key, fixed, incorrect_words, corrected_words)
 
+def _merge_correction(incorrect_words: list, corrected_words: list, result: dict) -> dict:
+    return {
+        "corrected": result["corrected"],
+        "incorrect_words": incorrect_words + result["incorrect_words"],
+        "corrected_words": corrected_words + result["corrected_words"],
+    }
+
+# 일기들을 문장으로 나누고, 캐시/교정 사전으로 처리하지 못한 문장만 LLM 입력 묶음(chunk)으로 만듦
+# 여러 일기에 같은 문장이 있으면 한 번만 보냄
+def _plan_corrections(diary_texts: List[str]) -> tuple:
+    cache = get_correction_cache()
+    plans, pending = [], {}
+    for diary_text in diary_texts:
+        plan = []
+        for sentence in split_sentences(diary_text):
+            result, miss = _resolve_sentence(sentence.strip(), cache)
+            plan.append((sentence, result, miss))
+            if miss is not None:
+                pending.setdefault(miss[1], None)
+        plans.append(plan)
+
+    chunk_size = int(os.getenv("DIARY_CORRECTION_CHUNK_SIZE", DEFAULT_CORRECTION_CHUNK_SIZE))
+    pending = list(pending)
+    chunks = [pending[i:i + chunk_size] for i in range(0, len(pending), chunk_size)]
+    return plans, chunks
+
+def _correction_inputs(chunk: list) -> dict:
+    return {"sentences": "\n".join(f"{i}. {sentence}" for i, sentence in enumerate(chunk, start=1))}
+
+# LLM 교정 결과를 캐시에 저장(교정 사전 학습 포함)하고, 일기별 교정 결과를 원래 문장 순서대로 조립
+# LLM 호출이 실패했거나 결과가 빠진 문장이 있는 일기는 예외 객체로 반환
+def _finish_corrections(plans: list, chunks: list, outputs: list) -> list:
+    cache = get_correction_cache()
+    corrections = {}
+    for chunk, output in zip(chunks, outputs):
+        if isinstance(output, Exception):
+            print(f"오류가 발생했습니다: {output}")
+            continue
+        for item in output.get("sentences", []) if isinstance(output, dict) else []:
+            if not isinstance(item, dict) or not isinstance(item.get("corrected"), str):
+                continue
+            index = item.get("id")
+            if not isinstance(index, int) or not 1 <= index <= len(chunk):
+                continue
+            learned = list(zip(item.get("incorrect_words") or [], item.get("corrected_words") or []))
+            result = {
+                "corrected": item["corrected"].strip(),
+                "incorrect_words": [wrong for wrong, _ in learned],
+                "corrected_words": [right for _, right in learned],
+            }
+            sentence = chunk[index - 1]
+            corrections[sentence] = result
+            cache.put(make_sentence_key(sentence), result, learned=[list(pair) for pair in learned])
+
+    results = []
+    for plan in plans:
+        incorrect_words, corrected_words, parts = [], [], []
+        failed = False
+        for sentence, result, miss in plan:
+            if miss is not None:
+                key, fixed, fixed_incorrect, fixed_corrected = miss
+                if fixed not in corrections:
+                    failed = True
+                    break
+                result = _merge_correction(fixed_incorrect, fixed_corrected, corrections[fixed])
+                if key != make_sentence_key(fixed):
+                    cache.put(key, result)
+            incorrect_words.extend(result["incorrect_words"])
+            corrected_words.extend(result["corrected_words"])
+            core = sentence.strip()
+            leading = sentence[:len(sentence) - len(sentence.lstrip())]
+            trailing = sentence[len(leading) + len(core):]
+            parts.append(leading + result["corrected"] + trailing)
+        if failed:
+            results.append(RuntimeError("일기의 일부 문장을 교정하지 못했습니다."))
+            continue
+        results.append({
+            "incorrect_words": incorrect_words,
+            "corrected_words": corrected_words,
+            "full_corrected_text": "".join(parts).strip(),
+        })
+    return results
+
+# 여러 일기의 맞춤법/문법 교정 - 캐시나 교정 사전으로 처리하지 못한 문장만 LLM(temperature 0)으로 교정
+# 일기별로 {incorrect_words, corrected_words, full_corrected_text} 또는 실패 시 예외 객체를 반환
+def correct_diaries(diary_texts: List[str], max_concurrency: int = 8) -> list:
+    with stage_timer("diary_correction"):
+        plans, chunks = _plan_corrections(diary_texts)
+        outputs = []
+        if chunks:
+            chain = get_correction_chain()
+            with stage_timer("diary_correction_llm"):
+                outputs = chain.batch(
+                    [_correction_inputs(chunk) for chunk in chunks],
+                    config={"max_concurrency": max_concurrency},
+                    return_exceptions=True,
+                )
+        return _finish_corrections(plans, chunks, outputs)
+
+# correct_diaries의 비동기 버전 - 교정 캐시 파일 읽기/쓰기는 이벤트 루프를 막지 않도록 diary 스레드 풀에서 실행
+async def acorrect_diaries(diary_texts: List[str], max_concurrency: int = 8) -> list:
+    with stage_timer("diary_correction"):
+        plans, chunks = await run_in_pool("diary", _plan_corrections, diary_texts)
+        outputs = []
+        if chunks:
+            chain = get_correction_chain()
+            with stage_timer("diary_correction_llm"):
+                outputs = await chain.abatch(
+                    [_correction_inputs(chunk) for chunk in chunks],
+                    config={"max_concurrency": max_concurrency},
+                    return_exceptions=True,
+                )
+        return await run_in_pool("diary", _finish_corrections, plans, chunks, outputs)
+
+def _reply_inputs(corrections: list) -> tuple:
+    indexes = [i for i, correction in enumerate(corrections) if not isinstance(correction, Exception)]
+    return indexes, [{"diary_entry": corrections[i]["full_corrected_text"]} for i in indexes]
+
+# 교정 결과와 답글을 합쳐 기존과 같은 형식의 분석 결과로 만듦 (실패한 항목은 None)
+def _combine_results(corrections: list, indexes: list, replies: list) -> list:
+    results = [_batch_result(correction) if isinstance(correction, Exception) else None for correction in corrections]
+    for i, reply in zip(indexes, replies):
+        results[i] = _batch_result(reply if isinstance(reply, Exception) else {**corrections[i], "reply": reply.strip()})
+    return results
+
+# 교정 단계와 답글 생성 단계를 나눠 분석 (교정은 문장별 캐시 사용, 답글은 교정된 일기 전체로 생성)
+def _analyze_split(diary_texts: List[str], max_concurrency: int = 8) -> list:
+    reply_chain = get_reply_chain()
+    corrections = correct_diaries(diary_texts, max_concurrency)
+    indexes, inputs = _reply_inputs(corrections)
+    with stage_timer("diary_reply_llm"):
+        replies = reply_chain.batch(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+    return _combine_results(corrections, indexes, replies)
+
+async def _aanalyze_split(diary_texts: List[str], max_concurrency: int = 8) -> list:
+    reply_chain = get_reply_chain()
+    corrections = await acorrect_diaries(diary_texts, max_concurrency)
+    indexes, inputs = _reply_inputs(corrections)
+    with stage_timer("diary_reply_llm"):
+        replies = await reply_chain.abatch(inputs, config={"max_concurrency": max_concurrency}, return_exceptions=True)
+    return _combine_results(corrections, indexes, replies)
+
+# 사용자의 일기 내용을 받아 맞춤법 교정, 틀린 단어/고친 단어 분석, 공감 답글을 생성
+def analyze_diary_entry(diary_text: str) -> dict:
     # 체인 실행
     print("AI가 일기를 분석하고 있습니다...")
     try:
-        result = chain.invoke({"diary_entry": diary_text})
+        if _split_correction_enabled():
+            return _analyze_split([diary_text])[0]
+        chain = get_diary_chain()
+        result = _invoke_timed(chain, {"diary_entry": diary_text})
         return result
     except Exception as e:
         print(f"오류가 발생했습니다: {e}")
         return None
 
+# analyze_diary_entry의 비동기 버전 - LLM 응답을 기다리는 동안 이벤트 루프를 막지 않음
+async def aanalyze_diary_entry(diary_text: str) -> dict:
+    print("AI가 일기를 분석하고 있습니다...")
+    try:
+        if _split_correction_enabled():
+            return (await _aanalyze_split([diary_text]))[0]
+        chain = get_diary_chain()
+        result = await _ainvoke_timed(chain, {"diary_entry": diary_text})
+        return result
+    except Exception as e:
+        print(f"오류가 발생했습니다: {e}")
+        return None
+
+# 여러 일기를 한 번에 분석 - 실패한 항목은 None으로 반환
+def analyze_diary_entries(diary_texts: List[str], max_concurrency: int = 8) -> List[dict]:
+    try:
+        if _split_correction_enabled():
+            print(f"AI가 일기 {len(diary_texts)}개를 분석하고 있습니다...")
+            return _analyze_split(diary_texts, max_concurrency)
+        chain = get_diary_chain()
+    except ServiceUnavailableError as e:
+        print(f"오류가 발생했습니다: {e}")
+        return [None] * len(diary_texts)
+
+    print(f"AI가 일기 {len(diary_texts)}개를 분석하고 있습니다...")
+    llm_chain, parser = _split_chain(chain)
+    # 배치는 개별 LLM 호출 시간을 알 수 없으므로 배치 전체 시간을 기록
+    with stage_timer("diary_llm_batch"):
+        messages = llm_chain.batch(
+            [{"diary_entry": text} for text in diary_texts],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+    return _parse_batch(parser, messages)
+
+# analyze_diary_entries의 비동기 버전
+async def aanalyze_diary_entries(diary_texts: List[str], max_concurrency: int = 8) -> List[dict]:
+    try:
+        if _split_correction_enabled():
+            print(f"AI가 일기 {len(diary_texts)}개를 분석하고 있습니다...")
+            return await _aanalyze_split(diary_texts, max_concurrency)
+        chain = get_diary_chain()
+    except ServiceUnavailableError as e:
+        print(f"오류가 발생했습니다: {e}")
+        return [None] * len(diary_texts)
+
+    print(f"AI가 일기 {len(diary_texts)}개를 분석하고 있습니다...")
+    llm_chain, parser = _split_chain(chain)
+    with stage_timer("diary_llm_batch"):
+        messages = await llm_chain.abatch(
+            [{"diary_entry": text} for text in diary_texts],
+            config={"max_concurrency": max_concurrency},
+            return_exceptions=True,
+        )
+    return _parse_batch(parser, messages)
+
+# 일기 분석 결과를 모델이 생성하는 대로 스트리밍 - (이벤트 이름, 데이터) 튜플을 차례로 내보냄
+# - partial: 지금까지 파싱된 부분 JSON
+# - field: 값이 완성된 필드 (JSON은 순서대로 생성되므로 다음 필드가 시작되면 앞 필드는 완성된 것)
+# - done: 최종 결과 / error: 오류 메시지
+# (스트리밍은 생성과 파싱이 섞여 있어 전체 시간을 diary_stream으로 기록)
+# 교정/답글 분리 모드에서는 교정 결과 필드를 먼저 보내고, 답글만 토큰 단위로 스트리밍
+async def astream_diary_analysis(diary_text: str):
+    print("AI가 일기를 스트리밍으로 분석하고 있습니다...")
+    if _split_correction_enabled():
+        async for event, data in _astream_split(diary_text):
+            yield event, data
+        return
+
+    sent_fields = set()
+    latest = {}
+    try:
+        chain = get_diary_chain()
+        with stage_timer("diary_stream"):
+            async for partial in chain.astream({"diary_entry": diary_text}):
+                if not isinstance(partial, dict) or partial == latest:
+                    continue
+                latest = partial
+                yield "partial", partial
+                keys = list(partial.keys())
+                for key in keys[:-1]:
+                    if key not in sent_fields:
+                        sent_fields.add(key)
+                        yield "field", {"name": key, "value": partial[key]}
+    except Exception as e:
+        print(f"오류가 발생했습니다: {e}")
+        yield "error", {"message": str(e)}
+        return
+
+    for key, value in latest.items():
+        if key not in sent_fields:
+            yield "field", {"name": key, "value": value}
+    yield "done", latest
+
+async def _astream_split(diary_text: str):
+    try:
+        reply_chain = get_reply_chain()
+        correction = (await acorrect_diaries([diary_text]))[0]
+        if isinstance(correction, Exception):
+            raise correction
+        yield "partial", correction
+        for key, value in correction.items():
+            yield "field", {"name": key, "value": value}
+
+        reply = ""
+        with stage_timer("diary_stream"):
+            async for chunk in reply_chain.astream({"diary_entry": correction["full_corrected_text"]}):
+                if not chunk:
+                    continue
+                reply += chunk
+                yield "partial", {**correction, "reply": reply}
+    except Exception as e:
+        print(f"오류가 발생했습니다: {e}")
+        yield "error", {"message": str(e)}
+        return
+
+    result = {**correction, "reply": reply.strip()}
+    yield "field", {"name": "reply", "value": result["reply"]}
+    yield "done", result
+
+def _batch_result(result):
+    if isinstance(result, Exception):
+        print(f"오류가 발생했습니다: {result}")
+        return None
+    return result
+
 if __name__ == "__main__":
     # 테스트
+    load_env()
     sample_diary = "오늘 아이가 학교에서 친구랑 싸워따. 내가 한국말이 서툴어서 선생님한테 똑빠로 설명도 못해주고. 정말 답답했다. 나는 나쁜 엄마인것같다."
     
     print("=" * 30)
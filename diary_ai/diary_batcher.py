@@ -0,0 +1,88 @@
+import os
+import asyncio
+from typing import List
+
+from diary_ai.diary_ai_main import aanalyze_diary_entries
+
+DEFAULT_WINDOW_MS = 20
+DEFAULT_MAX_BATCH_SIZE = 16
+DEFAULT_MAX_CONCURRENCY = 8
+
+# 짧은 시간 동안 동시에 들어온 단일 일기 분석 요청을 모아 한 번의 abatch로 처리하는 마이크로 배처
+# 설정: DIARY_BATCH_WINDOW_MS, DIARY_BATCH_MAX_SIZE, DIARY_BATCH_MAX_CONCURRENCY
+class DiaryMicroBatcher:
+    def __init__(self, window_ms: int | None = None, max_batch_size: int | None = None, max_concurrency: int | None = None):
+        self.window = (window_ms if window_ms is not None else int(os.getenv("DIARY_BATCH_WINDOW_MS", DEFAULT_WINDOW_MS))) / 1000
+        self.max_batch_size = max_batch_size or int(os.getenv("DIARY_BATCH_MAX_SIZE", DEFAULT_MAX_BATCH_SIZE))
+        self.max_concurrency = max_concurrency or int(os.getenv("DIARY_BATCH_MAX_CONCURRENCY", DEFAULT_MAX_CONCURRENCY))
+        self._queue = None
+        self._worker = None
+        self._tasks = set()
+        # 결과를 아직 받지 못한 요청의 future (큐 대기, 배치 수집 중, 처리 중 모두 포함)
+        self._futures = set()
+
+    def start(self):
+        if self._worker is None:
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.create_task(self._run())
+
+    # 서버 종료 시 큐에 남았거나 처리 중인 요청이 응답 없이 멈춰 있지 않도록 모두 오류로 끝냄
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+            self._worker = None
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        for future in list(self._futures):
+            if not future.done():
+                future.set_exception(RuntimeError("batcher stopped"))
+        self._futures.clear()
+        self._queue = None
+
+    # 일기 하나를 큐에 넣고, 배치 처리 결과를 기다림
+    async def submit(self, diary_text: str) -> dict | None:
+        self.start()
+        future = asyncio.get_running_loop().create_future()
+        self._futures.add(future)
+        future.add_done_callback(self._futures.discard)
+        await self._queue.put((diary_text, future))
+        return await future
+
+    # 첫 요청이 들어오면 window 동안(또는 max_batch_size가 찰 때까지) 더 모아서 한 번에 처리
+    async def _collect(self) -> List[tuple]:
+        batch = [await self._queue.get()]
+        deadline = asyncio.get_running_loop().time() + self.window
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self):
+        while True:
+            batch = await self._collect()
+            # 배치 처리가 끝나길 기다리지 않고 바로 다음 배치를 모음
+            task = asyncio.create_task(self._process(batch))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _process(self, batch: List[tuple]):
+        texts = [text for text, _ in batch]
+        try:
+            results = await aanalyze_diary_entries(texts, max_concurrency=self.max_concurrency)
+        except Exception as e:
+            print(f"일기 배치 분석 중 오류가 발생했습니다: {e}")
+            results = [None] * len(batch)
+        for (_, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result)
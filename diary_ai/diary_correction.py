@@ -0,0 +1,159 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from collections import Counter, OrderedDict, defaultdict
+from functools import lru_cache
+
+DEFAULT_CACHE_PATH = "diary_ai/correction_cache.jsonl"
+DEFAULT_MAX_ENTRIES = 50000
+# 교정 프롬프트를 바꾸면 값을 올려 예전 교정 결과를 무시하도록 함
+CORRECTION_VERSION = "v1"
+# 학습된 교정 사전의 신뢰 기준: 같은 (틀린 단어 -> 고친 단어)가 이 횟수 이상 나와야 사용
+DEFAULT_MIN_PAIR_COUNT = 2
+# 로그 줄 수가 캐시 최대 항목 수의 이 배수를 넘으면 현재 항목만 남기고 로그를 다시 씀
+COMPACT_RATIO = 2
+
+# 문장 끝(. ! ? 줄바꿈) 기준으로 나누되, 이어 붙이면 원문과 같도록 공백까지 포함
+SENTENCE_PATTERN = re.compile(r"[^.!?\n]*(?:[.!?]+|\n|$)\s*")
+WORD_PATTERN = re.compile(r"[가-힣A-Za-z0-9]+")
+
+
+def split_sentences(text: str) -> list:
+    return [sentence for sentence in SENTENCE_PATTERN.findall(text) if sentence]
+
+def _normalize(sentence: str) -> str:
+    return " ".join(sentence.split())
+
+# 공백 차이는 무시하는 문장 캐시 키
+def make_sentence_key(sentence: str) -> str:
+    payload = f"{CORRECTION_VERSION}\n{_normalize(sentence)}"
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+def has_words(sentence: str) -> bool:
+    return WORD_PATTERN.search(sentence) is not None
+
+
+# 지난 LLM 교정 결과에서 학습한 로컬 교정 사전
+# - pairs: 틀린 단어 -> {고친 단어: 횟수} (예: 싸워따 -> 싸웠다)
+# 단어 단위로만 고치므로 문법 오류는 찾지 못함 - 사전으로 고친 문장도 캐시에 정확히 같은 문장이 없으면 LLM이 다시 확인
+class CorrectionDictionary:
+    def __init__(self, min_pair_count: int = DEFAULT_MIN_PAIR_COUNT):
+        self.min_pair_count = min_pair_count
+        self.pairs = defaultdict(Counter)
+        self._lock = threading.Lock()
+
+    def learn(self, incorrect_words: list, corrected_words: list):
+        with self._lock:
+            for wrong, right in zip(incorrect_words, corrected_words):
+                # 한 단어끼리의 교정만 사전에 넣음 (구절 교정은 문맥에 따라 달라질 수 있음)
+                if wrong != right and WORD_PATTERN.fullmatch(wrong) and WORD_PATTERN.fullmatch(right):
+                    self.pairs[wrong][right] += 1
+
+    # 가장 많이 나온 교정이 기준 횟수를 넘고, 다른 교정보다 확실히 많을 때만 사용
+    def _lookup(self, word: str) -> str | None:
+        candidates = self.pairs.get(word)
+        if not candidates:
+            return None
+        (right, count), *rest = candidates.most_common(2)
+        if count < self.min_pair_count or (rest and rest[0][1] == count):
+            return None
+        return right
+
+    # 사전에 있는 틀린 단어를 바꾼 문장과 (틀린 단어, 고친 단어) 목록 반환
+    def apply(self, sentence: str) -> tuple:
+        incorrect_words, corrected_words = [], []
+
+        def replace(match):
+            right = self._lookup(match.group(0))
+            if right is None:
+                return match.group(0)
+            incorrect_words.append(match.group(0))
+            corrected_words.append(right)
+            return right
+
+        with self._lock:
+            corrected = WORD_PATTERN.sub(replace, sentence)
+        return corrected, incorrect_words, corrected_words
+
+
+# 문장 단위 교정 결과 캐시 (메모리 LRU + JSONL 로그)
+# 로그는 추가만 하므로 여러 워커가 같은 파일을 써도 안전하고, 시작할 때 로그의 LLM 교정 결과로 교정 사전을 다시 학습
+# 로그가 캐시 크기의 COMPACT_RATIO배를 넘으면 메모리에 남은 항목만 새 파일로 다시 씀
+# (다시 쓰는 동안 다른 워커가 추가한 줄은 빠질 수 있지만, 캐시 항목이라 다음에 다시 교정하면 됨)
+# 파일을 읽고 쓰므로 이벤트 루프가 아닌 스레드 풀에서 호출해야 함
+class SentenceCorrectionCache:
+    def __init__(self, path: str, max_entries: int = DEFAULT_MAX_ENTRIES, dictionary: CorrectionDictionary | None = None):
+        self.path = path
+        self.max_entries = max_entries
+        self.dictionary = dictionary or CorrectionDictionary()
+        self._entries = OrderedDict()
+        self._log_lines = 0
+        self._lock = threading.Lock()
+        if path and os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    self._log_lines += 1
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    self._remember(record)
+                    if "learned" in record:
+                        learned = record["learned"]
+                        self.dictionary.learn([w for w, _ in learned], [r for _, r in learned])
+
+    # 로그 기록 그대로 보관 (다시 쓸 때 LLM이 찾은 교정 쌍까지 남기기 위함)
+    def _remember(self, record: dict):
+        key = record["key"]
+        self._entries[key] = record
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str) -> dict | None:
+        with self._lock:
+            record = self._entries.get(key)
+            if record is None:
+                return None
+            self._entries.move_to_end(key)
+            return record["result"]
+
+    # result: {"corrected": 교정된 문장, "incorrect_words": [...], "corrected_words": [...]}
+    # learned: LLM이 새로 찾은 (틀린 단어, 고친 단어) 목록 - 있으면 교정 사전에도 반영
+    def put(self, key: str, result: dict, learned: list | None = None):
+        if learned is not None:
+            self.dictionary.learn([w for w, _ in learned], [r for _, r in learned])
+        record = {"key": key, "result": result}
+        if learned is not None:
+            record["learned"] = learned
+        with self._lock:
+            self._remember(record)
+            if not self.path:
+                return
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._log_lines += 1
+            if self._log_lines > self.max_entries * COMPACT_RATIO:
+                self._compact()
+
+    def _compact(self):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            for record in self._entries.values():
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        os.replace(tmp_path, self.path)
+        self._log_lines = len(self._entries)
+
+
+# 프로세스당 하나의 교정 캐시 (DIARY_CORRECTION_CACHE_PATH를 빈 값으로 두면 메모리에만 저장)
+@lru_cache(maxsize=1)
+def get_correction_cache() -> SentenceCorrectionCache:
+    dictionary = CorrectionDictionary(int(os.getenv("DIARY_DICT_MIN_PAIR_COUNT", DEFAULT_MIN_PAIR_COUNT)))
+    return SentenceCorrectionCache(
+        os.getenv("DIARY_CORRECTION_CACHE_PATH", DEFAULT_CACHE_PATH),
+        int(os.getenv("DIARY_CORRECTION_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        dictionary,
+    )
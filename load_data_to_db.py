@@ -1,16 +1,41 @@
 import os
 import json
+import time
 import shutil
-from langchain_openai import ChatOpenAI
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import Chroma
+import hashlib
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from langchain_core.runnables import Runnable
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
-from dotenv import load_dotenv
 from bs4 import BeautifulSoup
 
-# --- AI를 사용해 텍스트에서 지역 정보 추출하는 함수 ---
-def extract_region_with_ai(text_content: str, llm: ChatOpenAI) -> str:
+from core.embeddings import get_embeddings
+from core.llm import create_chat_model
+from core.settings import load_env
+from policy_recommend.hybrid_retriever import load_or_build_bm25_index
+from policy_recommend.partitioned_store import compact_policy_store, open_policy_store_for_ingest
+from policy_recommend.retriever import notify_index_updated
+from region_classifier import GAZETTEER_VERSION, RegionCache, classify_region, content_hash, normalize_region_name
+
+# 파이프라인 단계별 동시 처리 기본값 (INGEST_REGION_WORKERS, INGEST_PARSE_WORKERS, INGEST_EMBED_BATCH_SIZE로 조정)
+DEFAULT_REGION_WORKERS = 8
+DEFAULT_EMBED_BATCH_SIZE = 64
+CHECKPOINT_DIRECTORY = "./ingest_checkpoints"
+REGION_CACHE_PATH = os.path.join(CHECKPOINT_DIRECTORY, "region_cache.jsonl")
+
+# 동시 처리 설정은 import 시점이 아니라 사용할 때 읽음 (.env를 먼저 읽은 뒤 적용되도록)
+def region_workers() -> int:
+    return int(os.getenv("INGEST_REGION_WORKERS", DEFAULT_REGION_WORKERS))
+
+def parse_workers() -> int:
+    return int(os.getenv("INGEST_PARSE_WORKERS", os.cpu_count() or 2))
+
+def embed_batch_size() -> int:
+    return int(os.getenv("INGEST_EMBED_BATCH_SIZE", DEFAULT_EMBED_BATCH_SIZE))
+
+# --- AI를 사용해 텍스트에서 지역 정보 추출하는 함수 (실패 시 None) ---
+def _ask_llm_region(text_content: str, llm: Runnable) -> str | None:
     prompt = f"""
     다음 텍스트 내용에서 언급된 대한민국의 핵심 지역(특별시, 광역시, 도 단위)을 하나만 찾아줘.
     만약 특정 지역이 언급되지 않거나 여러 지역이 언급되면 "전국"이라고만 답해줘. 다른 설명은 붙이지 마.
@@ -21,81 +46,252 @@ def extract_region_with_ai(text_content: str, llm: ChatOpenAI) -> str:
     """
     try:
         response = llm.invoke(prompt)
-        region = response.content.strip()
-        if "서울" in region or "인천" in region or "경기" in region:
-            return "수도권"
-            
-        elif "대전" in region or "세종" in region or "충남" in region or "충북" in region:
-            return "충청도"
-            
-        elif "부산" in region or "대구" in region or "울산" in region or "경북" in region or "경남" in region:
-            return "경상도"
-            
-        elif "광주" in region or "전남" in region or "전북" in region:
-            return "전라도"
-            
-        elif "강원" in region:
-            return "강원도"
-            
-        elif "제주" in region:
-            return "제주도"
-            
-        else:
-            return "전국"
+        return normalize_region_name(response.content.strip())
     except Exception:
-        return "전국"
-    
-    
+        return None
+
+
+# 단계별 처리량(docs/sec)을 측정해 출력
+class StageStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.count = 0
+        self.started_at = time.perf_counter()
+        self._lock = threading.Lock()
+
+    def add(self, n: int = 1):
+        with self._lock:
+            self.count += n
+
+    def report(self):
+        elapsed = time.perf_counter() - self.started_at
+        rate = self.count / elapsed if elapsed > 0 else 0.0
+        print(f"  [{self.name}] {self.count}개 처리, {elapsed:.1f}초, {rate:.2f} docs/sec")
+
+
+# 문서별 진행 상황을 JSONL 파일에 기록해 재실행 시 이어서 처리하도록 하는 체크포인트
+# 한 줄에 {"doc_id": ..., "region": ..., "gazetteer": 지명 사전 버전} 또는 {"doc_id": ..., "embedded": true, "region": ...} 형태로 추가 기록
+# embedded는 문서 -> 저장할 때 사용한 지역. 지역이 바뀐 문서(예: LLM 실패로 임시 '전국'이었던 문서)는 DB의 조각을 교체
+class IngestCheckpoint:
+    def __init__(self, path: str):
+        self.path = path
+        self.regions = {}
+        self.embedded = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            recorded_regions = {}
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue  # 중단 시 마지막 줄이 잘렸을 수 있음
+                    if record.get("embedded"):
+                        # 저장 지역이 없는 예전 기록은 그때까지 기록된 분류 결과로 대신함 (없으면 다시 저장)
+                        self.embedded[record["doc_id"]] = record.get("region", recorded_regions.get(record["doc_id"]))
+                    elif "region" in record:
+                        recorded_regions[record["doc_id"]] = record["region"]
+                        # 예전 지명 사전 버전에서 기록한 분류 결과는 다시 분류 (LLM 결과는 지역 캐시에 남아 있음)
+                        if record.get("gazetteer") == GAZETTEER_VERSION:
+                            self.regions[record["doc_id"]] = record["region"]
+            print(f"체크포인트 로드: 지역 추출 {len(self.regions)}개, 임베딩 {len(self.embedded)}개 완료")
+
+    @classmethod
+    def for_source(cls, file_path: str):
+        os.makedirs(CHECKPOINT_DIRECTORY, exist_ok=True)
+        name = os.path.basename(file_path) + ".checkpoint.jsonl"
+        return cls(os.path.join(CHECKPOINT_DIRECTORY, name))
+
+    def _append(self, record: dict):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def record_region(self, doc_id: str, region: str):
+        self.regions[doc_id] = region
+        self._append({"doc_id": doc_id, "region": region, "gazetteer": GAZETTEER_VERSION})
+
+    def record_embedded(self, doc_regions: dict):
+        for doc_id, region in doc_regions.items():
+            self.embedded[doc_id] = region
+            self._append({"doc_id": doc_id, "embedded": True, "region": region})
+
+    # 같은 지역으로 이미 저장된 문서면 True
+    def is_embedded(self, doc: Document) -> bool:
+        return doc.id in self.embedded and self.embedded[doc.id] == doc.metadata["region"]
+
+    # DB를 새로 만들 때는 임베딩 완료 기록만 비움 (지역 추출 결과는 그대로 재사용)
+    def reset_embedded(self):
+        self.embedded.clear()
+
+
+# 메타데이터의 출처 경로 정규화 - './x.json'과 'x.json'처럼 같은 파일이 다른 출처로 저장되지 않도록
+# (수집 스크립트는 저장소 최상위에서 실행하므로 'crawling/notices_2025.json' 형태가 됨)
+def normalize_source(file_path: str) -> str:
+    return os.path.normpath(os.path.relpath(os.path.abspath(file_path)))
+
+def make_doc_id(file_path: str, policy: dict) -> str:
+    key = "\x1f".join([file_path, policy.get('title', ''), policy.get('date', ''), policy.get('content_html', '')])
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
 
-def load_and_process_json(file_path: str, llm: ChatOpenAI) -> list:
+# HTML 파싱 (프로세스 풀에서 실행되므로 모듈 최상위 함수로 정의)
+def parse_policy(policy: dict) -> dict:
+    soup = BeautifulSoup(policy.get('content_html', ''), 'html.parser')
+    main_content = soup.get_text(separator='\n', strip=True)
+    attachment_texts = [f"첨부파일: {att.get('name', '')}" for att in policy.get('attachments', [])]
+    return {
+        "title": policy.get('title', ''),
+        "date": policy.get('date', ''),
+        "main_content": main_content,
+        "full_content": main_content + "\n\n" + "\n".join(attachment_texts),
+        "attachment_urls": ", ".join([att.get('url', '') for att in policy.get('attachments', [])]),
+    }
+
+def _build_document(file_path: str, doc_id: str, parsed: dict, region: str) -> Document:
+    metadata = {
+        "source": file_path,
+        "title": parsed["title"],
+        "date": parsed["date"],
+        "region": region,
+        "attachment_urls": parsed["attachment_urls"],
+        "doc_id": doc_id,
+    }
+    doc = Document(page_content=parsed["full_content"], metadata=metadata)
+    doc.id = doc_id
+    return doc
+
+# 정책 JSON을 읽어 HTML 파싱(프로세스 풀) -> 지역 추출(스레드 풀) 순으로 처리하고,
+# 지역 추출이 끝나는 문서부터 바로 내보내는 스트리밍 파이프라인
+def iter_processed_documents(file_path: str, llm: Runnable, checkpoint: IngestCheckpoint | None = None):
+    file_path = normalize_source(file_path)
     with open(file_path, 'r', encoding='utf-8') as f:
         data = json.load(f)
 
-    all_documents = []
-    print(f"\n총 {len(data)}개의 정책에 대해 지역 정보 추출을 시작합니다.")
-    
-    for i, policy in enumerate(data):
-        title = policy.get('title', '')
-        print(f"  ({i+1}/{len(data)}) '{title}' 처리 중...")
-
-        soup = BeautifulSoup(policy.get('content_html', ''), 'html.parser')
-        main_content = soup.get_text(separator='\n', strip=True)
-        attachment_texts = [f"첨부파일: {att.get('name', '')}" for att in policy.get('attachments', [])]
-        full_content = main_content + "\n\n" + "\n".join(attachment_texts)
-
-        text_for_region_extraction = title + "\n" + main_content
-        extracted_region = extract_region_with_ai(text_for_region_extraction, llm)
-        print(f"    -> 추출된 지역: {extracted_region}")
-
-        metadata = {
-            "source": file_path,
-            "title": title,
-            "date": policy.get('date', ''),
-            "region": extracted_region,
-            "attachment_urls": ", ".join([att.get('url', '') for att in policy.get('attachments', [])])
-        }
-
-        doc = Document(page_content=full_content, metadata=metadata)
-        all_documents.append(doc)
-    
-    return all_documents
+    if checkpoint is None:
+        checkpoint = IngestCheckpoint.for_source(file_path)
+
+    doc_ids = [make_doc_id(file_path, policy) for policy in data]
+    print(f"\n총 {len(data)}개의 정책 처리를 시작합니다.")
+
+    parse_stats = StageStats("HTML 파싱")
+    with ProcessPoolExecutor(max_workers=parse_workers()) as pool:
+        parsed_list = []
+        for parsed in pool.map(parse_policy, data, chunksize=8):
+            parsed_list.append(parsed)
+            parse_stats.add()
+    parse_stats.report()
+
+    # 지역 분류: 체크포인트 -> 본문 해시 캐시 -> 지명 사전 규칙 순으로 확인하고, 규칙이 확신하지 못할 때만 LLM 호출
+    region_cache = RegionCache(REGION_CACHE_PATH)
+    region_stats = StageStats("지역 추출")
+    method_counts = {"checkpoint": 0, "cache": 0, "rule": 0, "llm": 0}
+    pending = []
+    for doc_id, parsed in zip(doc_ids, parsed_list):
+        region = checkpoint.regions.get(doc_id)
+        method = "checkpoint"
+        if region is None:
+            region_key = content_hash(parsed["title"] + "\n" + parsed["main_content"])
+            region, method = region_cache.get(region_key), "cache"
+            if region is None:
+                region, method = classify_region(parsed["title"], parsed["main_content"]), "rule"
+                if region is not None:
+                    region_cache.put(region_key, region, "rule")
+            if region is None:
+                pending.append((doc_id, region_key, parsed))
+                continue
+            checkpoint.record_region(doc_id, region)
+        method_counts[method] += 1
+        region_stats.add()
+        yield _build_document(file_path, doc_id, parsed, region)
+
+    if pending:
+        print(f"  LLM 지역 추출 대상 {len(pending)}개 (나머지 {len(data) - len(pending)}개는 규칙/캐시로 분류)")
+        with ThreadPoolExecutor(max_workers=region_workers()) as pool:
+            futures = {
+                pool.submit(_ask_llm_region, parsed["title"] + "\n" + parsed["main_content"], llm): (doc_id, region_key, parsed)
+                for doc_id, region_key, parsed in pending
+            }
+            for future in as_completed(futures):
+                doc_id, region_key, parsed = futures[future]
+                extracted_region = future.result()
+                method_counts["llm"] += 1
+                if extracted_region is None:
+                    # LLM 호출 실패는 캐시/체크포인트에 남기지 않아 다음 실행에서 다시 시도
+                    extracted_region = "전국"
+                else:
+                    region_cache.put(region_key, extracted_region, "llm")
+                    checkpoint.record_region(doc_id, extracted_region)
+                region_stats.add()
+                print(f"  ({region_stats.count}/{len(data)}) '{parsed['title']}' -> 추출된 지역: {extracted_region}")
+                yield _build_document(file_path, doc_id, parsed, extracted_region)
+    region_stats.report()
+    print(f"  지역 분류 방법: 체크포인트 {method_counts['checkpoint']}, 캐시 {method_counts['cache']}, "
+          f"규칙 {method_counts['rule']}, LLM {method_counts['llm']}")
+
+def load_and_process_json(file_path: str, llm: Runnable) -> list:
+    return list(iter_processed_documents(file_path, llm))
+
+# 저장된 문서 조각을 찾는 조건: doc_id 메타데이터, 또는 doc_id가 없던 예전 조각은 출처 + 제목 + 날짜
+def _stored_chunks_filter(docs: list) -> dict:
+    conditions = [{"doc_id": {"$in": [doc.id for doc in docs]}}]
+    for doc in docs:
+        conditions.append({"$and": [{key: doc.metadata[key]} for key in ("source", "title", "date")]})
+    return {"$or": conditions}
+
+# 처리된 문서를 조각으로 나눠 고정 크기 배치로 임베딩/저장하고, 저장이 끝난 문서는 체크포인트에 기록
+def embed_documents_in_batches(documents, db, checkpoint: IngestCheckpoint, batch_size: int | None = None) -> int:
+    batch_size = batch_size or embed_batch_size()
+    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
+    embed_stats = StageStats("임베딩")
+    chunk_total = 0
+    batch, batch_docs = [], []
+
+    def flush():
+        nonlocal chunk_total
+        if not batch:
+            return
+        # 다른 지역으로 저장된 적이 있는 문서는 예전 조각을 지우고 새 지역으로 다시 저장
+        replaced = [doc for doc in batch_docs if doc.id in checkpoint.embedded]
+        if replaced:
+            db.delete(where=_stored_chunks_filter(replaced))
+        db.add_documents(batch)
+        checkpoint.record_embedded({doc.id: doc.metadata["region"] for doc in batch_docs})
+        embed_stats.add(len(batch_docs))
+        chunk_total += len(batch)
+        print(f"  임베딩 배치 저장: 조각 {len(batch)}개 (누적 문서 {embed_stats.count}개)")
+        batch.clear()
+        batch_docs.clear()
+
+    for doc in documents:
+        if checkpoint.is_embedded(doc):
+            continue
+        chunks = text_splitter.split_documents([doc])
+        # 조각 id는 Chroma가 새로 부여하도록 원본 문서 id를 물려받지 않게 함
+        for chunk in chunks:
+            chunk.id = None
+        batch.extend(chunks)
+        batch_docs.append(doc)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+
+    embed_stats.report()
+    return chunk_total
 
 def main():
-    load_dotenv()
-    API_KEY = os.getenv("API_KEY")
-    MODEL_ID = os.getenv("MODEL_ID")
-    API_BASE = os.getenv("API_BASE")
-    if not API_KEY or not MODEL_ID or not API_BASE:
-        print("오류: .env 파일에 API_KEY, MODEL_ID, API_BASE를 설정해야 합니다.")
+    load_env()
+    # 지역 정보 추출에 사용할 LLM (공유 LLM 게이트웨이: 타임아웃, 재시도, 서킷 브레이커 적용)
+    try:
+        extraction_llm = create_chat_model("ingest", temperature=0)
+    except RuntimeError as e:
+        print(e)
         return
 
-    extraction_llm = ChatOpenAI(model_name=MODEL_ID, openai_api_key=API_KEY, openai_api_base=API_BASE, temperature=0)
-
     JSON_FILE_PATH = "crawling/notices_2025.json"
     if not os.path.exists(JSON_FILE_PATH):
         print(f"오류: '{JSON_FILE_PATH}' 파일을 찾을 수 없습니다.")
         return
-    
+
     DB_DIRECTORY = "./policy_chroma_db"
 
     # # 기존 DB 폴더 삭제 - 새로 만들기 위함
@@ -103,19 +299,27 @@ def main():
     #     print(f"기존 데이터베이스 폴더 '{DB_DIRECTORY}'를 삭제합니다.")
     #     shutil.rmtree(DB_DIRECTORY)
 
-    documents = load_and_process_json(JSON_FILE_PATH, extraction_llm)
-    
-    text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=100)
-    split_docs = text_splitter.split_documents(documents)
-    print(f"\n텍스트 분할 완료! (총 {len(split_docs)}개 조각)")
+    checkpoint = IngestCheckpoint.for_source(JSON_FILE_PATH)
+    if not os.path.exists(DB_DIRECTORY):
+        checkpoint.reset_embedded()
 
     print("\n로컬 임베딩 모델 로딩 시작...")
-    embeddings = SentenceTransformerEmbeddings(model_name="jhgan/ko-sbert-nli")
+    embeddings = get_embeddings()
     print("로컬 임베딩 모델 로딩 완료!")
-    
-    print("\n임베딩 및 ChromaDB 저장 시작...")
-    db = Chroma.from_documents(split_docs, embeddings, persist_directory=DB_DIRECTORY)
-    print(f"ChromaDB 저장 완료! ({DB_DIRECTORY} 폴더를 확인하세요)")
+
+    # 게시판 x 분기별 컬렉션(파티션)에 나눠 저장 (POLICY_PARTITIONED=0 이면 단일 컬렉션)
+    db = open_policy_store_for_ingest(DB_DIRECTORY, embeddings)
+
+    print("\n문서 처리, 임베딩 및 ChromaDB 저장 시작...")
+    documents = iter_processed_documents(JSON_FILE_PATH, extraction_llm, checkpoint)
+    chunk_total = embed_documents_in_batches(documents, db, checkpoint)
+    print(f"ChromaDB 저장 완료! (새 조각 {chunk_total}개, {DB_DIRECTORY} 폴더를 확인하세요)")
+    # 보존 기간(POLICY_RETENTION_QUARTERS)이 지난 분기 파티션 삭제
+    compact_policy_store(db)
+
+    # 하이브리드 검색용 BM25 색인을 수집 시점에 미리 만들어 둠
+    load_or_build_bm25_index(db, DB_DIRECTORY)
+    notify_index_updated(DB_DIRECTORY)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,18 +1,79 @@
+import json
+import time
+import asyncio
 import uvicorn
-from fastapi import FastAPI
-from pydantic import BaseModel
-from typing import Optional
+from contextlib import asynccontextmanager
+from fastapi import BackgroundTasks, FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse, Response, StreamingResponse
+from starlette.background import BackgroundTask
+from pydantic import BaseModel, Field
+from typing import List, Optional
 
-from diary_ai.diary_ai_main import analyze_diary_entry
-from policy_recommend.policy_rec import get_policy_recommendations
-from TTS_gen.tts_generator import create_and_upload_tts as create_korean_tts
+from core.concurrency import endpoint_limit, run_in_pool, shutdown_pools
+from core.llm import get_llm_gateway
+from core.metrics import HTTP_REQUEST_DURATION, render_metrics
+from core.registry import registry
+from core.settings import load_env
+from diary_ai.diary_ai_main import aanalyze_diary_entries, astream_diary_analysis
+from diary_ai.diary_batcher import DiaryMicroBatcher
+from policy_recommend.policy_rec import aget_policy_recommendations
+from TTS_gen.tts_batch import TTS_BATCH_MAX_TEXTS, agenerate_phrase_pack, preload_manifest
+from TTS_gen.tts_generator import (
+    get_cached_audio,
+    get_or_create_tts,
+    get_or_synthesize_audio,
+    get_tts_key,
+    split_tts_chunks,
+    store_synthesized_audio,
+    synthesize_text_audio,
+    tts_cache,
+)
 
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # .env는 설정 값을 읽는 다른 코드(워밍업 스레드, 배처, 스레드 풀)보다 먼저 한 번만 읽음
+    load_env()
+    # 임베딩 모델, ChromaDB, LLM 체인, GCP 클라이언트는 서버 시작을 막지 않고 백그라운드에서 각각 생성
+    # 하나가 실패해도 해당 기능만 사용할 수 없고 나머지 기능은 정상 동작
+    app.state.started_at = time.perf_counter()
+    registry.warm_up_in_background()
+    # 미리 생성해 둔 TTS 문구는 네트워크 호출 없이 바로 URL을 반환하도록 메모리 캐시에 등록
+    preload_manifest()
+    app.state.diary_batcher = DiaryMicroBatcher()
+    app.state.diary_batcher.start()
+    yield
+    await app.state.diary_batcher.stop()
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
+
+# 엔드포인트별 응답 시간 기록 - 라벨은 요청 경로가 아니라 라우트 템플릿 (예: /api/v1/tts/audio/{key})
+# 등록되지 않은 경로는 하나로 묶어 라벨 수가 늘어나지 않게 하고, 스트리밍 응답은 첫 응답이 나갈 때까지의 시간만 기록됨
+@app.middleware("http")
+async def record_request_duration(request: Request, call_next):
+    started_at = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        # 라우터가 요청을 처리하면서 scope에 일치한 라우트를 기록함
+        route = request.scope.get("route")
+        HTTP_REQUEST_DURATION.observe(
+            time.perf_counter() - started_at,
+            method=request.method,
+            path=getattr(route, "path", "unmatched"),
+            status=str(status_code),
+        )
 
 # 입력 데이터 형식을 Pydantic으로 정의
 class DiaryInput(BaseModel):
     diary_text: str
 
+class DiaryBatchInput(BaseModel):
+    diary_texts: List[str]
+
 class UserProfile(BaseModel):
     name: str
     nationality: str
@@ -24,35 +85,183 @@ class UserProfile(BaseModel):
 
 class TTSInput(BaseModel):
     text: str
+    # url: GCS 업로드 후 공개 URL 반환 / local: 합성 직후 서버 메모리에서 제공하는 URL 반환 (업로드는 백그라운드)
+    mode: str = "url"
+
+class TTSBatchInput(BaseModel):
+    # 요청 하나가 TTS 스레드 풀과 합성 할당량을 오래 차지하지 않도록 문구 수를 제한 (넘으면 422)
+    texts: List[str] = Field(max_length=TTS_BATCH_MAX_TEXTS)
 
 # API 엔드포인트(라우터) 정의
+# 엔드포인트별 동시 처리 한도는 DIARY_MAX_CONCURRENCY, POLICY_MAX_CONCURRENCY, TTS_MAX_CONCURRENCY 환경 변수로 조정
 @app.post("/api/v1/diary/analyze")
 # 일기 내용을 받아 AI 분석을 수행하고 결과를 반환하는 API
-def handle_diary_analysis(request: DiaryInput):
+async def handle_diary_analysis(request: DiaryInput):
     diary_text = request.diary_text
-    result = analyze_diary_entry(diary_text)
+    # 동시에 들어온 단일 요청들은 마이크로 배처가 모아서 한 번에 처리
+    async with endpoint_limit("diary"):
+        result = await app.state.diary_batcher.submit(diary_text)
     return result
 
+@app.post("/api/v1/diary/analyze/batch")
+# 여러 개의 일기를 한 번에 받아 분석 결과 리스트를 반환하는 API (실패한 항목은 null)
+async def handle_diary_batch_analysis(request: DiaryBatchInput):
+    async with endpoint_limit("diary"):
+        results = await aanalyze_diary_entries(request.diary_texts, max_concurrency=app.state.diary_batcher.max_concurrency)
+    return {"results": results}
+
+# Server-Sent Events 형식의 메시지 한 개
+def _sse_message(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/api/v1/diary/analyze/stream")
+# 일기 분석 결과를 SSE로 스트리밍하는 API - 완성된 필드부터 바로 전송해 첫 응답까지의 시간을 줄임
+async def handle_diary_analysis_stream(request: DiaryInput):
+    async def event_stream():
+        async with endpoint_limit("diary"):
+            async for event, data in astream_diary_analysis(request.diary_text):
+                yield _sse_message(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
 @app.post("/api/v1/policy/recommend")
 # 사용자 프로필을 받아 맞춤형 정책을 추천하는 API
-def recommend_policies_for_user(user_profile: UserProfile):
+async def recommend_policies_for_user(user_profile: UserProfile):
     profile_dict = user_profile.dict()
-    result = get_policy_recommendations(profile_dict)
+    async with endpoint_limit("policy"):
+        result = await aget_policy_recommendations(profile_dict)
     return result
 
 @app.post("/api/v1/tts/generate")
 # 한국어 텍스트를 받아 TTS 오디오 파일을 생성하고 결과를 반환하는 API
-def handle_tts_generation(request: TTSInput):
+async def handle_tts_generation(request: TTSInput, background_tasks: BackgroundTasks):
     korean_text = request.text
-    output_filename = f"{hash(korean_text)}.mp3"
-    
-    success = create_korean_tts(text=korean_text, filename=output_filename)
+
+    if request.mode == "local":
+        return await _generate_local_tts(korean_text, background_tasks)
+
+    # 파일 이름은 텍스트와 음성 설정의 해시로 정해지는 콘텐츠 주소 캐시 키를 사용
+    # 블로킹 GCP 클라이언트 호출은 TTS 전용 스레드 풀에서 실행
+    async with endpoint_limit("tts"):
+        success = await run_in_pool("tts", get_or_create_tts, text=korean_text)
     
     if success:
         return {"status": "success", "url": success}
     else:
         return {"status": "error", "message": "TTS 파일 생성에 실패했습니다."}
 
+_TTS_ERROR = {"status": "error", "message": "TTS 파일 생성에 실패했습니다."}
+
+# 이미 업로드된 오디오는 공개 URL을, 아니면 합성 직후 로컬 URL을 반환하고 GCS 업로드는 응답 후에 진행
+async def _generate_local_tts(text: str, background_tasks: BackgroundTasks):
+    key = get_tts_key(text)
+    url = tts_cache.known_url(key)
+    if url:
+        return {"status": "success", "url": url}
+    try:
+        async with endpoint_limit("tts"):
+            audio = await run_in_pool("tts", synthesize_text_audio, text)
+    except Exception as e:
+        print(f"오디오 생성 중 오류가 발생했습니다: {e}")
+        return _TTS_ERROR
+    background_tasks.add_task(run_in_pool, "tts", store_synthesized_audio, text, audio)
+    return {"status": "success", "url": f"/api/v1/tts/audio/{key}"}
+
+@app.get("/api/v1/tts/audio/{key}")
+# 서버 메모리/디스크 캐시에 있는 오디오를 바로 반환하는 API (mode=local 응답의 URL)
+async def get_tts_audio(key: str):
+    audio = await run_in_pool("tts", get_cached_audio, key)
+    if audio is None:
+        return JSONResponse(status_code=404, content={"status": "error", "message": "오디오를 찾을 수 없습니다."})
+    return Response(content=audio, media_type="audio/mpeg")
+
+@app.post("/api/v1/tts/stream")
+# 합성한 MP3를 URL 대신 응답 본문으로 바로 스트리밍하는 API
+# 긴 텍스트는 문장 단위로 나눠 첫 문장부터 보내고, 전체 오디오의 GCS 업로드는 스트리밍이 끝난 뒤 백그라운드에서 진행
+async def handle_tts_stream(request: TTSInput):
+    text = request.text
+    key = get_tts_key(text)
+    audio = await run_in_pool("tts", get_cached_audio, key)
+    if audio is not None:
+        return Response(content=audio, media_type="audio/mpeg")
+
+    chunks = split_tts_chunks(text)
+    if not chunks:
+        return JSONResponse(status_code=400, content={"status": "error", "message": "변환할 텍스트가 없습니다."})
+
+    # 첫 조각은 응답을 시작하기 전에 합성해, 실패하면 오디오 대신 오류 JSON을 반환
+    try:
+        async with endpoint_limit("tts"):
+            first_audio = await run_in_pool("tts", get_or_synthesize_audio, chunks[0])
+    except Exception as e:
+        print(f"오디오 생성 중 오류가 발생했습니다: {e}")
+        return JSONResponse(status_code=502, content=_TTS_ERROR)
+
+    parts = [first_audio]
+
+    def synthesize_next(i):
+        return asyncio.ensure_future(run_in_pool("tts", get_or_synthesize_audio, chunks[i])) if i < len(chunks) else None
+
+    async def audio_stream():
+        async with endpoint_limit("tts"):
+            # 현재 조각을 보내는 동안 다음 조각을 미리 합성
+            pending = synthesize_next(1)
+            yield first_audio
+            for i in range(1, len(chunks)):
+                audio = await pending
+                pending = synthesize_next(i + 1)
+                parts.append(audio)
+                yield audio
+
+    # 모든 조각을 보낸 경우에만 전체 오디오를 업로드 (중간에 끊기면 다음 요청에서 다시 합성)
+    async def upload_after_stream():
+        if len(parts) == len(chunks):
+            await run_in_pool("tts", store_synthesized_audio, text, b"".join(parts))
+
+    return StreamingResponse(
+        audio_stream(),
+        media_type="audio/mpeg",
+        headers={"X-TTS-Key": key},
+        background=BackgroundTask(upload_after_stream),
+    )
+
+@app.post("/api/v1/tts/batch")
+# 여러 문구를 한 번에 받아 동시에 TTS 오디오를 생성하고 {텍스트, URL} 리스트를 반환하는 API (실패한 항목은 url이 null)
+async def handle_tts_batch_generation(request: TTSBatchInput):
+    async with endpoint_limit("tts"):
+        urls = await agenerate_phrase_pack(request.texts)
+    return {"results": [{"text": text, "url": url} for text, url in urls.items()]}
+
+@app.get("/api/v1/health/ready")
+# 서비스별 준비 상태와 생성에 걸린 시간을 확인하는 readiness API
+# 아직 생성 중인 서비스가 있으면 503, 실패한 서비스가 있으면 degraded (해당 기능만 사용 불가)
+def readiness_check():
+    services = registry.status()
+    states = {status["state"] for status in services.values()}
+    if states & {"pending", "loading"}:
+        status = "loading"
+    elif "failed" in states:
+        status = "degraded"
+    else:
+        status = "ready"
+    content = {
+        "status": status,
+        "uptime_seconds": round(time.perf_counter() - app.state.started_at, 3),
+        "services": services,
+        # LLM 서킷 브레이커 상태 (open이면 LLM 기능이 잠시 바로 실패 처리됨)
+        "llm": get_llm_gateway().status(),
+    }
+    return JSONResponse(status_code=503 if status == "loading" else 200, content=content)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+# 단계별 소요 시간, LLM 토큰 사용량, 캐시 적중률을 Prometheus 텍스트 형식으로 반환
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
 # 4. 서버 실행
 if __name__ == "__main__":
     # uvicorn.run("파일이름:app객체이름", ...)
@@ -0,0 +1,163 @@
+import os
+import json
+import threading
+from itertools import product
+
+from langchain_core.documents import Document
+
+from policy_recommend.policy_cache import AGE_BUCKET_SIZE, CHILD_AGE_BUCKETS, get_db_version
+
+DEFAULT_INDEX_PATH = "./policy_cohort_index.json"
+
+# 미리 계산할 사용자 집단(cohort) 범위 - 국적 목록은 COHORT_NATIONALITIES(쉼표 구분)로 조정 가능
+DEFAULT_NATIONALITIES = ["베트남", "중국", "필리핀", "일본", "캄보디아", "태국", "몽골", "우즈베키스탄"]
+COHORT_AGE_RANGE = (20, 60)
+NO_CHILD_LABEL = "없음"
+ADULT_CHILD_LABEL = "성인"
+
+def _key_to_str(key: tuple) -> str:
+    return "|".join("" if part is None else str(part) for part in key)
+
+def _str_to_key(text: str) -> tuple:
+    return tuple(part or None for part in text.split("|"))
+
+# 정규화된 프로필 키(국적, 나이 구간, 지역, 자녀 나이 구간)로 검색어 문장을 만듦
+# 이름은 검색과 무관하므로 넣지 않고, 나이도 구간으로 표현해 같은 집단은 항상 같은 검색어가 되도록 함
+def build_cohort_query(key: tuple) -> str:
+    nationality, age_bucket, region, child_bucket = key
+    age_text = f"{age_bucket.replace('-', '~')}세 " if age_bucket else ""
+    query = (
+        f"{nationality} 국적의 "
+        f"{age_text}여성입니다. "
+        f"현재 {region}에 거주하고 있습니다."
+    )
+    if child_bucket and child_bucket != NO_CHILD_LABEL:
+        return query + f" {child_bucket} 자녀를 둔 어머니입니다."
+    return query + " 자녀는 없습니다."
+
+def _doc_to_dict(doc: Document) -> dict:
+    return {"page_content": doc.page_content, "metadata": doc.metadata}
+
+def _dict_to_doc(data: dict) -> Document:
+    return Document(page_content=data["page_content"], metadata=data["metadata"])
+
+
+# 사용자 집단별 검색 결과(top-k 문서)를 미리 계산해 두는 인덱스
+# 요청 시에는 임베딩 추론과 벡터 검색 없이 딕셔너리 조회만 하면 됨. ChromaDB가 바뀌면 다시 계산
+class CohortIndex:
+    def __init__(self, engine, db_directory: str, path: str = DEFAULT_INDEX_PATH):
+        self.engine = engine
+        self.db_directory = db_directory
+        self.path = path
+        self._cohorts = {}
+        self._db_version = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    # 현재 ChromaDB 버전과 같은 인덱스 파일이 있으면 읽어옴
+    def load(self) -> bool:
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        version = tuple(data["db_version"]) if data.get("db_version") else None
+        if version != get_db_version(self.db_directory):
+            return False
+        with self._lock:
+            self._cohorts = {
+                _str_to_key(key): [_dict_to_doc(doc) for doc in docs]
+                for key, docs in data["cohorts"].items()
+            }
+            self._db_version = version
+        print(f"사용자 집단 검색 인덱스 로드 완료! ({len(self._cohorts)}개 집단)")
+        return True
+
+    def save(self):
+        with self._lock:
+            data = {
+                "db_version": list(self._db_version) if self._db_version else None,
+                "cohorts": {
+                    _key_to_str(key): [_doc_to_dict(doc) for doc in docs]
+                    for key, docs in self._cohorts.items()
+                },
+            }
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+    # 미리 계산할 집단 목록: 국적 x 나이 구간 x DB에 있는 지역 x 자녀 나이 구간
+    def default_cohorts(self) -> list:
+        nationalities = [n.strip() for n in os.getenv("COHORT_NATIONALITIES", ",".join(DEFAULT_NATIONALITIES)).split(",") if n.strip()]
+        age_buckets = [
+            f"{low}-{low + AGE_BUCKET_SIZE - 1}"
+            for low in range(COHORT_AGE_RANGE[0], COHORT_AGE_RANGE[1], AGE_BUCKET_SIZE)
+        ]
+        regions = self.engine.regions()
+        child_buckets = [NO_CHILD_LABEL] + [label for _, _, label in CHILD_AGE_BUCKETS] + [ADULT_CHILD_LABEL]
+        return [
+            (nationality.lower(), age_bucket, region, child_bucket)
+            for nationality, age_bucket, region, child_bucket in product(nationalities, age_buckets, regions, child_buckets)
+        ]
+
+    # 모든 집단의 검색어를 한 번에 배치 임베딩한 뒤, 집단별 top-k 문서를 검색해 저장
+    def build(self, cohorts: list | None = None):
+        version = get_db_version(self.db_directory)
+        cohorts = cohorts if cohorts is not None else self.default_cohorts()
+        print(f"사용자 집단 검색 인덱스 생성 중... ({len(cohorts)}개 집단)")
+        queries = [build_cohort_query(key) for key in cohorts]
+        embeddings = self.engine.embed_documents(queries)
+        built = {}
+        for key, query, embedding in zip(cohorts, queries, embeddings):
+            built[key] = self.engine.retrieve({"question": query, "region": key[2], "embedding": embedding})
+        with self._lock:
+            self._cohorts = built
+            self._db_version = version
+        self.save()
+        print("사용자 집단 검색 인덱스 생성 완료!")
+
+    # 미리 계산하지 않고 빈 인덱스로 시작 (요청 시 검색한 결과만 채워짐)
+    def reset(self):
+        with self._lock:
+            self._cohorts = {}
+            self._db_version = get_db_version(self.db_directory)
+
+    # 인덱스 파일을 읽고, 없거나 오래됐으면 새로 생성
+    def ensure_built(self):
+        if not self.load():
+            self.build()
+
+    def _refresh_in_background(self):
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+            self._cohorts = {}
+        print("ChromaDB 변경 감지: 사용자 집단 검색 인덱스를 다시 계산합니다.")
+
+        def run():
+            try:
+                self.build()
+            except Exception as e:
+                print(f"사용자 집단 검색 인덱스 갱신 실패: {e}")
+            finally:
+                with self._lock:
+                    self._building = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+    # 집단의 검색 결과를 반환. 없거나 DB가 바뀌었으면 None (DB 변경 시 백그라운드에서 다시 계산)
+    def lookup(self, key: tuple) -> list | None:
+        if get_db_version(self.db_directory) != self._db_version:
+            if self._db_version is not None:
+                self._refresh_in_background()
+            return None
+        with self._lock:
+            docs = self._cohorts.get(key)
+            return list(docs) if docs is not None else None
+
+    # 미리 계산하지 않은 집단은 처음 검색한 결과를 저장해 다음부터 재사용
+    def add(self, key: tuple, docs: list):
+        with self._lock:
+            if self._db_version is not None and self._db_version == get_db_version(self.db_directory):
+                self._cohorts[key] = list(docs)
@@ -0,0 +1,110 @@
+import os
+import re
+from functools import lru_cache
+
+from policy_recommend.hybrid_retriever import tokenize
+
+DEFAULT_TOKEN_BUDGET = 900
+TIKTOKEN_ENCODING = "cl100k_base"
+
+# 문의처 줄로 볼 연락처 형식 (전화번호 02-123-4567, 1577-1366 또는 이메일)
+CONTACT_PATTERN = r"(\d{2,4}[-.)\s]\d{3,4}[-.\s]\d{4}|\d{4}-\d{4}|[\w.+-]+@[\w-]+(\.[\w-]+)+)"
+
+# 정책 본문에서 추천에 도움이 되지 않는 상투적인 줄 (첨부파일 목록, 문의처, 게시판 이동 링크 등)
+# 문의처 줄은 '문의:'처럼 콜론이 있거나 바로 뒤에 전화번호/이메일이 올 때만 제거 ('문의하세요', '전화 상담 지원' 같은 본문은 유지)
+BOILERPLATE_PATTERNS = [
+    re.compile(r"^첨부파일\s*:"),
+    re.compile(rf"^(※\s*)?(문의처?|담당자|연락처|전화번호|전화|팩스|이메일)\s*([:：]|{CONTACT_PATTERN})"),
+    re.compile(r"^(이전글|다음글|목록|출처|게시일|조회수)\b"),
+    re.compile(r"^https?://\S+$"),
+    re.compile(r"^[-=_*·•]{3,}$"),
+]
+SENTENCE_SPLIT_PATTERN = re.compile(r"(?<=[.!?。])\s+|(?<=다\.)|\n+")
+
+
+@lru_cache(maxsize=1)
+def _get_encoding():
+    try:
+        import tiktoken
+        return tiktoken.get_encoding(TIKTOKEN_ENCODING)
+    except Exception as e:
+        print(f"tiktoken 인코딩을 불러오지 못해 글자 수로 토큰을 추정합니다: {e}")
+        return None
+
+# 토큰 수 계산 (tiktoken을 쓸 수 없으면 한국어 기준 대략 2글자당 1토큰으로 추정)
+def count_tokens(text: str) -> int:
+    encoding = _get_encoding()
+    if encoding is None:
+        return (len(text) + 1) // 2
+    return len(encoding.encode(text))
+
+def _is_boilerplate(line: str) -> bool:
+    return any(pattern.search(line) for pattern in BOILERPLATE_PATTERNS)
+
+def _split_sentences(text: str) -> list:
+    return [sentence.strip() for sentence in SENTENCE_SPLIT_PATTERN.split(text) if sentence and sentence.strip()]
+
+def _format_doc(title: str, content: str) -> str:
+    return f"정책 제목: {title}\n내용: {content}"
+
+
+# 검색된 문서를 프롬프트에 넣기 전에 압축
+# 1) 상투적인 줄과 문서 사이의 중복 줄 제거
+# 2) 검색어와 겹치는 단어가 많은 문장 위주로 추림 (원래 순서 유지)
+# 3) 전체 컨텍스트가 토큰 예산(POLICY_CONTEXT_TOKEN_BUDGET)을 넘지 않도록 문서별로 나눠 채움
+# 반환값: (컨텍스트 문자열, 절감 통계)
+def pack_context(query: str, docs: list, token_budget: int | None = None) -> tuple:
+    token_budget = token_budget or int(os.getenv("POLICY_CONTEXT_TOKEN_BUDGET", DEFAULT_TOKEN_BUDGET))
+    original_text = "\n\n".join(_format_doc(doc.metadata.get('title', '제목 없음'), doc.page_content) for doc in docs)
+    original_tokens = count_tokens(original_text)
+
+    query_terms = set(tokenize(query))
+    seen_lines = set()
+    remaining_budget = token_budget
+    packed_parts = []
+
+    for doc_index, doc in enumerate(docs):
+        # 앞 문서가 다 쓰지 않은 예산은 뒤 문서들이 나눠 씀
+        per_doc_budget = remaining_budget // (len(docs) - doc_index)
+        title = doc.metadata.get('title', '제목 없음')
+        # 제목 머리말도 문서 예산에 포함 - 머리말조차 들어가지 않으면 이 문서는 넣지 않고 예산도 쓰지 않음
+        remaining = per_doc_budget - count_tokens(_format_doc(title, ""))
+        if remaining < 0:
+            continue
+        lines = []
+        for line in doc.page_content.splitlines():
+            line = line.strip()
+            if not line or _is_boilerplate(line) or line in seen_lines:
+                continue
+            seen_lines.add(line)
+            lines.append(line)
+
+        sentences = _split_sentences("\n".join(lines))
+        # 검색어와 제목에 나온 단어를 함께 고려해 관련도 계산
+        relevant_terms = query_terms | set(tokenize(title))
+        ranked = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(relevant_terms & set(tokenize(sentences[i]))), i),
+        )
+
+        selected = []
+        for i in ranked:
+            cost = count_tokens(sentences[i]) + 1
+            if cost > remaining:
+                continue
+            selected.append(i)
+            remaining -= cost
+        content = " ".join(sentences[i] for i in sorted(selected))
+        packed_parts.append(_format_doc(title, content))
+        remaining_budget -= per_doc_budget - remaining
+
+    packed_text = "\n\n".join(packed_parts)
+    packed_tokens = count_tokens(packed_text)
+    stats = {
+        "original_tokens": original_tokens,
+        "packed_tokens": packed_tokens,
+        "saved_tokens": max(original_tokens - packed_tokens, 0),
+        "saved_ratio": max(round(1 - packed_tokens / original_tokens, 3), 0.0) if original_tokens else 0.0,
+        "token_budget": token_budget,
+    }
+    return packed_text, stats
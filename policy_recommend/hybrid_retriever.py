@@ -0,0 +1,134 @@
+import os
+import re
+import json
+import math
+import hashlib
+from collections import Counter, defaultdict
+
+from langchain_core.documents import Document
+
+from policy_recommend.policy_cache import get_db_version
+
+DEFAULT_INDEX_PATH = "./policy_bm25_index.json"
+
+BM25_K1 = 1.5
+BM25_B = 0.75
+# Reciprocal Rank Fusion 상수 (순위 차이의 영향을 완화)
+RRF_K = 60
+
+TOKEN_PATTERN = re.compile(r"[가-힣]+|[A-Za-z]+|[0-9]+")
+HANGUL_PATTERN = re.compile(r"[가-힣]+")
+
+# 한국어 토큰화: 어절 단위 토큰 + 한글 글자 바이그램
+# (조사가 붙은 '결혼이민자에게'도 '결혼', '이민', '민자' 등으로 '결혼이민자'와 겹치게 됨)
+def tokenize(text: str) -> list:
+    tokens = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        tokens.append(token)
+        if HANGUL_PATTERN.fullmatch(token) and len(token) > 2:
+            tokens.extend(token[i:i + 2] for i in range(len(token) - 1))
+    return tokens
+
+def doc_key(doc: Document) -> str:
+    return hashlib.sha256((doc.metadata.get("title", "") + "\x1f" + doc.page_content).encode("utf-8")).hexdigest()
+
+
+# ChromaDB 문서로 만드는 BM25 역색인 (정확한 용어 매칭: 다문화, 결혼이민자, 보육료 등)
+class BM25Index:
+    def __init__(self, documents: list, db_version=None):
+        self.documents = documents
+        self.db_version = db_version
+        self.doc_lengths = []
+        self.postings = defaultdict(list)
+        for idx, doc in enumerate(documents):
+            counts = Counter(tokenize(doc.metadata.get("title", "") + "\n" + doc.page_content))
+            self.doc_lengths.append(sum(counts.values()))
+            for term, tf in counts.items():
+                self.postings[term].append((idx, tf))
+        self.avg_length = (sum(self.doc_lengths) / len(self.doc_lengths)) if self.doc_lengths else 0.0
+
+    @classmethod
+    def from_chroma(cls, db, db_directory: str):
+        data = db.get(include=["documents", "metadatas"])
+        documents = [
+            Document(page_content=text, metadata=metadata or {})
+            for text, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return cls(documents, get_db_version(db_directory))
+
+    def save(self, path: str = DEFAULT_INDEX_PATH):
+        data = {
+            "db_version": list(self.db_version) if self.db_version else None,
+            "documents": [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in self.documents],
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str = DEFAULT_INDEX_PATH):
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        documents = [Document(page_content=d["page_content"], metadata=d["metadata"]) for d in data["documents"]]
+        return cls(documents, tuple(data["db_version"]) if data.get("db_version") else None)
+
+    def search(self, query: str, k: int, regions: list | None = None) -> list:
+        n_docs = len(self.documents)
+        if n_docs == 0:
+            return []
+        scores = defaultdict(float)
+        for term in set(tokenize(query)):
+            postings = self.postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for idx, tf in postings:
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * self.doc_lengths[idx] / self.avg_length)
+                scores[idx] += idf * tf * (BM25_K1 + 1) / (tf + norm)
+        ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+        results = []
+        for idx, _ in ranked:
+            doc = self.documents[idx]
+            if regions is not None and doc.metadata.get("region") not in regions:
+                continue
+            results.append(doc)
+            if len(results) >= k:
+                break
+        return results
+
+
+# 인덱스 파일이 현재 ChromaDB와 같은 버전이면 읽고, 아니면 ChromaDB 문서로 새로 만들어 저장
+def load_or_build_bm25_index(db, db_directory: str, path: str = DEFAULT_INDEX_PATH) -> BM25Index:
+    if os.path.exists(path):
+        index = BM25Index.load(path)
+        if index.db_version == get_db_version(db_directory):
+            return index
+    print("BM25 색인 생성 중...")
+    index = BM25Index.from_chroma(db, db_directory)
+    index.save(path)
+    print(f"BM25 색인 생성 완료! (문서 {len(index.documents)}개)")
+    return index
+
+# 여러 검색 결과 순위를 Reciprocal Rank Fusion으로 합치고, 같은 정책 제목의 조각은 가장 순위가 높은 것 하나만 남김
+def fuse_results(result_lists: list, k: int) -> list:
+    scores = defaultdict(float)
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results):
+            key = doc_key(doc)
+            scores[key] += 1.0 / (RRF_K + rank + 1)
+            docs.setdefault(key, doc)
+
+    fused = []
+    seen_titles = set()
+    for key, _ in sorted(scores.items(), key=lambda item: item[1], reverse=True):
+        doc = docs[key]
+        title = doc.metadata.get("title") or key
+        if title in seen_titles:
+            continue
+        seen_titles.add(title)
+        fused.append(doc)
+        if len(fused) >= k:
+            break
+    return fused
@@ -0,0 +1,237 @@
+import os
+import re
+import argparse
+from collections import defaultdict
+
+from core.settings import load_env
+from policy_recommend.policy_cache import get_db_version
+
+# 예전 방식(컬렉션 하나)으로 만든 DB의 컬렉션 이름 (langchain Chroma 기본값)
+LEGACY_COLLECTION = "langchain"
+PARTITION_PREFIX = "policy_"
+UNDATED = "undated"
+# 가장 최근 분기를 포함해 검색에 사용할 분기 수 - 이보다 오래된 분기 파티션은 만료 (0이면 만료 없음)
+DEFAULT_RETENTION_QUARTERS = 4
+MIGRATE_BATCH_SIZE = 1000
+
+# 수집 게시판 (policy_recommend/url.js의 boardSeq, menuSeq)
+BOARDS = {
+    "agency": {"name": "기관소식", "board_seq": 47, "menu_seq": 7100},
+    "external": {"name": "타기관소식", "board_seq": 2, "menu_seq": 282},
+}
+DATE_PATTERN = re.compile(r"(\d{4})\D?(\d{1,2})")
+PARTITION_PATTERN = re.compile(rf"{PARTITION_PREFIX}([a-z]+)_(\d{{4}}q[1-4]|{UNDATED})")
+
+
+# 크롤링 파일 이름으로 게시판 구분 (타기관_notices_2025.json -> 타기관소식, notices_2025.json -> 기관소식)
+def board_for_source(source: str | None) -> str:
+    return "external" if os.path.basename(source or "").startswith("타기관") else "agency"
+
+# '2025-07-16' -> '2025q3' (날짜가 없거나 형식이 다르면 undated)
+def quarter_for_date(value) -> str:
+    match = DATE_PATTERN.match(str(value or "").strip())
+    if not match or not 1 <= int(match.group(2)) <= 12:
+        return UNDATED
+    return f"{match.group(1)}q{(int(match.group(2)) - 1) // 3 + 1}"
+
+# 문서가 들어갈 파티션(컬렉션) 이름: policy_<게시판>_<연도>q<분기>
+def partition_name(metadata: dict) -> str:
+    return f"{PARTITION_PREFIX}{board_for_source(metadata.get('source'))}_{quarter_for_date(metadata.get('date'))}"
+
+def _quarter_index(name: str) -> int | None:
+    match = PARTITION_PATTERN.fullmatch(name)
+    if not match or match.group(2) == UNDATED:
+        return None
+    year, quarter = match.group(2).split("q")
+    return int(year) * 4 + int(quarter) - 1
+
+# 만료되지 않은 파티션 목록
+# 기준은 현재 날짜가 아니라 가장 최근 분기 - 크롤링이 잠시 멈춰도 검색할 정책이 모두 사라지지 않도록 함
+# 날짜가 없는 정책의 파티션은 항상 사용
+def select_active_partitions(names: list, retention_quarters: int) -> list:
+    indexes = {name: _quarter_index(name) for name in names}
+    dated = [index for index in indexes.values() if index is not None]
+    if retention_quarters <= 0 or not dated:
+        return list(names)
+    oldest = max(dated) - retention_quarters + 1
+    return [name for name in names if indexes[name] is None or indexes[name] >= oldest]
+
+
+# 게시판 x 분기로 나눈 ChromaDB 컬렉션들을 하나의 벡터 저장소처럼 사용
+# - 검색: 만료되지 않은 파티션에만 같은 검색을 보내고, 거리 순으로 합쳐 상위 k개 반환
+# - 저장: 문서 메타데이터(source, date)로 파티션을 정해 저장
+# - 만료: 오래된 분기 파티션은 컬렉션째 삭제 (HNSW 인덱스가 계속 커지지 않도록)
+# LocalRetriever, BM25 색인, 수집 스크립트가 쓰는 Chroma 메서드(get, add_documents, delete, similarity_search...)를 같은 형태로 제공
+class PartitionedPolicyStore:
+    def __init__(self, db_directory: str, embedding_function=None, retention_quarters: int | None = None):
+        import chromadb
+
+        self.db_directory = db_directory
+        self.embedding_function = embedding_function
+        if retention_quarters is None:
+            retention_quarters = int(os.getenv("POLICY_RETENTION_QUARTERS", DEFAULT_RETENTION_QUARTERS))
+        self.retention_quarters = retention_quarters
+        self._client = chromadb.PersistentClient(path=db_directory)
+        self._collections = {}
+        self._partitions = (None, [])
+
+    def _collection(self, name: str):
+        from langchain_community.vectorstores import Chroma
+
+        if name not in self._collections:
+            self._collections[name] = Chroma(client=self._client, collection_name=name, embedding_function=self.embedding_function)
+        return self._collections[name]
+
+    def _collection_names(self) -> list:
+        return [getattr(collection, "name", collection) for collection in self._client.list_collections()]
+
+    # 파티션 목록은 ChromaDB 파일이 바뀔 때만 다시 조회
+    def partitions(self) -> list:
+        version = get_db_version(self.db_directory)
+        if self._partitions[0] != version or version is None:
+            names = sorted(name for name in self._collection_names() if PARTITION_PATTERN.fullmatch(name))
+            self._partitions = (version, names)
+        return list(self._partitions[1])
+
+    def active_partitions(self) -> list:
+        return select_active_partitions(self.partitions(), self.retention_quarters)
+
+    def similarity_search_by_vector(self, embedding, k: int = 4, filter: dict | None = None, **kwargs) -> list:
+        scored = []
+        for name in self.active_partitions():
+            scored.extend(self._collection(name).similarity_search_by_vector_with_relevance_scores(embedding, k=k, filter=filter))
+        # 모든 파티션이 같은 임베딩 모델과 거리 함수를 쓰므로 거리를 그대로 비교할 수 있음
+        scored.sort(key=lambda item: item[1])
+        return [doc for doc, _ in scored[:k]]
+
+    def similarity_search(self, query: str, k: int = 4, filter: dict | None = None, **kwargs) -> list:
+        return self.similarity_search_by_vector(self.embedding_function.embed_query(query), k=k, filter=filter)
+
+    # 검색과 같은 범위를 보도록 만료되지 않은 파티션에서만 조회 (BM25 색인, 지역 목록에 만료된 정책이 섞이지 않도록)
+    def get(self, where: dict | None = None, include: list | None = None, limit: int | None = None) -> dict:
+        include = ["documents", "metadatas"] if include is None else include
+        result = {"ids": [], "documents": [], "metadatas": []}
+        for name in self.active_partitions():
+            data = self._collection(name).get(where=where, include=include, limit=limit)
+            for key in result:
+                result[key].extend(data.get(key) or [])
+            if limit is not None and len(result["ids"]) >= limit:
+                break
+        if limit is not None:
+            result = {key: values[:limit] for key, values in result.items()}
+        return result
+
+    def add_documents(self, documents: list, ids: list | None = None) -> list:
+        groups = defaultdict(list)
+        for i, doc in enumerate(documents):
+            groups[partition_name(doc.metadata)].append(i)
+        added = []
+        for name, indexes in groups.items():
+            kwargs = {"ids": [ids[i] for i in indexes]} if ids is not None else {}
+            added.extend(self._collection(name).add_documents([documents[i] for i in indexes], **kwargs))
+        return added
+
+    # 조각 ID나 메타데이터 조건으로는 파티션을 알 수 없으므로 모든 파티션에서 삭제
+    def delete(self, ids: list | None = None, where: dict | None = None):
+        for name in self.partitions():
+            self._collection(name).delete(ids=ids, where=where)
+
+    # 저장하기 전에 이미 만료된 분기의 문서를 걸러냄 (임베딩했다가 바로 삭제하지 않도록)
+    def without_expired(self, documents: list) -> list:
+        names = set(self.partitions()) | {partition_name(doc.metadata) for doc in documents}
+        active = set(select_active_partitions(sorted(names), self.retention_quarters))
+        kept = [doc for doc in documents if partition_name(doc.metadata) in active]
+        if len(kept) < len(documents):
+            print(f"  만료된 분기의 조각 {len(documents) - len(kept)}개는 저장하지 않습니다.")
+        return kept
+
+    # 만료된 파티션과 비어 있는 파티션을 삭제하고, 삭제한 파티션 이름 목록 반환
+    def drop_expired(self) -> list:
+        names = self.partitions()
+        active = set(select_active_partitions(names, self.retention_quarters))
+        dropped = []
+        for name in names:
+            if name in active and self._client.get_collection(name).count() > 0:
+                continue
+            self._client.delete_collection(name)
+            self._collections.pop(name, None)
+            dropped.append(name)
+        if dropped:
+            print(f"만료되었거나 비어 있는 파티션 삭제: {', '.join(dropped)}")
+        return dropped
+
+    # 예전 단일 컬렉션의 조각을 저장된 임베딩 그대로 파티션으로 옮기고 단일 컬렉션은 삭제 (다시 임베딩하지 않음)
+    def migrate_legacy(self) -> int:
+        if LEGACY_COLLECTION not in self._collection_names():
+            return 0
+        legacy = self._client.get_collection(LEGACY_COLLECTION)
+        data = legacy.get(include=["documents", "metadatas", "embeddings"])
+        groups = defaultdict(list)
+        for i, metadata in enumerate(data["metadatas"]):
+            groups[partition_name(metadata or {})].append(i)
+
+        for name, indexes in groups.items():
+            collection = self._client.get_or_create_collection(name)
+            for start in range(0, len(indexes), MIGRATE_BATCH_SIZE):
+                batch = indexes[start:start + MIGRATE_BATCH_SIZE]
+                collection.add(
+                    ids=[data["ids"][i] for i in batch],
+                    embeddings=[data["embeddings"][i] for i in batch],
+                    documents=[data["documents"][i] for i in batch],
+                    metadatas=[data["metadatas"][i] for i in batch],
+                )
+        self._client.delete_collection(LEGACY_COLLECTION)
+        print(f"단일 컬렉션의 조각 {len(data['ids'])}개를 파티션 {len(groups)}개로 옮겼습니다.")
+        return len(data["ids"])
+
+
+# 검색용 저장소: 파티션이 있으면 PartitionedPolicyStore, 예전 방식 DB면 단일 Chroma 컬렉션
+def open_policy_store(db_directory: str, embedding_function=None):
+    from langchain_community.vectorstores import Chroma
+
+    store = PartitionedPolicyStore(db_directory, embedding_function)
+    if store.partitions():
+        print(f"파티션 저장소 사용: 검색 대상 {len(store.active_partitions())}/{len(store.partitions())}개 파티션")
+        return store
+    return Chroma(persist_directory=db_directory, embedding_function=embedding_function)
+
+# 수집용 저장소: 기본은 파티션 저장소 (예전 단일 컬렉션이 있으면 먼저 옮김)
+# POLICY_PARTITIONED=0 이면 예전처럼 단일 컬렉션에 저장
+def open_policy_store_for_ingest(db_directory: str, embedding_function):
+    from langchain_community.vectorstores import Chroma
+
+    if os.getenv("POLICY_PARTITIONED", "1") == "0":
+        return Chroma(persist_directory=db_directory, embedding_function=embedding_function)
+    store = PartitionedPolicyStore(db_directory, embedding_function)
+    store.migrate_legacy()
+    return store
+
+# 수집이 끝난 뒤 호출 - 파티션 저장소면 만료된 파티션을 정리
+def compact_policy_store(db):
+    if isinstance(db, PartitionedPolicyStore):
+        db.drop_expired()
+
+
+# 실행: python -m policy_recommend.partitioned_store --migrate  (예전 DB를 파티션으로 변환)
+#       python -m policy_recommend.partitioned_store --compact  (만료된 파티션 삭제)
+def main():
+    parser = argparse.ArgumentParser(description="정책 ChromaDB 파티션(게시판 x 분기) 관리")
+    parser.add_argument("--db", default="./policy_chroma_db")
+    parser.add_argument("--migrate", action="store_true", help="단일 컬렉션을 파티션으로 옮김")
+    parser.add_argument("--compact", action="store_true", help="만료되었거나 비어 있는 파티션 삭제")
+    args = parser.parse_args()
+    load_env()
+
+    store = PartitionedPolicyStore(args.db)
+    if args.migrate:
+        store.migrate_legacy()
+    if args.compact:
+        store.drop_expired()
+
+    active = set(store.active_partitions())
+    for name in store.partitions():
+        count = store._client.get_collection(name).count()
+        print(f"{name}: 조각 {count}개{'' if name in active else ' (만료)'}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+import os
+import copy
+import time
+import threading
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_MAX_ENTRIES = 512
+DEFAULT_TTL_SECONDS = 60 * 60
+
+# 나이를 구간으로 묶어 비슷한 사용자끼리 같은 캐시 키를 쓰도록 함
+AGE_BUCKET_SIZE = 5
+# 자녀 나이 구간: 영아 / 유아 / 초등 / 중고등 / 성인
+CHILD_AGE_BUCKETS = [(0, 2, "영아"), (3, 6, "유아"), (7, 12, "초등"), (13, 18, "중고등")]
+
+def _age_from_birth_year(birth_year) -> int | None:
+    if birth_year is None:
+        return None
+    return datetime.now().year - int(birth_year)
+
+def bucket_age(age: int | None) -> str | None:
+    if age is None:
+        return None
+    low = (age // AGE_BUCKET_SIZE) * AGE_BUCKET_SIZE
+    return f"{low}-{low + AGE_BUCKET_SIZE - 1}"
+
+def bucket_child_age(age: int | None) -> str:
+    if age is None:
+        return "없음"
+    for low, high, label in CHILD_AGE_BUCKETS:
+        if low <= age <= high:
+            return label
+    return "성인"
+
+# ChromaDB SQLite 파일의 수정 시각/크기 - add_data_to_db.py 등으로 컬렉션이 바뀌면 값이 달라짐
+def get_db_version(db_directory: str) -> tuple | None:
+    try:
+        stat = os.stat(os.path.join(db_directory, "chroma.sqlite3"))
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_size)
+
+# 이름을 제외하고, 나이는 구간으로 묶은 정규화된 사용자 프로필 키
+def make_profile_key(user_profile: dict) -> tuple:
+    has_child = bool(user_profile.get("hasChildren")) and user_profile.get("childAge") is not None
+    child_age = _age_from_birth_year(user_profile.get("childAge")) if has_child else None
+    return (
+        str(user_profile.get("nationality", "")).strip().lower(),
+        bucket_age(_age_from_birth_year(user_profile.get("age"))),
+        str(user_profile.get("region", "")).strip(),
+        bucket_child_age(child_age),
+    )
+
+
+# 정책 추천 결과 캐시 (TTL + LRU). ChromaDB 파일이 바뀌면 전체 무효화
+# semantic_threshold를 지정하면 검색어 임베딩의 코사인 유사도로 거의 같은 프로필도 적중 처리 (2단계 캐시)
+class PolicyRecommendationCache:
+    def __init__(self, db_directory: str, max_entries: int = DEFAULT_MAX_ENTRIES,
+                 ttl_seconds: float = DEFAULT_TTL_SECONDS, semantic_threshold: float | None = None):
+        self.db_directory = db_directory
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.semantic_threshold = semantic_threshold
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db_version = self._current_db_version()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def semantic_enabled(self) -> bool:
+        return self.semantic_threshold is not None
+
+    def _current_db_version(self) -> tuple | None:
+        return get_db_version(self.db_directory)
+
+    def _check_db_version(self):
+        version = self._current_db_version()
+        if version != self._db_version:
+            if self._entries:
+                print("ChromaDB 변경 감지: 정책 추천 캐시를 비웁니다.")
+            self._entries.clear()
+            self._db_version = version
+
+    def _is_expired(self, entry: dict) -> bool:
+        return time.monotonic() - entry["created_at"] > self.ttl_seconds
+
+    def get(self, key: tuple) -> dict | None:
+        with self._lock:
+            self._check_db_version()
+            entry = self._entries.get(key)
+            if entry is None or self._is_expired(entry):
+                self._entries.pop(key, None)
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return copy.deepcopy(entry["value"])
+
+    # 같은 지역(검색 필터가 같은) 항목 중 검색어 임베딩이 충분히 비슷한 결과를 찾음
+    def find_similar(self, region: str, embedding) -> dict | None:
+        if not self.semantic_enabled or embedding is None:
+            return None
+        query = np.asarray(embedding, dtype=np.float32)
+        query = query / (np.linalg.norm(query) or 1.0)
+        with self._lock:
+            self._check_db_version()
+            best_key, best_score = None, self.semantic_threshold
+            for key, entry in self._entries.items():
+                if entry["region"] != region or entry["embedding"] is None or self._is_expired(entry):
+                    continue
+                score = float(np.dot(query, entry["embedding"]))
+                if score >= best_score:
+                    best_key, best_score = key, score
+            if best_key is None:
+                return None
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            return copy.deepcopy(self._entries[best_key]["value"])
+
+    # 결과를 저장 - 캐시 미스로 새로 생성한 결과일 때만 미스 횟수를 집계
+    def put(self, key: tuple, value: dict, region: str, embedding=None, record_miss: bool = True):
+        if embedding is not None:
+            embedding = np.asarray(embedding, dtype=np.float32)
+            embedding = embedding / (np.linalg.norm(embedding) or 1.0)
+        with self._lock:
+            self._check_db_version()
+            if record_miss:
+                self.misses += 1
+            self._entries[key] = {
+                "value": copy.deepcopy(value),
+                "region": region,
+                "embedding": embedding,
+                "created_at": time.monotonic(),
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+# 환경 변수로 캐시 설정을 읽어 생성
+# POLICY_CACHE_MAX_ENTRIES, POLICY_CACHE_TTL_SECONDS, POLICY_CACHE_SEMANTIC_THRESHOLD(비우면 2단계 캐시 비활성)
+def create_cache_from_env(db_directory: str) -> PolicyRecommendationCache:
+    threshold = os.getenv("POLICY_CACHE_SEMANTIC_THRESHOLD")
+    return PolicyRecommendationCache(
+        db_directory=db_directory,
+        max_entries=int(os.getenv("POLICY_CACHE_MAX_ENTRIES", DEFAULT_MAX_ENTRIES)),
+        ttl_seconds=float(os.getenv("POLICY_CACHE_TTL_SECONDS", DEFAULT_TTL_SECONDS)),
+        semantic_threshold=float(threshold) if threshold else None,
+    )
@@ -1,88 +1,25 @@
 import os
 import json
+import threading
 from datetime import datetime
-from dotenv import load_dotenv
-from langchain_openai import ChatOpenAI
-from langchain_community.embeddings import SentenceTransformerEmbeddings
-from langchain_community.vectorstores import Chroma
 from langchain_core.prompts import ChatPromptTemplate
-from langchain_core.runnables import RunnableParallel, RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
 
-# 검색된 문서(Document 객체)들을 하나의 깔끔한 문자열로 합치는 함수
-def format_docs(docs):
-    return "\n\n".join(f"정책 제목: {doc.metadata.get('title', '제목 없음')}\n내용: {doc.page_content}" for doc in docs)
+from core.concurrency import run_in_pool
+from core.metrics import record_cache, stage_timer, token_usage_callback
+from core.registry import registry
+from core.llm import create_chat_model
+from core.settings import load_env
+from policy_recommend.policy_cache import create_cache_from_env, make_profile_key
+from policy_recommend.cohort_index import CohortIndex, build_cohort_query
+from policy_recommend.context_packer import count_tokens, pack_context
+from policy_recommend.retriever import create_retriever
 
-def get_age(birth_year):
-    return datetime.now().year - birth_year
+DB_DIRECTORY = "./policy_chroma_db"
+# 추천 답변의 최대 생성 토큰 수 (POLICY_MAX_TOKENS로 조정)
+DEFAULT_MAX_TOKENS = 1024
 
-def get_policy_recommendations(user_profile: dict) -> dict:
-    load_dotenv()
-
-    try:
-        API_KEY = os.getenv("API_KEY")
-        MODEL_ID = os.getenv("MODEL_ID")
-        API_BASE = os.getenv("API_BASE")
-        if not API_KEY or not MODEL_ID or not API_BASE:
-            raise KeyError
-    except KeyError as e:
-        return {"error": str(e)}
-    
-    # 결과를 저장할 딕셔너리
-    result = {
-        "user_profile": user_profile,
-        "ai_recommendation": "",
-        "source_documents": [],
-        "timestamp": datetime.now().isoformat()
-    }
-
-    DB_DIRECTORY = "./policy_chroma_db"
-    if not os.path.exists(DB_DIRECTORY):
-        result["error"] = f"오류: '{DB_DIRECTORY}' 데이터베이스 폴더를 찾을 수 없습니다."
-        return result
-        
-    print("로컬 임베딩 모델을 로드합니다...")
-    embeddings = SentenceTransformerEmbeddings(
-        model_name="jhgan/ko-sbert-nli"
-    )
-    
-    db = Chroma(persist_directory=DB_DIRECTORY, embedding_function=embeddings)
-    print("\n2. ChromaDB 로드 완료!")
-
-    search_regions = ["전국", user_profile["region"]]
-    
-    metadata_filter = {
-        "region": {"$in": search_regions}
-    }
-    
-    base_query = (
-        f"{user_profile.get('name')}은/는 "
-        f"{user_profile.get('nationality')} 국적의 "
-        f"{get_age(user_profile.get('age'))}세 여성입니다. "
-        f"현재 {user_profile.get('region')}에 거주하고 있습니다."
-    )
-    if user_profile.get('hasChildren') and user_profile.get('childAge') is not None:
-        query_text = base_query + f" 만 {get_age(user_profile.get('childAge'))}세 자녀를 둔 어머니입니다."
-    else:
-        query_text = base_query + " 자녀는 없습니다."
-    
-    print(f"\n3. 생성된 AI 검색어: \"{query_text}\"")
-    print(f"   적용된 DB 필터: {metadata_filter}")
-    
-    # DB에서 필터와 검색어에 맞는 문서를 찾아오는 retriever 설정
-    retriever = db.as_retriever(
-        search_type="similarity",
-        search_kwargs={'k': 3, 'filter': metadata_filter}
-    )
-    
-    llm = ChatOpenAI(
-        model_name=MODEL_ID,
-        openai_api_key=API_KEY,
-        openai_api_base=API_BASE,
-        model_kwargs={"temperature": 0.5, "max_tokens": 1024}
-    )
-    
-    prompt = ChatPromptTemplate.from_template("""
+POLICY_PROMPT_TEMPLATE = """
     You are a kind and competent policy recommendation AI for the 'Dajeong' service.
     Based on the user's situation and the provided context, find the most helpful policies and list up to a maximum of 3 in order of recommendation.
 
@@ -107,27 +44,160 @@ def get_policy_recommendations(user_profile: dict) -> dict:
     [User Situation]
     {question}
 
-    [Personalized Policy Recommendation Based on Context]                                          
-                                            
-    """)
-    
-    rag_chain = RunnableParallel(
-        answer=(
-            {"context": retriever | format_docs, "question": RunnablePassthrough()}
-            | prompt
-            | llm
-            | StrOutputParser()
-        ),
-        source_documents=retriever, #  retriever를 통해 찾은 원본 문서를 그대로 반환
-    )
-    
-    print("\n4. RAG Chain 준비 완료. 이제 AI에게 정책 추천을 요청합니다...")
-
-    response = rag_chain.invoke(query_text)
-    
+    [Personalized Policy Recommendation Based on Context]
+
+    """
+
+# 검색된 문서(Document 객체)들을 하나의 깔끔한 문자열로 합치는 함수
+def format_docs(docs):
+    return "\n\n".join(f"정책 제목: {doc.metadata.get('title', '제목 없음')}\n내용: {doc.page_content}" for doc in docs)
+
+def get_age(birth_year):
+    return datetime.now().year - birth_year
+
+# 사용자 프로필로 AI 검색어 문장을 만드는 함수
+# 이름은 빼고 나이는 구간으로 묶은 정규화된 프로필로 만들어, 같은 집단은 미리 계산한 검색 결과를 재사용할 수 있게 함
+def build_query_text(user_profile: dict) -> str:
+    return build_cohort_query(make_profile_key(user_profile))
+
+
+# 검색기(임베딩 모델 + ChromaDB), 프롬프트, RAG 체인을 프로세스당 한 번만 로드해 재사용하는 검색 엔진
+# 검색기는 프로세스 안에 직접 로드하거나(LocalRetriever), 여러 워커가 공유하는 검색 서비스를 사용(RemoteRetriever)
+class PolicyRetrievalEngine:
+    def __init__(self, db_directory: str = DB_DIRECTORY):
+        self.db_directory = db_directory
+        self.retriever = None
+        self.answer_chain = None
+        self.pack_context = os.getenv("POLICY_CONTEXT_PACKING", "1") != "0"
+        self.cohort_index = None
+        self.ready = False
+
+    def load(self):
+        self.retriever = create_retriever(self.db_directory).load()
+
+        llm = create_chat_model(
+            "policy",
+            temperature=0.5,
+            max_tokens=int(os.getenv("POLICY_MAX_TOKENS", DEFAULT_MAX_TOKENS)),
+            callbacks=[token_usage_callback("policy")],
+        )
+        prompt = ChatPromptTemplate.from_template(POLICY_PROMPT_TEMPLATE)
+
+        # 입력: {"context": 압축된 컨텍스트, "question": 검색어}
+        self.answer_chain = prompt | llm | StrOutputParser()
+        print("RAG Chain 준비 완료!")
+
+        self.cohort_index = CohortIndex(self, self.db_directory)
+
+    def embed_query(self, query_text: str) -> list:
+        return self.retriever.embed_query(query_text)
+
+    def embed_documents(self, texts: list) -> list:
+        return self.retriever.embed_documents(texts)
+
+    def regions(self) -> list:
+        return self.retriever.regions()
+
+    # inputs: {"question": 검색어, "region": 지역, "embedding": 미리 계산한 검색어 임베딩 또는 None}
+    def retrieve(self, inputs: dict) -> list:
+        return self.retriever.search(inputs["question"], inputs["region"], inputs.get("embedding"))
+
+    # 첫 사용자 요청이 콜드 스타트 비용을 내지 않도록 임베딩 추론과 벡터 검색을 미리 한 번 실행
+    def warm_up(self):
+        print("검색 엔진 워밍업 중...")
+        self.retriever.warm_up()
+        self.ready = True
+        print("검색 엔진 워밍업 완료!")
+
+    # 검색은 한 번만 수행하고, 찾은 원본 문서를 답변 생성과 결과 반환에 함께 사용
+    def invoke(self, query_text: str, region: str, embedding=None) -> dict:
+        inputs = {"question": query_text, "region": region, "embedding": embedding}
+        return self.answer(query_text, self.retrieve(inputs))
+
+    # 비동기 실행 - CPU를 쓰는 임베딩/검색은 전용 스레드 풀에서, LLM 호출은 ainvoke로 처리
+    async def ainvoke(self, query_text: str, region: str, embedding=None) -> dict:
+        inputs = {"question": query_text, "region": region, "embedding": embedding}
+        source_documents = await run_in_pool("embedding", self.retrieve, inputs)
+        return await self.aanswer(query_text, source_documents)
+
+    # 검색된 문서를 토큰 예산 안으로 압축해 프롬프트 입력을 만듦 (POLICY_CONTEXT_PACKING=0 이면 원문 그대로)
+    def _answer_inputs(self, query_text: str, source_documents: list) -> dict:
+        inputs = {"question": query_text, "source_documents": source_documents}
+        if self.pack_context:
+            with stage_timer("policy_context_pack"):
+                inputs["context"], inputs["context_stats"] = pack_context(query_text, source_documents)
+        else:
+            inputs["context"] = format_docs(source_documents)
+            tokens = count_tokens(inputs["context"])
+            inputs["context_stats"] = {"original_tokens": tokens, "packed_tokens": tokens, "saved_tokens": 0, "saved_ratio": 0.0}
+        return inputs
+
+    # 이미 찾은 문서(예: 사용자 집단 인덱스)로 검색 없이 답변만 생성
+    def answer(self, query_text: str, source_documents: list) -> dict:
+        inputs = self._answer_inputs(query_text, source_documents)
+        with stage_timer("policy_llm"):
+            inputs["answer"] = self.answer_chain.invoke(inputs)
+        return inputs
+
+    async def aanswer(self, query_text: str, source_documents: list) -> dict:
+        inputs = self._answer_inputs(query_text, source_documents)
+        with stage_timer("policy_llm"):
+            inputs["answer"] = await self.answer_chain.ainvoke(inputs)
+        return inputs
+
+
+# 검색 엔진 생성: 모델/DB 로드, 워밍업, 사용자 집단 검색 인덱스 준비
+# (POLICY_COHORT_PRECOMPUTE=0 이면 미리 계산하지 않고 요청 시 검색한 결과만 저장)
+def _create_policy_engine() -> PolicyRetrievalEngine:
+    engine = PolicyRetrievalEngine()
+    engine.load()
+    engine.warm_up()
+    if os.getenv("POLICY_COHORT_PRECOMPUTE", "1") != "0":
+        threading.Thread(target=_build_cohort_index, args=(engine,), daemon=True).start()
+    else:
+        engine.cohort_index.reset()
+    return engine
+
+def _build_cohort_index(engine: PolicyRetrievalEngine):
+    try:
+        engine.cohort_index.ensure_built()
+    except Exception as e:
+        print(f"사용자 집단 검색 인덱스 생성 실패: {e}")
+
+registry.register("policy_engine", _create_policy_engine)
+
+# 프로세스 전역 검색 엔진을 반환 (처음 호출될 때 한 번만 로드)
+def get_policy_engine() -> PolicyRetrievalEngine:
+    return registry.get("policy_engine")
+
+_cache = None
+_cache_lock = threading.Lock()
+
+# 프로세스 전역 정책 추천 캐시 (설정은 .env의 POLICY_CACHE_* 값을 사용)
+def get_policy_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            load_env()
+            _cache = create_cache_from_env(DB_DIRECTORY)
+    return _cache
+
+def _new_result(user_profile: dict) -> dict:
+    # 결과를 저장할 딕셔너리
+    return {
+        "user_profile": user_profile,
+        "ai_recommendation": "",
+        "source_documents": [],
+        "context_stats": None,
+        "timestamp": datetime.now().isoformat()
+    }
+
+def _fill_result(result: dict, response: dict) -> dict:
     # AI 추천 결과 저장
     result["ai_recommendation"] = response["answer"]
-    
+    # 프롬프트 컨텍스트 압축으로 줄인 토큰 수
+    result["context_stats"] = response.get("context_stats")
+
     # 소스 문서 정보 저장
     for doc in response["source_documents"]:
         doc_info = {
@@ -137,10 +207,114 @@ def get_policy_recommendations(user_profile: dict) -> dict:
             "content": doc.page_content[:200] + "..." if len(doc.page_content) > 200 else doc.page_content  # 내용 미리보기
         }
         result["source_documents"].append(doc_info)
-    
+
     return result
 
+# 캐시에 저장하는 값은 프로필과 무관한 추천 결과, 출처 문서, 컨텍스트 압축 통계뿐
+# (통계가 없던 예전 캐시 항목은 context_stats가 None으로 반환됨)
+def _cache_value(result: dict) -> dict:
+    return {
+        "ai_recommendation": result["ai_recommendation"],
+        "source_documents": result["source_documents"],
+        "context_stats": result["context_stats"],
+    }
+
+# 추천 요청 하나의 캐시 확인, 사용자 집단 검색, 의미 캐시, 결과 저장 단계
+# 동기/비동기 버전은 검색 엔진 호출(invoke/ainvoke 등)만 다르고 나머지 단계는 이 클래스를 함께 사용
+class _RecommendationRequest:
+    def __init__(self, user_profile: dict):
+        self.result = _new_result(user_profile)
+        self.cache = get_policy_cache()
+        self.cache_key = make_profile_key(user_profile)
+        self.region = user_profile["region"]
+        self.query_text = build_query_text(user_profile)
+        self.embedding = None
+
+    def _cached_result(self, cached: dict, status: str) -> dict:
+        record_cache("policy", status)
+        return {**self.result, **cached, "cache": status}
+
+    # 같은 프로필의 추천 결과가 캐시에 있으면 반환
+    def cached(self) -> dict | None:
+        cached = self.cache.get(self.cache_key)
+        return None if cached is None else self._cached_result(cached, "hit")
+
+    def error(self, e: Exception) -> dict:
+        self.result["error"] = str(e)
+        return self.result
+
+    # 미리 계산한 사용자 집단 검색 결과 (있으면 임베딩/벡터 검색 없이 바로 답변 생성)
+    def cohort_docs(self, engine: PolicyRetrievalEngine) -> list | None:
+        print(f"\n생성된 AI 검색어: \"{self.query_text}\"")
+        print(f"   적용된 DB 필터: region in ['전국', '{self.region}']")
+        docs = engine.cohort_index.lookup(self.cache_key)
+        record_cache("policy_cohort", "miss" if docs is None else "hit")
+        return docs
+
+    # 검색어 임베딩이 비슷한 다른 프로필의 추천 결과가 있으면 이 프로필 키로도 저장하고 반환
+    def semantic_cached(self, embedding: list) -> dict | None:
+        self.embedding = embedding
+        cached = self.cache.find_similar(self.region, embedding)
+        if cached is None:
+            return None
+        self.cache.put(self.cache_key, cached, self.region, embedding, record_miss=False)
+        return self._cached_result(cached, "semantic_hit")
+
+    # 새로 검색한 문서는 사용자 집단 인덱스에도 저장 (cohort_docs로 답변한 경우에는 저장하지 않음)
+    def finish(self, response: dict, engine: PolicyRetrievalEngine | None = None) -> dict:
+        if engine is not None:
+            engine.cohort_index.add(self.cache_key, response["source_documents"])
+        _fill_result(self.result, response)
+        self.cache.put(self.cache_key, _cache_value(self.result), self.region, self.embedding)
+        record_cache("policy", "miss")
+        self.result["cache"] = "miss"
+        return self.result
+
+def get_policy_recommendations(user_profile: dict) -> dict:
+    request = _RecommendationRequest(user_profile)
+    cached = request.cached()
+    if cached is not None:
+        return cached
+
+    try:
+        engine = get_policy_engine()
+    except Exception as e:
+        return request.error(e)
+
+    cohort_docs = request.cohort_docs(engine)
+    if cohort_docs is not None:
+        return request.finish(engine.answer(request.query_text, cohort_docs))
+
+    if request.cache.semantic_enabled:
+        cached = request.semantic_cached(engine.embed_query(request.query_text))
+        if cached is not None:
+            return cached
+    return request.finish(engine.invoke(request.query_text, request.region, request.embedding), engine)
+
+# get_policy_recommendations의 비동기 버전 - 엔진 로드와 임베딩은 전용 스레드 풀에서, LLM 호출은 ainvoke로 처리
+async def aget_policy_recommendations(user_profile: dict) -> dict:
+    request = _RecommendationRequest(user_profile)
+    cached = request.cached()
+    if cached is not None:
+        return cached
+
+    try:
+        engine = await run_in_pool("embedding", get_policy_engine)
+    except Exception as e:
+        return request.error(e)
+
+    cohort_docs = request.cohort_docs(engine)
+    if cohort_docs is not None:
+        return request.finish(await engine.aanswer(request.query_text, cohort_docs))
+
+    if request.cache.semantic_enabled:
+        cached = request.semantic_cached(await run_in_pool("embedding", engine.embed_query, request.query_text))
+        if cached is not None:
+            return cached
+    return request.finish(await engine.ainvoke(request.query_text, request.region, request.embedding), engine)
+
 if __name__ == "__main__":
+    load_env()
     # 테스트할 가상 사용자 프로필 정의
     sample_user_profile = {
         "name": "린 응우엔",
@@ -152,4 +326,4 @@ if __name__ == "__main__":
         "childAge": 2020,
     }
     result = get_policy_recommendations(sample_user_profile)
-    print(json.dumps(result, ensure_ascii=False, indent=2))
\ No newline at end of file
+    print(json.dumps(result, ensure_ascii=False, indent=2))
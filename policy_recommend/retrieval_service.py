@@ -0,0 +1,246 @@
+import os
+import time
+import asyncio
+import argparse
+from collections import Counter
+from contextlib import asynccontextmanager
+from typing import List, Optional
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, PlainTextResponse
+from pydantic import BaseModel
+
+from core.concurrency import run_in_pool, shutdown_pools
+from core.metrics import render_metrics
+from core.settings import load_env
+from policy_recommend.policy_cache import get_db_version
+from policy_recommend.retriever import LocalRetriever, serialize_documents
+
+DB_DIRECTORY = "./policy_chroma_db"
+DEFAULT_SOCKET_PATH = "/tmp/dajeong-retrieval.sock"
+
+
+# 여러 API 워커에서 동시에 들어온 임베딩 요청을 짧은 시간 모아 한 번의 배치 추론으로 처리
+# RETRIEVAL_BATCH_WINDOW_MS 동안 기다리거나 RETRIEVAL_BATCH_MAX_SIZE개가 모이면 실행
+class EmbeddingBatcher:
+    def __init__(self, embed_documents):
+        self.embed_documents = embed_documents
+        self.window = int(os.getenv("RETRIEVAL_BATCH_WINDOW_MS", "10")) / 1000
+        self.max_size = int(os.getenv("RETRIEVAL_BATCH_MAX_SIZE", "64"))
+        self._queue = None
+        self._worker = None
+
+    def start(self):
+        self._queue = asyncio.Queue()
+        self._worker = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._worker is not None:
+            self._worker.cancel()
+            try:
+                await self._worker
+            except asyncio.CancelledError:
+                pass
+
+    async def embed(self, texts: list) -> list:
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((texts, future))
+        return await future
+
+    async def _collect(self) -> list:
+        items = [await self._queue.get()]
+        size = len(items[0][0])
+        deadline = asyncio.get_running_loop().time() + self.window
+        while size < self.max_size:
+            timeout = deadline - asyncio.get_running_loop().time()
+            if timeout <= 0:
+                break
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout)
+            except asyncio.TimeoutError:
+                break
+            items.append(item)
+            size += len(item[0])
+        return items
+
+    async def _run(self):
+        while True:
+            items = await self._collect()
+            texts = [text for item_texts, _ in items for text in item_texts]
+            try:
+                vectors = await run_in_pool("embedding", self.embed_documents, texts)
+            except Exception as e:
+                for _, future in items:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            offset = 0
+            for item_texts, future in items:
+                if not future.done():
+                    future.set_result(vectors[offset:offset + len(item_texts)])
+                offset += len(item_texts)
+
+
+# 현재 검색 인덱스(LocalRetriever)를 들고 있다가, ChromaDB가 바뀌면 새 인덱스를 따로 로드한 뒤 한 번에 교체 (임베딩 모델은 재사용)
+# 교체 중에도 진행 중인 검색은 기존 인덱스로 끝까지 처리되고, API 서버는 재시작할 필요가 없음
+# 교체된 인덱스는 진행 중인 검색이 모두 끝나면 닫아 ChromaDB 시스템(SQLite 연결)이 쌓이지 않도록 함
+class RetrievalIndexHolder:
+    def __init__(self, db_directory: str):
+        self.db_directory = db_directory
+        self.current = None
+        self.loaded_at = None
+        self.reloads = 0
+        self._reload_lock = asyncio.Lock()
+        self._last_seen_version = None
+        # 인덱스별 진행 중인 검색 수, 교체됐지만 아직 검색 중이라 닫지 못한 인덱스
+        self._in_use = Counter()
+        self._retired = set()
+
+    # 검색 한 번 동안 현재 인덱스를 사용 (이벤트 루프에서만 호출)
+    @asynccontextmanager
+    async def use(self):
+        retriever = self.current
+        self._in_use[retriever] += 1
+        try:
+            yield retriever
+        finally:
+            self._in_use[retriever] -= 1
+            if self._in_use[retriever] <= 0:
+                del self._in_use[retriever]
+                if retriever in self._retired:
+                    self._retired.discard(retriever)
+                    await run_in_pool("embedding", retriever.close)
+
+    async def _retire(self, retriever: LocalRetriever):
+        if retriever in self._in_use:
+            self._retired.add(retriever)
+        else:
+            await run_in_pool("embedding", retriever.close)
+
+    # 같은 경로의 ChromaDB 클라이언트는 프로세스 안에서 시스템(세그먼트 캐시)을 공유하므로, 캐시를 비워야 새 클라이언트가 바뀐 파일을 다시 읽음
+    # 기존 클라이언트는 자기 시스템을 그대로 들고 있어 교체 전까지 진행 중인 검색에는 영향이 없음
+    # 임베딩 모델은 DB와 무관하므로 기존 인덱스의 것을 그대로 사용
+    def _load(self) -> LocalRetriever:
+        from chromadb.api.client import SharedSystemClient
+
+        SharedSystemClient.clear_system_cache()
+        embeddings = self.current.embeddings if self.current is not None else None
+        retriever = LocalRetriever(self.db_directory).load(embeddings)
+        retriever.warm_up()
+        return retriever
+
+    async def reload(self) -> bool:
+        async with self._reload_lock:
+            version = get_db_version(self.db_directory)
+            if self.current is not None and self.current.db_version == version:
+                return False
+            print(f"검색 인덱스 로드 중... (db_version={version})")
+            retriever = await run_in_pool("embedding", self._load)
+            previous, self.current = self.current, retriever
+            self.loaded_at = time.time()
+            self.reloads += 1
+            print(f"검색 인덱스 교체 완료! (db_version={retriever.db_version})")
+            if previous is not None:
+                await self._retire(previous)
+            return True
+
+    # 수집 스크립트가 쓰는 도중에 다시 로드하지 않도록, 두 번 연속 같은 버전이 확인됐을 때만 교체
+    async def watch(self, interval: float):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                version = get_db_version(self.db_directory)
+                if version != self.current.db_version and version == self._last_seen_version:
+                    await self.reload()
+                self._last_seen_version = version
+            except Exception as e:
+                print(f"검색 인덱스 갱신 실패: {e}")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 인덱스 경로와 배치 설정은 .env를 읽은 뒤에 생성
+    load_env()
+    index = RetrievalIndexHolder(os.getenv("RETRIEVAL_DB_DIRECTORY", DB_DIRECTORY))
+    batcher = EmbeddingBatcher(lambda texts: index.current.embed_documents(texts))
+    app.state.index, app.state.batcher = index, batcher
+    await index.reload()
+    batcher.start()
+    watcher = asyncio.create_task(index.watch(float(os.getenv("RETRIEVAL_RELOAD_INTERVAL_SECONDS", "5"))))
+    yield
+    watcher.cancel()
+    await batcher.stop()
+    shutdown_pools()
+
+app = FastAPI(lifespan=lifespan)
+
+class EmbedInput(BaseModel):
+    texts: List[str]
+
+class SearchInput(BaseModel):
+    question: str
+    region: str
+    embedding: Optional[List[float]] = None
+
+@app.post("/embed")
+async def embed(request: EmbedInput):
+    return {"embeddings": await app.state.batcher.embed(request.texts)}
+
+@app.post("/search")
+async def search(request: SearchInput):
+    embedding = request.embedding
+    if embedding is None:
+        embedding = (await app.state.batcher.embed([request.question]))[0]
+    async with app.state.index.use() as retriever:
+        docs = await run_in_pool("embedding", retriever.search, request.question, request.region, embedding)
+    return {"documents": serialize_documents(docs), "db_version": list(retriever.db_version or [])}
+
+@app.get("/regions")
+async def regions():
+    async with app.state.index.use() as retriever:
+        return {"regions": await run_in_pool("embedding", retriever.regions)}
+
+@app.post("/reload")
+# 수집이 끝난 뒤 바로 새 인덱스로 교체하고 싶을 때 호출 (주기적 확인을 기다리지 않음)
+async def reload():
+    index = app.state.index
+    reloaded = await index.reload()
+    return {"reloaded": reloaded, "db_version": list(index.current.db_version or [])}
+
+@app.get("/health")
+def health():
+    index = getattr(app.state, "index", None)
+    if index is None or index.current is None:
+        return JSONResponse(status_code=503, content={"status": "loading"})
+    return {
+        "status": "ready",
+        "db_version": list(index.current.db_version or []),
+        "loaded_at": index.loaded_at,
+        "reloads": index.reloads,
+    }
+
+@app.get("/metrics")
+def metrics():
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4")
+
+
+# 실행: python -m policy_recommend.retrieval_service --socket /tmp/dajeong-retrieval.sock
+# API 워커는 RETRIEVAL_SERVICE_SOCKET=/tmp/dajeong-retrieval.sock (또는 RETRIEVAL_SERVICE_URL)로 이 서비스를 사용
+def main():
+    parser = argparse.ArgumentParser(description="여러 API 워커가 공유하는 정책 검색 서비스 (임베딩 + 벡터/BM25 검색)")
+    parser.add_argument("--socket", default=None, help=f"Unix 소켓 경로 (예: {DEFAULT_SOCKET_PATH})")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    args = parser.parse_args()
+    load_env()
+
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.remove(args.socket)
+        uvicorn.run(app, uds=args.socket)
+    else:
+        uvicorn.run(app, host=args.host, port=args.port)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+import os
+import threading
+
+from core.embeddings import get_embeddings
+from core.metrics import stage_timer
+from policy_recommend.cohort_index import _dict_to_doc, _doc_to_dict
+from policy_recommend.hybrid_retriever import fuse_results, load_or_build_bm25_index
+from policy_recommend.partitioned_store import open_policy_store
+from policy_recommend.policy_cache import get_db_version
+
+SEARCH_K = 3
+# 하이브리드 검색에서 벡터/BM25 각각 가져오는 후보 수 (최종 결과는 SEARCH_K개)
+CANDIDATE_K = 10
+DEFAULT_SERVICE_TIMEOUT = 30
+
+
+# 현재 프로세스에 임베딩 모델과 ChromaDB를 직접 로드해 검색
+# 공유 검색 서비스(retrieval_service.py)도 내부적으로 이 클래스를 사용
+class LocalRetriever:
+    def __init__(self, db_directory: str):
+        self.db_directory = db_directory
+        self.embeddings = None
+        self.db = None
+        self.bm25_index = None
+        self.db_version = None
+        self._bm25_refreshing = False
+
+    # embeddings를 넘기면 이미 로드한 임베딩 모델을 그대로 사용 (인덱스를 다시 로드할 때 모델을 한 벌 더 올리지 않도록)
+    def load(self, embeddings=None):
+        if not os.path.exists(self.db_directory):
+            raise RuntimeError(f"오류: '{self.db_directory}' 데이터베이스 폴더를 찾을 수 없습니다.")
+
+        self.db_version = get_db_version(self.db_directory)
+        # EMBEDDING_BACKEND=onnx 이면 torch 대신 int8 양자화 ONNX 모델 사용
+        self.embeddings = embeddings or get_embeddings()
+
+        # 게시판 x 분기 파티션으로 나뉜 DB면 만료되지 않은 파티션에만 검색 (예전 단일 컬렉션 DB도 그대로 사용 가능)
+        self.db = open_policy_store(self.db_directory, self.embeddings)
+        print("ChromaDB 로드 완료!")
+
+        # 벡터 검색 + BM25 어휘 검색 하이브리드 (POLICY_HYBRID_SEARCH=0 이면 벡터 검색만 사용)
+        if os.getenv("POLICY_HYBRID_SEARCH", "1") != "0":
+            self.bm25_index = load_or_build_bm25_index(self.db, self.db_directory)
+        return self
+
+    # 첫 요청이 콜드 스타트 비용을 내지 않도록 임베딩 추론과 벡터 검색을 미리 한 번 실행
+    def warm_up(self):
+        self.db.similarity_search("다문화가족 지원 정책", k=1)
+
+    # ChromaDB 시스템(SQLite 연결, 세그먼트 캐시)을 정리 - 검색 서비스가 인덱스를 교체한 뒤 예전 인덱스에 호출
+    # 임베딩 모델은 새 인덱스와 함께 쓰므로 그대로 둠
+    def close(self):
+        system = getattr(getattr(self.db, "_client", None), "_system", None)
+        if system is not None:
+            system.stop()
+        self.db = None
+        self.bm25_index = None
+
+    def embed_query(self, query_text: str) -> list:
+        with stage_timer("policy_embedding"):
+            return self.embeddings.embed_query(query_text)
+
+    def embed_documents(self, texts: list) -> list:
+        with stage_timer("policy_embedding_batch"):
+            return self.embeddings.embed_documents(texts)
+
+    # DB에 있는 지역 목록 ('전국' 제외)
+    def regions(self) -> list:
+        metadatas = self.db.get(include=["metadatas"])["metadatas"]
+        return sorted({m.get("region") for m in metadatas if m.get("region") and m.get("region") != "전국"})
+
+    # 임베딩 추론과 벡터 검색 시간을 따로 측정하기 위해 검색어 임베딩을 직접 계산한 뒤 벡터로 검색
+    def _vector_search(self, question: str, embedding, k: int, metadata_filter: dict) -> list:
+        if embedding is None:
+            embedding = self.embed_query(question)
+        with stage_timer("policy_vector_search"):
+            return self.db.similarity_search_by_vector(embedding, k=k, filter=metadata_filter)
+
+    # 사용자 지역과 '전국' 정책만 대상으로 검색 (미리 계산한 검색어 임베딩이 있으면 재사용)
+    # 하이브리드 모드에서는 벡터 검색과 BM25 결과를 RRF로 합치고, 같은 정책의 중복 조각을 제거해 SEARCH_K개만 반환
+    def search(self, question: str, region: str, embedding=None) -> list:
+        regions = ["전국", region]
+        metadata_filter = {"region": {"$in": regions}}
+        if self.bm25_index is None:
+            return self._vector_search(question, embedding, SEARCH_K, metadata_filter)
+
+        self._refresh_bm25_if_stale()
+        vector_docs = self._vector_search(question, embedding, CANDIDATE_K, metadata_filter)
+        with stage_timer("policy_lexical_search"):
+            lexical_docs = self.bm25_index.search(question, CANDIDATE_K, regions)
+        return fuse_results([vector_docs, lexical_docs], SEARCH_K)
+
+    # ChromaDB가 바뀌었으면 BM25 색인을 백그라운드에서 다시 만들고, 그동안은 기존 색인을 사용
+    def _refresh_bm25_if_stale(self):
+        if self._bm25_refreshing or self.bm25_index.db_version == get_db_version(self.db_directory):
+            return
+        self._bm25_refreshing = True
+
+        def run():
+            try:
+                self.bm25_index = load_or_build_bm25_index(self.db, self.db_directory)
+            except Exception as e:
+                print(f"BM25 색인 갱신 실패: {e}")
+            finally:
+                self._bm25_refreshing = False
+
+        threading.Thread(target=run, daemon=True).start()
+
+
+# 여러 API 워커가 함께 쓰는 검색 서비스(retrieval_service.py)에 HTTP로 요청
+# 워커마다 임베딩 모델과 ChromaDB를 따로 로드하지 않아 메모리를 아끼고, SQLite 파일도 서비스 한 곳에서만 읽음
+class RemoteRetriever:
+    def __init__(self, url: str | None = None, socket_path: str | None = None):
+        import httpx
+
+        timeout = float(os.getenv("RETRIEVAL_SERVICE_TIMEOUT", DEFAULT_SERVICE_TIMEOUT))
+        transport = httpx.HTTPTransport(uds=socket_path) if socket_path else None
+        self._client = httpx.Client(base_url=url or "http://retrieval", transport=transport, timeout=timeout)
+
+    def _post(self, path: str, payload: dict) -> dict:
+        response = self._client.post(path, json=payload)
+        response.raise_for_status()
+        return response.json()
+
+    def load(self):
+        response = self._client.get("/health")
+        response.raise_for_status()
+        print(f"공유 검색 서비스 연결 완료! ({response.json()})")
+        return self
+
+    def warm_up(self):
+        pass
+
+    def embed_query(self, query_text: str) -> list:
+        with stage_timer("policy_embedding"):
+            return self._post("/embed", {"texts": [query_text]})["embeddings"][0]
+
+    def embed_documents(self, texts: list) -> list:
+        with stage_timer("policy_embedding_batch"):
+            return self._post("/embed", {"texts": texts})["embeddings"]
+
+    def regions(self) -> list:
+        response = self._client.get("/regions")
+        response.raise_for_status()
+        return response.json()["regions"]
+
+    def search(self, question: str, region: str, embedding=None) -> list:
+        with stage_timer("policy_remote_search"):
+            data = self._post("/search", {"question": question, "region": region, "embedding": embedding})
+        return [_dict_to_doc(doc) for doc in data["documents"]]
+
+    def reload(self) -> dict:
+        return self._post("/reload", {})
+
+
+# RETRIEVAL_SERVICE_SOCKET(Unix 소켓 경로) 또는 RETRIEVAL_SERVICE_URL이 있으면 공유 검색 서비스를, 없으면 프로세스 내 검색을 사용
+def create_retriever(db_directory: str):
+    socket_path = os.getenv("RETRIEVAL_SERVICE_SOCKET")
+    url = os.getenv("RETRIEVAL_SERVICE_URL")
+    if socket_path or url:
+        return RemoteRetriever(url=url, socket_path=socket_path)
+    return LocalRetriever(db_directory)
+
+def serialize_documents(docs: list) -> list:
+    return [_doc_to_dict(doc) for doc in docs]
+
+# 수집이 끝난 뒤 공유 검색 서비스가 있으면 새 인덱스로 바로 교체하도록 요청 (없으면 아무것도 하지 않음)
+def notify_index_updated(db_directory: str):
+    retriever = create_retriever(db_directory)
+    if not isinstance(retriever, RemoteRetriever):
+        return
+    try:
+        print(f"공유 검색 서비스 인덱스 교체 요청: {retriever.reload()}")
+    except Exception as e:
+        print(f"공유 검색 서비스에 교체를 요청하지 못했습니다 (주기적 확인으로 반영됨): {e}")
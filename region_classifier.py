@@ -0,0 +1,182 @@
+import os
+import re
+import json
+import hashlib
+import threading
+
+NATIONWIDE = "전국"
+
+# 지명 사전이나 분류 규칙을 바꾸면 값을 올림 - 예전 규칙으로 분류해 캐시/체크포인트에 저장한 결과는 무시됨
+GAZETTEER_VERSION = 3
+
+# 지역 묶음별 광역 지명 (시/도 이름) - 단어 앞부분만 확인 (예: 서울특별시, 전남도청)
+# '경상', '충청', '전라'는 '경상비'처럼 일반 단어와 겹치므로 도/남/북이 붙은 경우만 사용
+REGION_GAZETTEER = {
+    "수도권": ["서울", "인천", "경기도"],
+    "충청도": ["대전", "세종시", "세종특별자치시", "충남", "충북", "충청도", "충청남", "충청북"],
+    "경상도": ["부산", "대구광역시", "대구시", "울산", "경북", "경남", "경상도", "경상남", "경상북"],
+    "전라도": ["광주광역시", "전남", "전북", "전라도", "전라남", "전라북"],
+    "강원도": ["강원"],
+    "제주도": ["제주"],
+}
+
+# 시/군/구 이름은 '예산(budget)', '음성 통역', '상주 시간'처럼 일반 단어와 겹치는 경우가 많아
+# 실제 행정구역 접미사(시/군/구)까지 포함한 이름으로만 찾고, 뒤에 단어 경계가 있어야 지명으로 봄
+LOCAL_GAZETTEER = {
+    "수도권": [
+        "수원시", "성남시", "고양시", "용인시", "부천시", "안산시", "안양시", "남양주시", "화성시", "평택시", "의정부시",
+        "시흥시", "파주시", "김포시", "광명시", "하남시", "오산시", "군포시", "이천시", "안성시", "구리시", "포천시", "양주시",
+        "동두천시", "과천시", "가평군", "연천군", "양평군",
+        "종로구", "용산구", "성동구", "광진구", "동대문구", "중랑구", "성북구", "도봉구", "노원구", "은평구",
+        "서대문구", "마포구", "양천구", "구로구", "금천구", "영등포구", "동작구", "관악구", "서초구", "강남구", "송파구", "강동구",
+        "부평구", "계양구", "연수구", "남동구", "미추홀구", "강화군", "옹진군",
+    ],
+    "충청도": [
+        "천안시", "청주시", "충주시", "제천시", "아산시", "공주시", "논산시", "보령시", "서산시", "당진시", "계룡시",
+        "홍성군", "예산군", "음성군", "진천군", "옥천군", "영동군", "괴산군", "단양군", "유성구", "대덕구",
+    ],
+    "경상도": [
+        "포항시", "경주시", "구미시", "안동시", "김천시", "영주시", "영천시", "상주시", "문경시", "경산시", "칠곡군",
+        "창원시", "김해시", "진주시", "거제시", "양산시", "통영시", "사천시", "밀양시", "거창군", "합천군",
+        "해운대구", "수영구", "사하구", "금정구", "연제구", "기장군", "부산진구", "수성구", "달서구", "달성군", "울주군",
+    ],
+    "전라도": [
+        "전주시", "익산시", "군산시", "정읍시", "남원시", "김제시", "목포시", "여수시", "순천시", "나주시", "광양시",
+        "무안군", "해남군", "완도군",
+    ],
+    "강원도": ["춘천시", "원주시", "강릉시", "동해시", "속초시", "삼척시", "태백시", "홍천군", "횡성군", "평창군", "정선군", "철원군"],
+    "제주도": ["서귀포시"],
+}
+
+# 여러 지역에 같은 이름이 있어 단독으로는 판단할 수 없는 지명 (예: 광주광역시 vs 경기도 광주시)
+AMBIGUOUS_NAMES = ["광주", "고성", "중구", "동구", "서구", "남구", "북구", "강서구"]
+
+# 지명이 들어 있지만 지역과 무관한 표현 - 점수 계산 전에 제거
+FALSE_POSITIVE_PHRASES = ["세종학당", "세종대왕", "운동경기", "전주 대비", "전남편", "부산물", "대전환"]
+
+# 시/군/구 이름 바로 뒤에 올 수 있는 것: 공백·문장부호·끝, 조사, 기관/주민을 뜻하는 말 (예: 상주시에서, 예산군청, 원주시민)
+# '상주시간'처럼 다른 글자가 이어지면 지명으로 보지 않음
+LOCAL_NAME_END = (
+    r"(?=$|[^가-힣]"
+    r"|(?:에서|으로|까지|부터|은|는|이|가|을|를|에|의|와|과|로|도|만)(?![가-힣])"
+    r"|청|민|립|의회|보건소|가족센터|가족지원센터|다문화|지역)"
+)
+
+# 지명 앞에 다른 한글이 붙어 있으면 다른 단어의 일부로 봄 (예: '전라'는 '완전라이브'에서 찾지 않음)
+def _name_pattern(names: list, end: str = "") -> re.Pattern:
+    alternatives = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+    return re.compile(rf"(?<![가-힣])(?:{alternatives}){end}")
+
+REGION_PATTERNS = {
+    region: (_name_pattern(REGION_GAZETTEER[region]), _name_pattern(LOCAL_GAZETTEER[region], LOCAL_NAME_END))
+    for region in REGION_GAZETTEER
+}
+
+# 사전에 없는 시/군/구 기관이 언급된 경우를 감지 (예: "OO군가족센터")
+LOCAL_AGENCY_PATTERN = re.compile(r"[가-힣]{1,4}(시|군|구)\s?(가족센터|가족지원센터|다문화|청|의회|보건소)")
+
+# 제목에 나온 지명은 본문보다 가중치를 높게 줌
+TITLE_WEIGHT = 3
+# 본문에 한 번만 나온 지명처럼 근거가 약하면(이 점수 미만) 규칙으로 확정하지 않고 LLM에 맡김
+MIN_CONFIDENT_SCORE = 2
+# 1위 지역 점수가 2위의 몇 배 이상이면 1위 지역으로 확정
+DOMINANCE_RATIO = 3
+# 이 개수 이상의 지역이 언급되면 '여러 지역' 공고로 보고 전국으로 분류
+MULTI_REGION_COUNT = 3
+BODY_SCAN_CHARS = 1500
+
+def _score_text(text: str, weight: int, scores: dict):
+    for region, patterns in REGION_PATTERNS.items():
+        hits = sum(len(pattern.findall(text)) for pattern in patterns)
+        if hits:
+            scores[region] = scores.get(region, 0) + hits * weight
+
+# 지명 사전으로 지역을 분류. 확신할 수 없으면 None을 반환 (이때만 LLM을 호출)
+def classify_region(title: str, body: str) -> str | None:
+    body = body[:BODY_SCAN_CHARS]
+    for phrase in FALSE_POSITIVE_PHRASES:
+        title = title.replace(phrase, "")
+        body = body.replace(phrase, "")
+    scores = {}
+    _score_text(title, TITLE_WEIGHT, scores)
+    _score_text(body, 1, scores)
+    full_text = title + "\n" + body
+    has_ambiguous = any(name in full_text.replace("광주광역시", "") for name in AMBIGUOUS_NAMES)
+
+    if not scores:
+        if has_ambiguous or LOCAL_AGENCY_PATTERN.search(full_text):
+            return None
+        return NATIONWIDE
+
+    if len(scores) >= MULTI_REGION_COUNT:
+        return NATIONWIDE
+
+    ranked = sorted(scores.items(), key=lambda item: item[1], reverse=True)
+    top_region, top_score = ranked[0]
+    if len(ranked) == 1:
+        # 지역 하나만 언급됐더라도 본문에 한 번만 나왔거나, 이름이 겹치는 지명이 함께 나오고 근거가 약하면 LLM에 맡김
+        if top_score < MIN_CONFIDENT_SCORE or (has_ambiguous and top_score < TITLE_WEIGHT):
+            return None
+        return top_region
+
+    if top_score >= ranked[1][1] * DOMINANCE_RATIO:
+        return top_region
+    return None
+
+# LLM 답변(지역 이름)을 7개 지역 묶음 중 하나로 변환
+def normalize_region_name(region: str) -> str:
+    if "서울" in region or "인천" in region or "경기" in region:
+        return "수도권"
+
+    elif "대전" in region or "세종" in region or "충남" in region or "충북" in region:
+        return "충청도"
+
+    elif "부산" in region or "대구" in region or "울산" in region or "경북" in region or "경남" in region:
+        return "경상도"
+
+    elif "광주" in region or "전남" in region or "전북" in region:
+        return "전라도"
+
+    elif "강원" in region:
+        return "강원도"
+
+    elif "제주" in region:
+        return "제주도"
+
+    else:
+        return NATIONWIDE
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+# 본문 해시 -> 지역 분류 결과를 디스크에 기록해 재수집 시 분류를 다시 하지 않도록 하는 캐시
+# 한 줄에 {"hash": ..., "region": ..., "method": "rule" | "llm", "gazetteer": 지명 사전 버전} 형태로 추가 기록
+class RegionCache:
+    def __init__(self, path: str):
+        self.path = path
+        self._regions = {}
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    # 예전 지명 사전으로 분류한 규칙 결과는 다시 분류 (LLM 결과는 그대로 사용)
+                    if record.get("method") == "rule" and record.get("gazetteer") != GAZETTEER_VERSION:
+                        continue
+                    self._regions[record["hash"]] = record["region"]
+
+    def get(self, key: str) -> str | None:
+        with self._lock:
+            return self._regions.get(key)
+
+    def put(self, key: str, region: str, method: str):
+        with self._lock:
+            self._regions[key] = region
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                record = {"hash": key, "region": region, "method": method, "gazetteer": GAZETTEER_VERSION}
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")